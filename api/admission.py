@@ -0,0 +1,163 @@
+# api/admission.py - Bounded inference executor with admission control
+# Inference runs on a fixed-size thread pool instead of the event loop, so a slow model
+# call can't stall other connections (including /health). When the estimated queueing
+# delay exceeds the latency budget, new work is rejected immediately instead of piling up.
+
+import math
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("api.admission")
+
+class Overloaded(Exception):
+    """
+    Raised when a request is shed. `retry_after` is a hint in whole seconds.
+    """
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+def _timed(fn, *args):
+    """
+    Runs on an executor thread. Returns (result, exception, elapsed ms) so the caller
+    can record the timing on the event loop thread whether or not `fn` raised.
+    """
+    start = time.perf_counter()
+    try:
+        result, error = fn(*args), None
+    except Exception as e:
+        result, error = None, e
+    return result, error, (time.perf_counter() - start) * 1000
+
+class AdmissionController:
+    """
+    Tracks work in flight (queued or running) and estimates how long a new request
+    would wait for the inference executor.
+
+    Requests take one of two lanes:
+    - direct: the request makes its own executor call (/predict without micro-batching,
+      /predict/batch). Direct calls run max_concurrency wide, so a new one waits about
+      (executor time already queued) / max_concurrency.
+    - batched: the request joins the micro-batcher (api/batching.py), which makes one
+      executor call per `max_batch_size` rows, one batch at a time. A new row waits for
+      the batches queued ahead of it, one after another.
+
+    Executor time is tracked per row for direct calls and per call for batches, since a
+    batch costs far less per row than the same rows scored one call each.
+
+    A request is rejected when more than max_concurrency + max_queue executor calls are
+    in flight (queued batched rows count as the batches they will make up), or when its
+    estimated wait exceeds latency_budget_ms. All bookkeeping happens on the event loop
+    thread, so it needs no locking.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 64, latency_budget_ms: float = 250.0,
+                 max_batch_size: int = 1):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.latency_budget_ms = latency_budget_ms
+        self.max_batch_size = max(max_batch_size, 1)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="inference")
+
+        self.in_flight = 0          # requests, both lanes
+        self.direct_in_flight = 0   # direct requests (one executor call each)
+        self.direct_rows = 0
+        self.batched_rows = 0
+        self.service_ms = 1.0  # EWMA of direct executor call time per row
+        self.batch_ms = 1.0    # EWMA of micro-batch executor call time
+        self.admitted = 0
+        self.rejected = 0
+
+    def pending_batches(self) -> int:
+        return math.ceil(self.batched_rows / self.max_batch_size)
+
+    def executor_calls(self) -> int:
+        """
+        Executor calls in flight or still to be made for the requests admitted so far.
+        """
+        return self.direct_in_flight + self.pending_batches()
+
+    def estimated_wait_ms(self, batched: bool = False) -> float:
+        if batched:
+            # Batches run one after another; a new row lands in the last one
+            return math.ceil((self.batched_rows + 1) / self.max_batch_size) * self.batch_ms
+        work_ms = self.direct_rows * self.service_ms + self.pending_batches() * self.batch_ms
+        return work_ms / self.max_concurrency
+
+    @asynccontextmanager
+    async def slot(self, rows: int = 1, batched: bool = False):
+        """
+        Admit a request of `rows` rows for the duration of a `with` block, or raise
+        Overloaded. `batched` requests are scored through the micro-batcher.
+        """
+        calls = self.executor_calls()
+        if calls >= self.max_concurrency + self.max_queue:
+            self._reject(f"{calls} executor calls in flight", batched)
+        wait_ms = self.estimated_wait_ms(batched)
+        if wait_ms > self.latency_budget_ms:
+            self._reject(f"estimated wait {wait_ms:.0f}ms exceeds budget {self.latency_budget_ms:.0f}ms", batched)
+
+        self.in_flight += 1
+        if batched:
+            self.batched_rows += rows
+        else:
+            self.direct_in_flight += 1
+            self.direct_rows += rows
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            if batched:
+                self.batched_rows -= rows
+            else:
+                self.direct_in_flight -= 1
+                self.direct_rows -= rows
+
+    def _reject(self, reason: str, batched: bool):
+        self.rejected += 1
+        retry_after = max(1, math.ceil(self.estimated_wait_ms(batched) / 1000))
+        if self.rejected % 100 == 1:
+            logger.warning(f"Shedding load ({self.rejected} rejected so far): {reason}")
+        raise Overloaded(reason, retry_after)
+
+    async def run(self, fn, *args, rows: int = 1, batched: bool = False):
+        """
+        Run a blocking function that scores `rows` rows on the inference executor.
+        `batched` marks a micro-batch call, timed per call rather than per row.
+        """
+        loop = asyncio.get_running_loop()
+        result, error, elapsed_ms = await loop.run_in_executor(self.executor, _timed, fn, *args)
+        # Back on the event loop thread: slow-moving averages so one outlier doesn't
+        # trigger shedding on its own
+        if batched:
+            self.batch_ms += 0.1 * (elapsed_ms - self.batch_ms)
+        else:
+            self.service_ms += 0.1 * (elapsed_ms / max(rows, 1) - self.service_ms)
+        if error is not None:
+            raise error
+        return result
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "latency_budget_ms": self.latency_budget_ms,
+            "max_batch_size": self.max_batch_size,
+            "in_flight": self.in_flight,
+            "direct_rows_in_flight": self.direct_rows,
+            "batched_rows_in_flight": self.batched_rows,
+            "executor_calls": self.executor_calls(),
+            "estimated_wait_ms": self.estimated_wait_ms(),
+            "estimated_batched_wait_ms": self.estimated_wait_ms(batched=True),
+            "avg_service_ms_per_row": self.service_ms,
+            "avg_batch_ms": self.batch_ms,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
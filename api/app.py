@@ -1,15 +1,30 @@
 import os
 import time
 import uuid
-import json
 import logging
+import functools
 import threading
-import pickle
+import select
+import numpy as np
 import pandas as pd
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
-import psycopg2
-from api.schemas import PredictionRequest, PredictionResponse
+import asyncio
+import codecs
+from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+from api.admission import AdmissionController, Overloaded
+from api.batching import MicroBatcher
+from api.cache import PredictionCache
+from api.instrumentation import StageTimers, RequestTimingMiddleware
+from api.prediction_logger import PredictionLogWriter
+from psycopg2 import extensions
+from common.db import connect, get_conn, get_pool, current_pool, close_pool
+from common.forest import load_model_artifact
+from common.labels import LabelIngestor
+from api.shadow import ShadowScorer
+from api.schemas import PredictionRequest, PredictionResponse, BatchPredictionRequest, BatchPredictionResponse
 
 # Logging setup
 # Configure logging to show timestamp, name, level, and message
@@ -23,45 +38,193 @@ current_model = None
 current_version ="v1.0.0"
 model_lock = threading.Lock() # To prevent race conditions when loading/switching models
 
+# Feature order must match the column order the models were trained on (see eval/retrain.py)
+FEATURES = ["income", "debt", "credit_score"]
+# Upper bound on rows per /predict/batch call so one caller can't monopolise the worker
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
+
+# Opt-in shadow scoring of candidate models (model_versions.is_shadow) on a sample of
+# live traffic, off the request path (see api/shadow.py)
+SHADOW_ENABLED = os.getenv("SHADOW_ENABLED", "false").lower() == "true"
+shadow_scorer = None
+
+# Opt-in micro-batching of concurrent /predict calls (see api/batching.py)
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "false").lower() == "true"
+MICROBATCH_WINDOW_MS = float(os.getenv("MICROBATCH_WINDOW_MS", "2"))
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "64"))
+micro_batcher = None
+
+# Inference runs on a bounded executor, with load shedding once the estimated
+# queueing delay exceeds the latency budget (see api/admission.py). INFERENCE_MAX_QUEUE
+# counts executor calls, so with micro-batching on each queued call is a whole batch.
+admission = AdmissionController(
+    max_concurrency=int(os.getenv("INFERENCE_CONCURRENCY", str(os.cpu_count() or 4))),
+    max_queue=int(os.getenv("INFERENCE_MAX_QUEUE", "64")),
+    latency_budget_ms=float(os.getenv("INFERENCE_LATENCY_BUDGET_MS", "250")),
+    max_batch_size=MICROBATCH_MAX_SIZE if MICROBATCH_ENABLED else 1,
+)
+
+# Rows staged per COPY by the bulk ground-truth endpoint (see common/labels.py)
+LABEL_CHUNK_SIZE = int(os.getenv("LABEL_CHUNK_SIZE", "50000"))
+
+# Flatten supported tree ensembles into NumPy arrays at load time (see common/forest.py)
+COMPILE_MODELS = os.getenv("COMPILE_MODELS", "true").lower() == "true"
+
+# Model hot-reload: pushed via LISTEN/NOTIFY, with polling only as a fallback
+MODEL_NOTIFY_CHANNEL = "model_promoted"
+MODEL_POLL_INTERVAL = float(os.getenv("MODEL_POLL_INTERVAL", "60"))
+model_reload_stats = {}  # timings of the last swap, served on GET /model
+
+# Optional cache of /predict results for repeated applicant profiles (see api/cache.py)
+PREDICTION_CACHE_ENABLED = os.getenv("PREDICTION_CACHE_ENABLED", "false").lower() == "true"
+prediction_cache = PredictionCache(
+    max_size=int(os.getenv("PREDICTION_CACHE_MAX_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("PREDICTION_CACHE_TTL", "300")),
+    income_quantum=float(os.getenv("PREDICTION_CACHE_INCOME_QUANTUM", "0")),
+    debt_quantum=float(os.getenv("PREDICTION_CACHE_DEBT_QUANTUM", "0")),
+) if PREDICTION_CACHE_ENABLED else None
+
+# Per-stage latency histograms for the request path, exported on GET /metrics
+INSTRUMENTATION_ENABLED = os.getenv("INSTRUMENTATION_ENABLED", "true").lower() == "true"
+stage_timers = StageTimers(enabled=INSTRUMENTATION_ENABLED)
+
+# Write-behind prediction logging (see api/prediction_logger.py)
+# Requests only enqueue their row; a background thread writes batches with COPY.
+prediction_logger = PredictionLogWriter(
+    max_queue=int(os.getenv("PREDICTION_LOG_MAX_QUEUE", "10000")),
+    flush_size=int(os.getenv("PREDICTION_LOG_FLUSH_SIZE", "500")),
+    flush_interval=float(os.getenv("PREDICTION_LOG_FLUSH_INTERVAL", "1.0")),
+    overflow_policy=os.getenv("PREDICTION_LOG_OVERFLOW", "drop"),  # block | drop | spill
+    spill_path=os.getenv("PREDICTION_LOG_SPILL_PATH", "/app/spill/predictions.ndjson"),
+    block_timeout=float(os.getenv("PREDICTION_LOG_BLOCK_TIMEOUT", "5.0")),
+    timers=stage_timers,
+)
+
+async def enqueue_prediction_logs(payloads: list):
+    """
+    Queue rows for the write-behind logger. Under the "block" policy a full queue makes
+    the put wait for the writer thread, so it waits on a worker thread instead of
+    stalling the event loop.
+    """
+    if prediction_logger.overflow_policy == "block":
+        await run_in_threadpool(prediction_logger.log_many, payloads)
+    else:
+        prediction_logger.log_many(payloads)
+
+def warm_up_model(model, n_rows: int = 64, rounds: int = 3):
+    """
+    Score a synthetic batch so the first real requests after a swap don't pay for
+    cold caches and lazy initialisation. Returns the warm-up time in ms.
+    """
+    rng = np.random.default_rng(0)
+    X = np.column_stack([
+        rng.uniform(10000, 200000, n_rows),   # income
+        rng.uniform(0, 50000, n_rows),        # debt
+        rng.uniform(300, 850, n_rows),        # credit_score
+    ])
+    start = time.perf_counter()
+    for _ in range(rounds):
+        score_batch(model, X)
+        score_batch(model, X[:1])  # single-row path used by /predict
+    return (time.perf_counter() - start) * 1000
+
 def load_active_model():
     """
     Check DB for active model and loads if different from current model. 
+    The new model is loaded and warmed up before it is swapped in.
     """
-    global current_model, current_version
+    global current_model, current_version, model_reload_stats
     try:
-        conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-        cur = conn.cursor()
-        cur.execute("SELECT version, filepath FROM model_versions WHERE is_active = TRUE ORDER BY created_at DESC LIMIT 1")
-        row = cur.fetchone()
-        conn.close()
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT version, filepath FROM model_versions WHERE is_active = TRUE ORDER BY created_at DESC LIMIT 1")
+            row = cur.fetchone()
+            cur.close()
 
         if row:
             new_version, filepath = row
-            # Only reload if version changed
-            if new_version != current_version:
+            # Only reload if version changed (or nothing has been loaded yet)
+            if new_version != current_version or current_model is None:
                 logger.info(f"Loading new model version {new_version} from {filepath}")
                 try:
-                    with open(filepath, "rb") as f:
-                        new_model = pickle.load(f)
+                    load_start = time.perf_counter()
+                    # .forest artifacts are memory-mapped and shared across workers;
+                    # pickles are compiled when possible and otherwise served as-is
+                    new_model = load_model_artifact(filepath, compile=COMPILE_MODELS)
+                    load_ms = (time.perf_counter() - load_start) * 1000
+
+                    # Warm up outside the lock so requests keep using the old model meanwhile
+                    warmup_ms = warm_up_model(new_model)
 
                     # atomic swap
                     # we do this because pair of assignments should match
+                    swap_start = time.perf_counter()
                     with model_lock:
                         current_model = new_model
                         current_version = new_version
-                        logger.info(f"Switched to new model version {new_version}")
-                except FileNotFoundError as e:
+                    swap_ms = (time.perf_counter() - swap_start) * 1000
+
+                    if prediction_cache is not None:
+                        # Entries are keyed by version anyway; clearing frees the memory
+                        prediction_cache.clear()
+
+                    stage_timers.observe("model_load", load_ms, new_version)
+                    stage_timers.observe("model_warmup", warmup_ms, new_version)
+                    stage_timers.observe("model_swap", swap_ms, new_version)
+                    model_reload_stats = {
+                        "version": new_version,
+                        "loaded_at": time.time(),
+                        "load_ms": load_ms,
+                        "warmup_ms": warmup_ms,
+                        "swap_ms": swap_ms,
+                    }
+                    logger.info(
+                        f"Switched to new model version {new_version} "
+                        f"(load {load_ms:.1f}ms, warm-up {warmup_ms:.1f}ms, swap {swap_ms:.3f}ms)"
+                    )
+                except FileNotFoundError:
                     logger.warning(f"Model file not found: {filepath}. Model may not exist yet.")
     except Exception as e:
         logger.error(f"Failed to load active model: {e}", exc_info=True)
-                
+
 def background_model_reloader():
     """
-    Runs in background thread to poll for updates.
+    Runs in background thread. Reloads as soon as Postgres sends a NOTIFY on
+    MODEL_NOTIFY_CHANNEL (see db/update_v3.sql), and polls every MODEL_POLL_INTERVAL
+    seconds as a fallback in case a notification is missed.
     """
+    load_active_model()
+    conn = None
     while True:
-        load_active_model()
-        time.sleep(30) # Poll every 30 seconds
+        try:
+            if conn is None:
+                # LISTEN needs its own autocommit connection for as long as we listen,
+                # so it doesn't come from the pool
+                conn = connect(statement_timeout_ms=0)
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute(f"LISTEN {MODEL_NOTIFY_CHANNEL}")
+                logger.info(f"Listening for model promotions on '{MODEL_NOTIFY_CHANNEL}'")
+                # Catch promotions that happened while we weren't listening
+                load_active_model()
+
+            if select.select([conn], [], [], MODEL_POLL_INTERVAL) == ([], [], []):
+                # No notification within the interval: fallback poll
+                load_active_model()
+                continue
+
+            conn.poll()
+            if conn.notifies:
+                versions = [n.payload for n in conn.notifies]
+                conn.notifies.clear()
+                logger.info(f"Model promotion notification received: {versions}")
+                load_active_model()
+        except Exception as e:
+            logger.error(f"Model promotion listener failed, reconnecting: {e}", exc_info=True)
+            if conn is not None:
+                conn.close()
+                conn = None
+            time.sleep(5)
+            load_active_model()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -72,79 +235,230 @@ async def lifespan(app: FastAPI):
     logger.info("Starting background model reloader")
     # Note: /app/models is mounted as a volume from ./models, so no need to create it here
     
-    # Start background poller
+    # Start background reloader (LISTEN/NOTIFY + fallback polling)
     t=threading.Thread(target=background_model_reloader, daemon=True)
     t.start()
+
+    prediction_logger.start()
+
+    global shadow_scorer
+    if SHADOW_ENABLED:
+        shadow_scorer = ShadowScorer(
+            score_batch,
+            # Shed shadow work as soon as production inference has no idle slot
+            is_busy=lambda: admission.executor_calls() >= admission.max_concurrency,
+            sample_rate=float(os.getenv("SHADOW_SAMPLE_RATE", "0.1")),
+            max_queue=int(os.getenv("SHADOW_MAX_QUEUE", "1000")),
+            max_models=int(os.getenv("SHADOW_MAX_MODELS", "3")),
+            compile=COMPILE_MODELS,
+        )
+        shadow_scorer.start()
+
+    global micro_batcher
+    batcher_task = None
+    if MICROBATCH_ENABLED:
+        logger.info(f"Starting micro-batcher (window={MICROBATCH_WINDOW_MS}ms, max_size={MICROBATCH_MAX_SIZE})")
+        micro_batcher = MicroBatcher(score_requests, MICROBATCH_WINDOW_MS, MICROBATCH_MAX_SIZE,
+                                     runner=functools.partial(admission.run, batched=True))
+        batcher_task = asyncio.create_task(micro_batcher.run())
     yield
 
+    if batcher_task is not None:
+        batcher_task.cancel()
+        micro_batcher = None
+
+    if shadow_scorer is not None:
+        shadow_scorer.stop()
+        shadow_scorer = None
+
+    # Graceful shutdown: write out everything still queued before the process exits
+    logger.info("Flushing prediction logger")
+    prediction_logger.stop()
+    admission.shutdown()
+    close_pool()
+
 # Context manager is lifespan which 
 app = FastAPI(title="ML Monitoring Inference Service", lifespan=lifespan)
+app.add_middleware(RequestTimingMiddleware, timers=stage_timers)
 
-# DB Connection - In production, use a connection pool (like sqlalchemy)
-# For this portfolio, direct psycopg2 is simpler and easier to explain for development
-def save_prediction_to_db(payload: dict):
-    try:
-        request_id = payload['request_id']
-        logger.info(f"Attempting to save prediction to database for request {request_id}")
-        conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-        cur = conn.cursor()
-        cur.execute(
-            """INSERT INTO predictions 
-               (request_id, model_version, input_data, prediction_prob, prediction_class, latency_ms) 
-               VALUES (%s, %s, %s, %s, %s, %s)""",
-            (
-                request_id, 
-                payload['model_version'], 
-                json.dumps(payload['input_data']), 
-                payload['prediction_prob'], 
-                payload['prediction_class'], 
-                payload['latency_ms']
-            )
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
-        logger.info(f"SUCCESS: Prediction saved to database for request {request_id}")
-    except Exception as e:
-        logger.error(f"FAILURE: Write request {request_id} failed: {e}", exc_info=True)
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    # 503 + Retry-After lets the load balancer back off instead of marking us dead
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Server overloaded: {exc}"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+def score_batch(model, X: np.ndarray):
+    """
+    Score a (n_rows, n_features) matrix with a single predict_proba call.
+    Returns (probability of class 1, predicted class) arrays.
+    """
+    if hasattr(model, "feature_names_in_"):
+        # sklearn models fitted on a DataFrame warn when given a bare array
+        X = pd.DataFrame(X, columns=FEATURES)
+    probs = model.predict_proba(X)
+    # Derive classes from the probabilities instead of paying for a second predict() call
+    classes = model.classes_[probs.argmax(axis=1)]
+    return probs[:, 1], classes
+
+def mock_predict(request: PredictionRequest):
+    """
+    Heuristic used while no model has been loaded yet. Returns (prob, pred_class).
+    """
+    normalized_score = (request.credit_score - 300) / 550
+    prob = 1.0 - (0.7 * normalized_score + 0.3 * min(request.income / 100000, 1))
+    prob = max(0, min(1, prob)) # Clip between 0 and 1
+    pred_class = 1 if prob > 0.5 else 0
+    return prob, pred_class
+
+def score_requests(requests: list):
+    """
+    Score a list of PredictionRequests against whichever model is current.
+    Returns one (prob, pred_class, model_version) tuple per request.
+    """
+    t = time.perf_counter()
+    with model_lock:
+        model = current_model
+        model_version = current_version
+    stage_timers.since("lock_wait", t)
+
+    if model is None:
+        # Fallback to mock logic if model not loaded yet
+        logger.warning("Model not loaded, using mock prediction logic")
+        return [(*mock_predict(r), "mock") for r in requests]
+
+    # Prepare input as a matrix in training feature order
+    t = time.perf_counter()
+    X = np.array([[r.income, r.debt, r.credit_score] for r in requests], dtype=np.float64)
+    stage_timers.since("feature_build", t)
+
+    t = time.perf_counter()
+    probs, classes = score_batch(model, X)
+    stage_timers.since("inference", t, model_version)
+    return [(float(p), int(c), model_version) for p, c in zip(probs, classes)]
 
 
 @app.get("/health")
 def health_check():
+    # Plain def: served from Starlette's threadpool, never queued behind inference
     logger.info("Health check endpoint called")
     return {"status": "healthy"}
 
+@app.get("/model")
+def model_info():
+    """
+    Currently served model version and the timings of the last hot-reload.
+    """
+    with model_lock:
+        model = current_model
+        model_version = current_version
+    return {
+        "model_version": model_version if model is not None else "mock",
+        "model_type": type(model).__name__ if model is not None else None,
+        "last_reload": model_reload_stats,
+    }
+
+@app.get("/batcher/stats")
+def batcher_stats():
+    """
+    Micro-batcher queue depth and batch sizes, for tuning MICROBATCH_WINDOW_MS/MICROBATCH_MAX_SIZE.
+    """
+    if micro_batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **micro_batcher.stats()}
+
+@app.get("/logger/stats")
+def logger_stats():
+    """
+    Write-behind prediction logger queue depth and write/drop/spill counters.
+    """
+    return prediction_logger.stats()
+
+@app.get("/db/stats")
+def db_stats():
+    """
+    Connection pool usage for this worker. Doesn't create the pool (or touch the
+    database) if nothing has needed a connection yet.
+    """
+    pool = current_pool()
+    if pool is None:
+        return {"created": False}
+    return {"created": True, **pool.stats()}
+
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Prediction cache hit/miss/eviction counters.
+    """
+    if prediction_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **prediction_cache.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus text exposition of per-stage latency quantiles, queue depths,
+    DB write/pool statistics and the last model reload timings.
+    """
+    gauges = {
+        "prediction_log": prediction_logger.stats(),
+        "model_reload": model_reload_stats,
+        "admission": admission.stats(),
+    }
+    # Scrapes must keep working while the database is down, so never connect from here
+    pool = current_pool()
+    if pool is not None:
+        try:
+            gauges["db_pool"] = pool.stats()
+        except Exception as e:
+            logger.warning(f"Skipping db_pool metrics: {e}")
+    if micro_batcher is not None:
+        gauges["microbatch"] = micro_batcher.stats()
+    if prediction_cache is not None:
+        gauges["prediction_cache"] = prediction_cache.stats()
+    if shadow_scorer is not None:
+        gauges["shadow"] = shadow_scorer.stats()
+    return stage_timers.render_prometheus(gauges)
+
 @app.post("/predict", response_model=PredictionResponse)
-async def predict(request: PredictionRequest, background_tasks: BackgroundTasks):
+async def predict(request: PredictionRequest, http_request: Request):
+    # Time between arrival and the handler running: body read + pydantic validation
+    request_start = getattr(http_request.state, "request_start", None)
+    if request_start is not None:
+        stage_timers.since("pre_handler", request_start)
+
     logger.info(f"Received prediction request: {request.model_dump()}")
     start_time = time.time()
     request_id = str(uuid.uuid4())
     
-    # Use loaded model if available, otherwise fallback to mock logic
-    with model_lock:
-        model = current_model
-        model_version = current_version
-    
-    if model is not None:
-        # Use the loaded ML model for prediction
-        # Prepare input as DataFrame matching training format
-        input_df = pd.DataFrame({
-            "income": [request.income],
-            "debt": [request.debt],
-            "credit_score": [request.credit_score]
-        })
-        
-        # Get prediction probability and class
-        prob = float(model.predict_proba(input_df)[0][1])  # Probability of class 1
-        pred_class = int(model.predict(input_df)[0])
+    cached = None
+    if prediction_cache is not None:
+        t = time.perf_counter()
+        with model_lock:
+            served_version = current_version if current_model is not None else None
+        if served_version is not None:
+            cached = prediction_cache.get(served_version, request)
+        stage_timers.since("cache_lookup", t)
+
+    if cached is not None:
+        prob, pred_class, model_version = cached
     else:
-        # Fallback to mock logic if model not loaded yet
-        logger.warning("Model not loaded, using mock prediction logic")
-        normalized_score = (request.credit_score - 300) / 550
-        prob = 1.0 - (0.7 * normalized_score + 0.3 * min(request.income / 100000, 1))
-        prob = max(0, min(1, prob)) # Clip between 0 and 1
-        pred_class = 1 if prob > 0.5 else 0
-        model_version = "mock"
+        # Raises Overloaded (-> 503) if the inference queue is over its latency budget
+        async with admission.slot(batched=micro_batcher is not None):
+            if micro_batcher is not None:
+                # Wait for a shared batched model call
+                t = time.perf_counter()
+                prob, pred_class, model_version = await micro_batcher.submit(request)
+                stage_timers.since("microbatch_wait", t, model_version)
+            else:
+                # Use loaded model if available, otherwise fallback to mock logic.
+                # Runs on the inference executor so the event loop stays free.
+                prob, pred_class, model_version = (await admission.run(score_requests, [request]))[0]
+
+        if prediction_cache is not None and model_version != "mock":
+            prediction_cache.put(model_version, request, (prob, pred_class, model_version))
 
     # Calculate latency in milliseconds for readability and standardisation
     latency = (time.time() - start_time) * 1000
@@ -152,19 +466,113 @@ async def predict(request: PredictionRequest, background_tasks: BackgroundTasks)
     # Log for monitoring the prediction to the database
     log_payload = {
         "request_id": request_id,
+        "timestamp": datetime.fromtimestamp(start_time).isoformat(),  # request time, whenever the row is written
         "model_version": model_version,
         "input_data": request.model_dump(), # Convert PredictionRequest to dict for logging
         "prediction_prob": prob,
         "prediction_class": pred_class,
-        "latency_ms": latency
+        "latency_ms": latency,
+        "cache_hit": cached is not None
     }
 
-    # "Fire and forget" the DB write to avoid blocking the request
-    background_tasks.add_task(save_prediction_to_db, log_payload)
+    # "Fire and forget": the write-behind logger batches it into a later COPY
+    t = time.perf_counter()
+    await enqueue_prediction_logs([log_payload])
+    stage_timers.since("log_enqueue", t)
+
+    if shadow_scorer is not None:
+        # Sampled copy for candidate models; dropped rather than queued when busy
+        shadow_scorer.offer(request_id, request)
+    stage_timers.observe("handler_total", latency, model_version)
 
     return PredictionResponse(
         request_id=request_id,
         prediction_prob=prob,
         prediction_class=pred_class,
         model_version=model_version
-    )
\ No newline at end of file
+    )
+
+@app.post("/predict/batch", response_model=BatchPredictionResponse)
+async def predict_batch(batch: BatchPredictionRequest):
+    """
+    Score many applicants in one call: one vectorized predict_proba over the whole batch,
+    with every row queued for the write-behind logger.
+    """
+    n_rows = len(batch.instances)
+    if n_rows > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {n_rows} rows exceeds MAX_BATCH_SIZE={MAX_BATCH_SIZE}"
+        )
+    logger.info(f"Received batch prediction request with {n_rows} rows")
+    start_time = time.time()
+
+    async with admission.slot(rows=n_rows):
+        results = await admission.run(score_requests, batch.instances, rows=n_rows)
+
+    # Every row waited for the whole batch, so each one is logged with the batch latency
+    latency = (time.time() - start_time) * 1000
+
+    requested_at = datetime.fromtimestamp(start_time).isoformat()
+    responses = []
+    log_payloads = []
+    for request, (prob, pred_class, model_version) in zip(batch.instances, results):
+        request_id = str(uuid.uuid4())
+        log_payloads.append({
+            "request_id": request_id,
+            "timestamp": requested_at,
+            "model_version": model_version,
+            "input_data": request.model_dump(),
+            "prediction_prob": prob,
+            "prediction_class": pred_class,
+            "latency_ms": latency
+        })
+        responses.append(PredictionResponse(
+            request_id=request_id,
+            prediction_prob=prob,
+            prediction_class=pred_class,
+            model_version=model_version
+        ))
+
+    # Queue the whole batch for the write-behind logger, off the request path
+    t = time.perf_counter()
+    await enqueue_prediction_logs(log_payloads)
+    stage_timers.since("log_enqueue", t)
+
+    if shadow_scorer is not None:
+        for request, payload in zip(batch.instances, log_payloads):
+            shadow_scorer.offer(payload["request_id"], request)
+    stage_timers.observe("batch_handler_total", latency, results[0][2])
+
+    return BatchPredictionResponse(predictions=responses)
+
+@app.post("/ground_truth")
+async def ingest_ground_truth(http_request: Request):
+    """
+    Bulk-load labels from a streamed NDJSON (default) or CSV body (Content-Type: text/csv),
+    one {"request_id", "actual_class"} per line. The body is never held in memory as a
+    whole; database work runs on the threadpool, off the event loop.
+    """
+    fmt = "csv" if "csv" in http_request.headers.get("content-type", "") else "ndjson"
+    pool = get_pool()
+    conn = await run_in_threadpool(pool.getconn)
+    try:
+        ingestor = await run_in_threadpool(LabelIngestor, conn, fmt, LABEL_CHUNK_SIZE)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        pending = ""
+        async for chunk in http_request.stream():
+            # Lines can straddle network chunks; the partial tail waits for the next one
+            *lines, pending = (pending + decoder.decode(chunk)).split("\n")
+            if lines:
+                await run_in_threadpool(ingestor.feed, lines)
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            await run_in_threadpool(ingestor.feed, [pending])
+        report = await run_in_threadpool(ingestor.finish)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        await run_in_threadpool(pool.putconn, conn)
+
+    logger.info(f"Ground truth ingestion: {report['inserted']} labels at {report['rows_per_sec']} rows/s")
+    return report
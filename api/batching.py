@@ -0,0 +1,103 @@
+# api/batching.py - Dynamic micro-batching of concurrent /predict calls
+# Requests that arrive within a short window are scored together with one model call,
+# which amortises sklearn's per-call overhead across many callers.
+
+import asyncio
+import logging
+
+logger = logging.getLogger("api.batching")
+
+class MicroBatcher:
+    """
+    Collects single-row requests into small batches.
+
+    A batch is closed when `max_batch_size` rows are waiting or `window_ms` has elapsed
+    since its first row arrived, whichever comes first. `score_fn` receives the list of
+    queued items and must return one result per item, in order. If `runner` is given
+    (an async callable such as AdmissionController.run, taking a `rows` keyword), batches
+    are scored through it instead of on the event loop.
+    """
+
+    def __init__(self, score_fn, window_ms: float = 2.0, max_batch_size: int = 64, runner=None):
+        self.score_fn = score_fn
+        self.runner = runner
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._queue = asyncio.Queue()
+
+        # Counters for tuning throughput against tail latency
+        self.batches = 0
+        self.rows = 0
+        self.last_batch_size = 0
+        self.max_seen_batch_size = 0
+
+    async def submit(self, item):
+        """
+        Queue one item and wait for its result.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def run(self):
+        """
+        Collector loop. Runs as a task for the lifetime of the app.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+
+            while len(batch) < self.max_batch_size:
+                # Take whatever is already queued before waiting on the clock
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._score(batch)
+
+    async def _score(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            if self.runner is not None:
+                results = await self.runner(self.score_fn, items, rows=len(items))
+            else:
+                results = self.score_fn(items)
+        except Exception as e:
+            logger.error(f"Micro-batch of {len(batch)} rows failed: {e}", exc_info=True)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            # The caller may have gone away (client disconnect cancels the future)
+            if not future.done():
+                future.set_result(result)
+
+        self.batches += 1
+        self.rows += len(batch)
+        self.last_batch_size = len(batch)
+        self.max_seen_batch_size = max(self.max_seen_batch_size, len(batch))
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "queue_depth": self.queue_depth(),
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "max_seen_batch_size": self.max_seen_batch_size,
+        }
@@ -0,0 +1,92 @@
+# api/cache.py - Version-aware prediction result cache
+# Re-submissions and retries of the same applicant profile are answered from memory
+# instead of rerunning inference. Keys include the model version, so a cached answer
+# is never served for a different model.
+
+import time
+import threading
+from collections import OrderedDict
+
+class PredictionCache:
+    """
+    Bounded LRU cache with a TTL, keyed on (model_version, income, debt, credit_score).
+
+    Float features are quantized before keying: with income_quantum=100, incomes of
+    52,010 and 52,040 share an entry. A quantum of 0 keys on the exact value.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl_seconds: float = 300.0,
+                 income_quantum: float = 0.0, debt_quantum: float = 0.0):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.income_quantum = income_quantum
+        self.debt_quantum = debt_quantum
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0    # dropped to stay under max_size
+        self.expirations = 0  # dropped because the TTL ran out
+        self.invalidations = 0
+
+    @staticmethod
+    def _quantize(value: float, quantum: float):
+        return round(value / quantum) if quantum > 0 else value
+
+    def key(self, model_version: str, request) -> tuple:
+        return (
+            model_version,
+            self._quantize(request.income, self.income_quantum),
+            self._quantize(request.debt, self.debt_quantum),
+            request.credit_score,
+        )
+
+    def get(self, model_version: str, request):
+        key = self.key(model_version, request)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, model_version: str, request, value):
+        key = self.key(model_version, request)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every entry, e.g. when a new model version is swapped in.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,149 @@
+# api/instrumentation.py - Per-stage latency histograms and Prometheus text export
+# Cheap enough to leave on in production: an observation is one bisect into fixed
+# log-spaced buckets plus a counter increment, with no per-request allocation.
+
+import time
+import math
+import bisect
+import threading
+
+# Log-spaced bucket upper bounds from 1µs to ~60s, each 25% wider than the last.
+# A quantile read from these buckets is within ~12% of the true value.
+_GROWTH = 1.25
+BUCKET_BOUNDS_MS = [0.001 * _GROWTH ** i for i in range(int(math.log(60000 / 0.001, _GROWTH)) + 2)]
+QUANTILES = (0.5, 0.95, 0.99)
+
+class LatencyHistogram:
+    """
+    Fixed-bucket histogram (a simple mergeable latency sketch).
+    """
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.sum += ms
+        if ms > self.max:
+            self.max = ms
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                # Interpolate inside the bucket
+                lower = BUCKET_BOUNDS_MS[i - 1] if i > 0 else 0.0
+                upper = BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / c, self.max)
+            seen += c
+        return self.max
+
+class StageTimers:
+    """
+    Latency histograms keyed by (stage, model_version).
+
+    Usage on the hot path:
+        t = time.perf_counter()
+        ...
+        stage_timers.observe("inference", (time.perf_counter() - t) * 1000, model_version)
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, ms: float, model_version: str = "all"):
+        if not self.enabled:
+            return
+        key = (stage, model_version)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = LatencyHistogram()
+            hist.observe(ms)
+
+    def since(self, stage: str, start: float, model_version: str = "all"):
+        """
+        Observe the time elapsed since a time.perf_counter() reading.
+        """
+        self.observe(stage, (time.perf_counter() - start) * 1000, model_version)
+
+    def summary(self) -> dict:
+        with self._lock:
+            items = list(self._histograms.items())
+        return {
+            f"{stage}[{version}]": {
+                "count": h.count,
+                **{f"p{int(q * 100)}": h.quantile(q) for q in QUANTILES},
+                "max": h.max,
+            }
+            for (stage, version), h in items
+        }
+
+    def render_prometheus(self, gauges: dict = None) -> str:
+        """
+        Prometheus text exposition: one summary per stage/version, plus flat gauges
+        given as {"component": {"field": value}}.
+        """
+        lines = [
+            "# HELP api_stage_latency_ms Latency of each request-path stage in milliseconds",
+            "# TYPE api_stage_latency_ms summary",
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+            snapshot = [(key, [h.quantile(q) for q in QUANTILES], h.count, h.sum) for key, h in items]
+        for (stage, version), quantiles, count, total in snapshot:
+            labels = f'stage="{stage}",model_version="{version}"'
+            for q, value in zip(QUANTILES, quantiles):
+                lines.append(f'api_stage_latency_ms{{{labels},quantile="{q}"}} {value:.6f}')
+            lines.append(f"api_stage_latency_ms_sum{{{labels}}} {total:.6f}")
+            lines.append(f"api_stage_latency_ms_count{{{labels}}} {count}")
+
+        for component, fields in (gauges or {}).items():
+            for field, value in fields.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"api_{component}_{field}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+class RequestTimingMiddleware:
+    """
+    Pure ASGI middleware that stamps each request with its arrival time, so handlers
+    can measure the time spent before they run (body parsing, pydantic validation).
+    Also records total time per path (404s excluded).
+    """
+
+    def __init__(self, app, timers: StageTimers):
+        self.app = app
+        self.timers = timers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        scope.setdefault("state", {})["request_start"] = start
+        status = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Unknown paths would give the histogram table unbounded cardinality
+            if status.get("code") != 404:
+                self.timers.since(f"request_total:{scope['path']}", start)
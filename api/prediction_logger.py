@@ -0,0 +1,253 @@
+# api/prediction_logger.py - Write-behind logging of predictions
+# Requests only enqueue their log row; a single background thread drains the queue
+# and writes rows in bulk with COPY on a pooled connection.
+
+import os
+import io
+import csv
+import json
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+from common.db import get_conn
+
+logger = logging.getLogger("api.prediction_logger")
+
+# Features are written both as JSON and into their typed columns (db/update_v9.sql).
+# timestamp is the request time from the payload, not the column default: a row can be
+# written up to flush_interval later, or hours later when replayed from the spill file,
+# and metric buckets, rollups and partitions all go by it.
+FEATURE_COLUMNS = ["income", "debt", "credit_score"]
+COLUMNS = ["request_id", "timestamp", "model_version", "input_data", *FEATURE_COLUMNS,
+           "prediction_prob", "prediction_class", "latency_ms", "cache_hit"]
+OVERFLOW_POLICIES = ("block", "drop", "spill")
+
+class PredictionLogWriter:
+    """
+    Bounded write-behind queue for the predictions table.
+
+    Rows are flushed when `flush_size` rows are waiting or `flush_interval` seconds have
+    passed. When the queue is full, `overflow_policy` decides what happens to new rows:
+    - block: the caller waits up to `block_timeout` seconds for space (backpressure on
+             the request path), then the row is dropped. Async callers must call `log()`
+             off the event loop under this policy (see api/app.py).
+    - drop:  the row is discarded and counted in `dropped`
+    - spill: the row is appended to `spill_path` (NDJSON) and replayed on the next start
+    Batches that fail to write are spilled under the "spill" policy and dropped otherwise.
+    """
+
+    def __init__(self, max_queue: int = 10000, flush_size: int = 500,
+                 flush_interval: float = 1.0, overflow_policy: str = "drop", spill_path: str = None,
+                 block_timeout: float = 5.0, timers=None):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow_policy: {overflow_policy} (expected one of {OVERFLOW_POLICIES})")
+        if overflow_policy == "spill" and not spill_path:
+            raise ValueError("overflow_policy='spill' requires a spill_path")
+
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+        self.block_timeout = block_timeout
+        self.timers = timers  # optional StageTimers; flush latency is recorded as "db_write"
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._spill_lock = threading.Lock()
+        self._thread = None
+
+        # Counters
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+    # --- Producer side (request path) ---
+
+    def log(self, payload: dict, timeout: float = None):
+        """
+        Queue one prediction row without touching the database. `timeout` overrides
+        block_timeout under the "block" policy.
+        """
+        try:
+            if self.overflow_policy == "block":
+                self._queue.put(payload, timeout=self.block_timeout if timeout is None else timeout)
+            else:
+                self._queue.put_nowait(payload)
+        except queue.Full:
+            if self.overflow_policy == "spill":
+                self._spill([payload])
+            else:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    logger.warning(f"Prediction log queue full, dropped {self.dropped} rows so far")
+
+    def log_many(self, payloads: list):
+        # One block_timeout for the whole batch, not per row
+        deadline = time.monotonic() + self.block_timeout
+        for payload in payloads:
+            self.log(payload, max(0.0, deadline - time.monotonic()))
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="prediction-logger", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Prediction logger started (flush_size={self.flush_size}, "
+            f"flush_interval={self.flush_interval}s, overflow_policy={self.overflow_policy})"
+        )
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Flush everything still queued and stop the writer thread.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Prediction logger did not finish flushing within {timeout}s "
+                           f"({self.queue_depth()} rows still queued)")
+        self._thread = None
+        logger.info(f"Prediction logger stopped: {self.stats()}")
+
+    # --- Consumer side (writer thread) ---
+
+    def _run(self):
+        self._replay_spill()
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def _collect(self) -> list:
+        """
+        Wait for the first row, then gather until flush_size rows or flush_interval elapses.
+        """
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+            if self._stop.is_set():
+                # Shutting down: drain without waiting for the interval
+                deadline = 0
+        return batch
+
+    def _flush(self, batch: list):
+        start = time.perf_counter()
+        try:
+            with get_conn() as conn:
+                write_predictions(conn, batch)
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.error(f"FAILURE: Bulk write of {len(batch)} predictions failed: {e}", exc_info=True)
+            if self.overflow_policy == "spill":
+                self._spill(batch)
+            else:
+                self.dropped += len(batch)
+            return
+
+        self.last_flush_ms = (time.perf_counter() - start) * 1000
+        if self.timers is not None:
+            self.timers.observe("db_write", self.last_flush_ms)
+        self.flushes += 1
+        self.written += len(batch)
+        logger.debug(f"Flushed {len(batch)} predictions in {self.last_flush_ms:.1f}ms")
+
+    # --- Spill file ---
+
+    def _spill(self, payloads: list):
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            with open(self.spill_path, "a") as f:
+                for payload in payloads:
+                    f.write(json.dumps(payload) + "\n")
+            self.spilled += len(payloads)
+
+    def _replay_spill(self):
+        """
+        Write rows spilled by a previous run before serving new ones.
+        """
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        # Move the file aside so rows spilled while replaying go to a fresh file
+        replay_path = self.spill_path + ".replay"
+        with self._spill_lock:
+            os.replace(self.spill_path, replay_path)
+
+        logger.info(f"Replaying spilled predictions from {replay_path}")
+        replayed = 0
+        with open(replay_path) as f:
+            batch = []
+            for line in f:
+                batch.append(json.loads(line))
+                if len(batch) >= self.flush_size:
+                    self._flush(batch)
+                    replayed += len(batch)
+                    batch = []
+            if batch:
+                self._flush(batch)
+                replayed += len(batch)
+        os.remove(replay_path)
+        logger.info(f"Replayed {replayed} spilled predictions")
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+def write_predictions(conn, payloads: list):
+    """
+    Write prediction rows with a single COPY and commit.
+    """
+    written_at = datetime.now().isoformat()
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for p in payloads:
+        writer.writerow([
+            p['request_id'],
+            # Rows spilled before payloads carried a timestamp get the write time, as they used to
+            p.get('timestamp') or written_at,
+            p['model_version'],
+            json.dumps(p['input_data']),
+            *(p['input_data'].get(f) for f in FEATURE_COLUMNS),
+            p['prediction_prob'],
+            p['prediction_class'],
+            p['latency_ms'],
+            p.get('cache_hit', False),
+        ])
+    buf.seek(0)
+
+    cur = conn.cursor()
+    try:
+        cur.copy_expert(
+            f"COPY predictions ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buf
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from uuid import UUID
 
 class PredictionRequest(BaseModel):
@@ -12,4 +12,11 @@ class PredictionResponse(BaseModel):
     request_id: UUID
     prediction_prob: float # between 0 and 1
     prediction_class: int # 0 or 1
-    model_version: str
\ No newline at end of file
+    model_version: str
+
+class BatchPredictionRequest(BaseModel):
+    # Rows are scored together; the maximum batch size is enforced by the API (MAX_BATCH_SIZE)
+    instances: List[PredictionRequest] = Field(..., min_length=1, description="Applicants to score")
+
+class BatchPredictionResponse(BaseModel):
+    predictions: List[PredictionResponse] # same order as the request instances
\ No newline at end of file
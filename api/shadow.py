@@ -0,0 +1,186 @@
+# api/shadow.py - Asynchronous shadow scoring of candidate models on live traffic
+# A sampled share of /predict requests is copied onto a bounded queue; a background
+# thread scores them against every shadow model in batches and writes the results to
+# shadow_predictions. Nothing here runs on, or waits for, the request path.
+
+import time
+import queue
+import random
+import logging
+import threading
+import numpy as np
+from psycopg2.extras import execute_values
+from common.db import get_conn
+from common.forest import load_model_artifact
+
+logger = logging.getLogger("api.shadow")
+
+class ShadowScorer:
+    """
+    Scores sampled live requests against candidate models marked is_shadow in model_versions.
+
+    `score_fn(model, X)` returns (prob_class_1, pred_class) arrays for a feature matrix.
+    `is_busy()` is checked before queueing: while it returns True (production inference
+    saturated) shadow work is dropped, as it is when the queue is full.
+    """
+
+    def __init__(self, score_fn, is_busy=None, sample_rate: float = 0.1, max_queue: int = 1000,
+                 flush_size: int = 256, flush_interval: float = 1.0, max_models: int = 3,
+                 reload_interval: float = 60.0, compile: bool = True):
+        self.score_fn = score_fn
+        self.is_busy = is_busy or (lambda: False)
+        self.sample_rate = sample_rate
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_models = max_models
+        self.reload_interval = reload_interval
+        self.compile = compile
+
+        self.models = {}  # version -> model
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_reload = 0.0
+
+        # Counters
+        self.offered = 0
+        self.scored = 0
+        self.dropped_full = 0
+        self.dropped_busy = 0
+        self.failed_batches = 0
+
+    # --- Request path ---
+
+    def offer(self, request_id: str, request):
+        """
+        Maybe queue a request for shadow scoring. Never blocks.
+        """
+        if not self.models or random.random() >= self.sample_rate:
+            return
+        self.offered += 1
+        if self.is_busy():
+            self.dropped_busy += 1
+            return
+        try:
+            self._queue.put_nowait((request_id, (request.income, request.debt, request.credit_score)))
+        except queue.Full:
+            self.dropped_full += 1
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self._stop.clear()
+        self.reload_models()
+        self._thread = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+        self._thread.start()
+        logger.info(f"Shadow scorer started (sample_rate={self.sample_rate}, models={list(self.models)})")
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def reload_models(self):
+        """
+        Load newly flagged shadow versions and forget ones that were unflagged.
+        """
+        self._last_reload = time.monotonic()
+        try:
+            with get_conn() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT version, filepath FROM model_versions
+                    WHERE is_shadow = TRUE AND is_active = FALSE
+                    ORDER BY created_at DESC
+                    LIMIT %s
+                """, (self.max_models,))
+                rows = cur.fetchall()
+                cur.close()
+        except Exception as e:
+            logger.error(f"Failed to list shadow models: {e}", exc_info=True)
+            return
+
+        models = {}
+        for version, filepath in rows:
+            if version in self.models:
+                models[version] = self.models[version]
+                continue
+            try:
+                models[version] = load_model_artifact(filepath, compile=self.compile)
+                logger.info(f"Loaded shadow model {version} from {filepath}")
+            except Exception as e:
+                logger.warning(f"Could not load shadow model {version} from {filepath}: {e}")
+        self.models = models
+
+    # --- Worker thread ---
+
+    def _run(self):
+        while not self._stop.is_set():
+            if time.monotonic() - self._last_reload > self.reload_interval:
+                self.reload_models()
+            batch = self._collect()
+            if batch:
+                self._score(batch)
+
+    def _collect(self) -> list:
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _score(self, batch: list):
+        request_ids = [request_id for request_id, _ in batch]
+        X = np.array([features for _, features in batch], dtype=np.float64)
+        rows = []
+        for version, model in list(self.models.items()):
+            start = time.perf_counter()
+            try:
+                probs, classes = self.score_fn(model, X)
+            except Exception as e:
+                self.failed_batches += 1
+                logger.error(f"Shadow model {version} failed on {len(batch)} rows: {e}", exc_info=True)
+                continue
+            # Per-row share of the batch call, comparable across versions
+            latency = (time.perf_counter() - start) * 1000 / len(batch)
+            rows.extend(
+                (request_id, version, float(p), int(c), latency)
+                for request_id, p, c in zip(request_ids, probs, classes)
+            )
+        if not rows:
+            return
+
+        try:
+            with get_conn() as conn:
+                cur = conn.cursor()
+                execute_values(cur, """
+                    INSERT INTO shadow_predictions
+                    (request_id, model_version, prediction_prob, prediction_class, latency_ms)
+                    VALUES %s
+                    ON CONFLICT DO NOTHING
+                """, rows)
+                conn.commit()
+                cur.close()
+            self.scored += len(batch)
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error(f"Failed to write {len(rows)} shadow predictions: {e}", exc_info=True)
+
+    def stats(self) -> dict:
+        return {
+            "models": len(self.models),
+            "queue_depth": self._queue.qsize(),
+            "offered": self.offered,
+            "scored": self.scored,
+            "dropped_full": self.dropped_full,
+            "dropped_busy": self.dropped_busy,
+            "failed_batches": self.failed_batches,
+        }
@@ -0,0 +1,187 @@
+# common/db.py - Shared PostgreSQL connection pool for the api, eval and dashboard services
+# Every service used to call psycopg2.connect() for each operation, paying TCP + auth +
+# backend fork on every call. Connections are now checked out of one pool per process.
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+logger = logging.getLogger("db")
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Connections idle for longer than this are pinged before being handed out
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))
+# Server-side statement timeout applied to every pooled connection (0 disables it)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+def connect(dsn: str = None, statement_timeout_ms: int = DB_STATEMENT_TIMEOUT_MS):
+    """
+    Open a standalone connection with the same settings as pooled ones.
+    For long-lived connections that shouldn't occupy a pool slot (e.g. LISTEN).
+    """
+    return psycopg2.connect(
+        dsn or os.getenv("DATABASE_URL"),
+        options=f"-c statement_timeout={statement_timeout_ms}"
+    )
+
+class ConnectionPool:
+    """
+    Thread-safe pool with blocking checkout, health checks and usage statistics.
+
+    psycopg2's ThreadedConnectionPool raises as soon as it is exhausted; a semaphore in
+    front of it makes callers wait up to `checkout_timeout` seconds for a slot instead.
+    """
+
+    def __init__(self, dsn: str, minconn: int = DB_POOL_MIN, maxconn: int = DB_POOL_MAX,
+                 statement_timeout_ms: int = DB_STATEMENT_TIMEOUT_MS,
+                 checkout_timeout: float = DB_POOL_TIMEOUT, ping_after: float = DB_POOL_PING_AFTER):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.ping_after = ping_after
+        self._pool = ThreadedConnectionPool(
+            minconn, maxconn, dsn, options=f"-c statement_timeout={statement_timeout_ms}"
+        )
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}  # id(conn) -> monotonic time it was returned
+
+        # Counters
+        self.checkouts = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def getconn(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            self.timeouts += 1
+            raise PoolError(f"No database connection available within {self.checkout_timeout}s")
+        try:
+            conn = self._pool.getconn()
+            if not self._is_healthy(conn):
+                self.discarded += 1
+                logger.warning("Discarding broken pooled connection")
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        self.checkouts += 1
+        self.wait_ms_total += wait_ms
+        self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        try:
+            if not conn.closed and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                # Never hand the next caller a connection with an open or failed transaction
+                conn.rollback()
+        except Exception:
+            close = True
+        close = close or bool(conn.closed)
+        if close:
+            self._last_used.pop(id(conn), None)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        # Only ping connections that sat idle long enough for the server or a proxy to drop them
+        last_used = self._last_used.get(id(conn))
+        if last_used is None or time.monotonic() - last_used < self.ping_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of a `with` block.
+        Uncommitted work is rolled back when the block exits.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        self._pool.closeall()
+
+    def stats(self) -> dict:
+        return {
+            "min_size": self.minconn,
+            "max_size": self.maxconn,
+            "in_use": len(self._pool._used),
+            "idle": len(self._pool._pool),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "discarded": self.discarded,
+            "avg_wait_ms": self.wait_ms_total / self.checkouts if self.checkouts else 0.0,
+            "max_wait_ms": self.wait_ms_max,
+        }
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """
+    Process-wide pool, created on first use. A forked worker gets its own pool
+    rather than sharing sockets with its parent.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(os.getenv("DATABASE_URL"))
+                _pool_pid = os.getpid()
+                logger.info(f"Created connection pool (min={_pool.minconn}, max={_pool.maxconn})")
+    return _pool
+
+def current_pool():
+    """
+    This process's pool if one has been created, else None. Never connects, so
+    monitoring endpoints can report on the pool while the database is down.
+    """
+    pool = _pool
+    return pool if pool is not None and _pool_pid == os.getpid() else None
+
+def get_conn():
+    """
+    Context manager yielding a pooled connection:
+
+        with get_conn() as conn:
+            ...
+    """
+    return get_pool().connection()
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
@@ -0,0 +1,240 @@
+# common/forest.py - Compiled tree-ensemble inference
+# Flattens a fitted sklearn forest into contiguous NumPy arrays and scores it with a
+# vectorized traversal, skipping sklearn's per-call validation and per-tree dispatch.
+
+import os
+import json
+import pickle
+import struct
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("forest")
+
+class CompiledForest:
+    """
+    A forest flattened into one node table shared by all trees.
+
+    Leaves point to themselves, so every row can be stepped `max_depth` times without
+    checking whether it has already reached a leaf. `value` holds per-leaf class
+    probabilities, already normalised the way DecisionTreeClassifier.predict_proba does.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, classes, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+        self.n_features_in_ = int(n_features)
+
+    def apply(self, X):
+        """
+        Leaf index reached in every tree, shape (n_trees, n_rows).
+        """
+        # sklearn evaluates trees on float32 inputs, so do the same to split identically
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])
+        nodes = np.repeat(self.roots[:, None], X.shape[0], axis=1)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X):
+        leaves = self.apply(X)
+        # Accumulate tree by tree, in the same order as sklearn, so results match bit for bit
+        proba = self.value[leaves[0]].copy()
+        for t in range(1, len(leaves)):
+            proba += self.value[leaves[t]]
+        proba /= len(leaves)
+        return proba
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+def compile_forest(model) -> CompiledForest:
+    """
+    Flatten a fitted single-output forest classifier (e.g. RandomForestClassifier).
+    Raises ValueError for models that can't be represented.
+    """
+    estimators = getattr(model, "estimators_", None)
+    if not estimators or not hasattr(model, "classes_"):
+        raise ValueError(f"{type(model).__name__} is not a fitted forest classifier")
+    if getattr(model, "n_outputs_", 1) != 1:
+        raise ValueError("Multi-output forests are not supported")
+
+    n_classes = len(model.classes_)
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for est in estimators:
+        tree = est.tree_
+        node_ids = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+
+        # Leaves loop back to themselves; internal nodes point into the shared table
+        left = np.where(is_leaf, node_ids, tree.children_left) + offset
+        right = np.where(is_leaf, node_ids, tree.children_right) + offset
+        feature = np.where(is_leaf, 0, tree.feature)
+
+        value = tree.value[:, 0, :n_classes].astype(np.float64)
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        value = value / normalizer
+
+        features.append(feature)
+        thresholds.append(tree.threshold)
+        lefts.append(left)
+        rights.append(right)
+        values.append(value)
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += tree.node_count
+
+    return CompiledForest(
+        feature=np.ascontiguousarray(np.concatenate(features), dtype=np.int32),
+        threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float64),
+        left=np.ascontiguousarray(np.concatenate(lefts), dtype=np.int32),
+        right=np.ascontiguousarray(np.concatenate(rights), dtype=np.int32),
+        value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+        roots=np.asarray(roots, dtype=np.int32),
+        max_depth=max_depth,
+        classes=np.asarray(model.classes_),
+        n_features=model.n_features_in_,
+    )
+
+def _probe_inputs(compiled: CompiledForest, n_rows: int = 256, seed: int = 0):
+    """
+    Synthetic rows spread across each feature's split thresholds, so the probe
+    exercises both sides of most splits.
+    """
+    rng = np.random.default_rng(seed)
+    X = np.empty((n_rows, compiled.n_features_in_))
+    is_split = compiled.left != np.arange(len(compiled.left))
+    for j in range(compiled.n_features_in_):
+        t = compiled.threshold[is_split & (compiled.feature == j)]
+        lo, hi = (t.min(), t.max()) if len(t) else (0.0, 1.0)
+        span = (hi - lo) or 1.0
+        X[:, j] = rng.uniform(lo - 0.1 * span, hi + 0.1 * span, n_rows)
+    return X
+
+def compile_model(model):
+    """
+    Return a CompiledForest for supported models, or the original model otherwise.
+    The compiled version is only used if it reproduces predict_proba on a probe batch.
+    """
+    try:
+        compiled = compile_forest(model)
+    except ValueError as e:
+        logger.info(f"Serving {type(model).__name__} without compilation: {e}")
+        return model
+
+    X = _probe_inputs(compiled)
+    if hasattr(model, "feature_names_in_"):
+        expected = model.predict_proba(pd.DataFrame(X, columns=model.feature_names_in_))
+    else:
+        expected = model.predict_proba(X)
+    # sklearn may sum trees in a different order when n_jobs > 1, hence the ulp-level tolerance
+    if not np.allclose(compiled.predict_proba(X), expected, rtol=0, atol=1e-12):
+        logger.warning(f"Compiled {type(model).__name__} disagrees with predict_proba; serving original model")
+        return model
+
+    logger.info(
+        f"Compiled {len(compiled.roots)} trees ({len(compiled.feature)} nodes, "
+        f"max depth {compiled.max_depth}) for vectorized inference"
+    )
+    return compiled
+
+# --- Memory-mappable artifact format ---
+# Layout: MAGIC | uint32 format version | uint32 header length | JSON header | arrays
+# Every array starts on a 64-byte boundary, so np.memmap can map it in place. Workers
+# that map the same file share one page-cache copy instead of each unpickling its own.
+
+FOREST_MAGIC = b"MLFOREST"
+FOREST_FORMAT_VERSION = 1
+FOREST_EXTENSION = ".forest"
+_ALIGN = 64
+_ARRAYS = ["feature", "threshold", "left", "right", "value", "roots"]
+
+def _aligned(n: int) -> int:
+    return (n + _ALIGN - 1) // _ALIGN * _ALIGN
+
+def save_forest(compiled: CompiledForest, path: str):
+    """
+    Write a CompiledForest in the mmap-able layout. Written to a temp file and renamed,
+    so a worker never maps a half-written artifact.
+    """
+    arrays = {name: np.ascontiguousarray(getattr(compiled, name)) for name in _ARRAYS}
+    header = {
+        "max_depth": compiled.max_depth,
+        "n_features": compiled.n_features_in_,
+        "classes": compiled.classes_.tolist(),
+        "classes_dtype": compiled.classes_.dtype.str,
+        "arrays": {},
+    }
+    # Offsets depend on the header size, so size the header with placeholder offsets first
+    for name, arr in arrays.items():
+        header["arrays"][name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": 0}
+    prefix = len(FOREST_MAGIC) + 8
+    header_len = _aligned(prefix + len(json.dumps(header)) + 32 * len(arrays)) - prefix
+    offset = prefix + header_len
+    for name, arr in arrays.items():
+        header["arrays"][name]["offset"] = offset
+        offset = _aligned(offset + arr.nbytes)
+    header_bytes = json.dumps(header).encode().ljust(header_len, b" ")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(FOREST_MAGIC)
+        f.write(struct.pack("<II", FOREST_FORMAT_VERSION, header_len))
+        f.write(header_bytes)
+        for name, arr in arrays.items():
+            f.seek(header["arrays"][name]["offset"])
+            f.write(arr.tobytes())
+    os.replace(tmp_path, path)
+
+def load_forest(path: str, mmap: bool = True) -> CompiledForest:
+    """
+    Map a .forest artifact. Arrays are read-only views onto the page cache when mmap=True.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(FOREST_MAGIC)) != FOREST_MAGIC:
+            raise ValueError(f"{path} is not a forest artifact")
+        version, header_len = struct.unpack("<II", f.read(8))
+        if version != FOREST_FORMAT_VERSION:
+            raise ValueError(f"Unsupported forest artifact version {version} in {path}")
+        header = json.loads(f.read(header_len))
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        if mmap:
+            # Plain ndarray view; it keeps the underlying memmap (and mapping) alive
+            arrays[name] = np.asarray(np.memmap(path, dtype=spec["dtype"], mode="r",
+                                                offset=spec["offset"], shape=tuple(spec["shape"])))
+        else:
+            count = int(np.prod(spec["shape"]))
+            arrays[name] = np.fromfile(path, dtype=spec["dtype"], count=count,
+                                       offset=spec["offset"]).reshape(spec["shape"])
+
+    return CompiledForest(
+        **arrays,
+        max_depth=header["max_depth"],
+        classes=np.asarray(header["classes"], dtype=header["classes_dtype"]),
+        n_features=header["n_features"],
+    )
+
+def load_model_artifact(filepath: str, compile: bool = True):
+    """
+    Load a model registered in model_versions: .forest artifacts are memory-mapped,
+    anything else is unpickled (and compiled when possible if `compile` is set).
+    """
+    if filepath.endswith(FOREST_EXTENSION):
+        return load_forest(filepath)
+    with open(filepath, "rb") as f:
+        model = pickle.load(f)
+    return compile_model(model) if compile else model
@@ -0,0 +1,159 @@
+# common/labels.py - Bulk ground-truth ingestion shared by the api endpoint and the eval CLI
+# Label batches (NDJSON or CSV, one label per line) are parsed as a stream, COPYed into a
+# temp staging table a chunk at a time, and merged into ground_truth with ON CONFLICT.
+# Labels for unknown request_ids are counted and sampled in the report instead of being
+# stored (ground_truth has no foreign key to the partitioned predictions table).
+
+import io
+import csv
+import json
+import time
+import uuid
+import logging
+
+logger = logging.getLogger("labels")
+
+FORMATS = ("ndjson", "csv")
+SAMPLE_SIZE = 10  # unknown ids / invalid lines echoed back in the report
+
+class LabelIngestor:
+    """
+    Streams label lines into ground_truth over one connection.
+
+        ingestor = LabelIngestor(conn, fmt="csv")
+        ingestor.feed(lines)      # any number of times
+        report = ingestor.finish()
+
+    Each chunk is merged and committed on its own, so a failure part-way through keeps
+    the chunks before it, and replaying a batch is harmless. Existing labels are never
+    overwritten: metric_buckets has already counted them, so changing one in place would
+    double count it (see eval/compute_metrics.py).
+    """
+
+    def __init__(self, conn, fmt: str = "ndjson", chunk_size: int = 50000):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported label format {fmt!r}, expected one of {FORMATS}")
+        self.conn = conn
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.cur = conn.cursor()
+        self.cur.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS ground_truth_ingest (
+                request_id UUID,
+                actual_class INTEGER
+            ) ON COMMIT DELETE ROWS
+        """)
+        # End the implicit transaction here so the first chunk doesn't run in one that
+        # started before any label was read
+        conn.commit()
+        self._columns = None  # CSV header positions of (request_id, actual_class)
+        self._line_no = 0
+        self._buf = io.StringIO()
+        self._buffered = 0
+        self._start = time.perf_counter()
+
+        # Report
+        self.lines = 0
+        self.inserted = 0
+        self.skipped = 0  # already labelled, or repeated within the batch
+        self.unknown = 0
+        self.invalid = 0
+        self.unknown_sample = []
+        self.invalid_sample = []
+
+    def _parse(self, line: str):
+        """
+        Returns (request_id, actual_class), or None for a header or blank line.
+        Raises ValueError for a malformed line.
+        """
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            return None
+        if self.fmt == "ndjson":
+            record = json.loads(line)
+            request_id, actual_class = record["request_id"], record["actual_class"]
+        else:
+            fields = next(csv.reader([line]))
+            if self._columns is None:
+                try:
+                    self._columns = (fields.index("request_id"), fields.index("actual_class"))
+                except ValueError:
+                    raise ValueError("CSV header must name request_id and actual_class columns") from None
+                return None
+            request_id, actual_class = (fields[i] for i in self._columns)
+
+        actual_class = int(actual_class)
+        if actual_class not in (0, 1):
+            raise ValueError(f"actual_class must be 0 or 1, got {actual_class}")
+        return str(uuid.UUID(str(request_id))), actual_class
+
+    def feed(self, lines):
+        for line in lines:
+            self._line_no += 1
+            try:
+                parsed = self._parse(line)
+            except (ValueError, KeyError, TypeError, IndexError) as e:
+                if self._columns is None and self.fmt == "csv":
+                    raise  # a bad header means nothing after it can be read
+                self.invalid += 1
+                if len(self.invalid_sample) < SAMPLE_SIZE:
+                    self.invalid_sample.append(f"line {self._line_no}: {e}")
+                continue
+            if parsed is None:
+                continue
+            self.lines += 1
+            self._buf.write(f"{parsed[0]},{parsed[1]}\n")
+            self._buffered += 1
+            if self._buffered >= self.chunk_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        self._buf.seek(0)
+        self.cur.copy_expert("COPY ground_truth_ingest (request_id, actual_class) FROM STDIN WITH (FORMAT csv)", self._buf)
+
+        self.cur.execute("""
+            SELECT s.request_id FROM ground_truth_ingest s
+            WHERE NOT EXISTS (SELECT 1 FROM predictions p WHERE p.request_id = s.request_id)
+        """)
+        unknown = self.cur.fetchall()
+        self.unknown += len(unknown)
+        self.unknown_sample.extend(str(r[0]) for r in unknown[:SAMPLE_SIZE - len(self.unknown_sample)])
+
+        # labeled_at is the merge time, not the column default (transaction start), so it
+        # stays close to when the rows become visible
+        self.cur.execute("""
+            INSERT INTO ground_truth (request_id, actual_class, labeled_at)
+            SELECT s.request_id, s.actual_class, clock_timestamp()::timestamp FROM ground_truth_ingest s
+            WHERE EXISTS (SELECT 1 FROM predictions p WHERE p.request_id = s.request_id)
+            ON CONFLICT (request_id) DO NOTHING
+        """)
+        self.inserted += self.cur.rowcount
+        self.skipped += self._buffered - len(unknown) - self.cur.rowcount
+        self.conn.commit()
+
+        self._buf = io.StringIO()
+        self._buffered = 0
+
+    def finish(self) -> dict:
+        self._flush()
+        self.cur.close()
+        seconds = time.perf_counter() - self._start
+        report = {
+            "format": self.fmt,
+            "rows": self.lines,
+            "inserted": self.inserted,
+            "skipped": self.skipped,
+            "unknown": self.unknown,
+            "invalid": self.invalid,
+            "unknown_sample": self.unknown_sample,
+            "invalid_sample": self.invalid_sample,
+            "seconds": round(seconds, 3),
+            "rows_per_sec": round(self.lines / seconds, 1) if seconds > 0 else 0.0,
+        }
+        logger.info(
+            f"Ingested {self.inserted}/{self.lines} labels ({self.skipped} skipped, {self.unknown} unknown, "
+            f"{self.invalid} invalid) in {seconds:.2f}s ({report['rows_per_sec']} rows/s)"
+        )
+        return report
@@ -0,0 +1,33 @@
+# common/rollups.py - Histogram layout of the prediction rollup tables (db/update_v10.sql)
+# Shared by the eval worker, which fills the rollups, and the dashboard, which reads
+# percentiles and distributions back out of them.
+
+import numpy as np
+
+# Upper bounds of the latency buckets; the last bucket is open-ended.
+# Changing these invalidates the latency_hist of existing rollup rows.
+LATENCY_BOUNDS_MS = [0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 50, 75, 100, 150, 200, 300, 500, 750, 1000, 2000, 5000]
+LATENCY_BUCKETS = len(LATENCY_BOUNDS_MS) + 1
+# prediction_prob bins of equal width over [0, 1]
+PROB_BINS = 20
+
+def histogram_quantile(counts, q: float, max_value: float = None) -> float:
+    """
+    Estimate a latency quantile from latency_hist counts, interpolating linearly inside
+    the bucket it falls in. `max_value` caps the open-ended last bucket.
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    total = counts.sum()
+    if total == 0:
+        return 0.0
+    rank = q * total
+    cumulative = np.cumsum(counts)
+    i = int(np.searchsorted(cumulative, rank, side="left"))
+    lower = LATENCY_BOUNDS_MS[i - 1] if i > 0 else 0.0
+    if i < len(LATENCY_BOUNDS_MS):
+        upper = LATENCY_BOUNDS_MS[i]
+    else:
+        upper = max_value if max_value is not None else lower
+    seen = cumulative[i - 1] if i > 0 else 0.0
+    estimate = lower + (upper - lower) * (rank - seen) / counts[i]
+    return min(estimate, max_value) if max_value is not None else estimate
@@ -1,47 +1,72 @@
 import streamlit as st
 import pandas as pd
-import psycopg2
-import os
 import plotly.express as px
 import time
+import numpy as np
+from common.rollups import PROB_BINS, histogram_quantile
+from data_layer import DashboardData, TIME_RANGES, resolution
 
 # Set page configuration
 st.set_page_config(page_title="ML Model Monitor", layout="wide")
 
-def get_db_connection():
-    return psycopg2.connect(os.getenv("DATABASE_URL"))
+# Traffic charts cover the last hour of minute rollups (eval/rollups.py)
+TRAFFIC_MINUTES = 60
 
-def load_data():
-    conn = get_db_connection()
-    
-    # 1. Fetch Metrics History
-    performance_query = """
-    SELECT window_end, metric_name, metric_value 
-    FROM metrics 
-    WHERE metric_name != 'drift_income_p_value'
-    ORDER BY window_end ASC
+@st.cache_resource
+def get_data_layer():
+    # One cache for every session in this Streamlit process: sessions share a single
+    # refresh per TTL, and each refresh only reads new rows (dashboard/data_layer.py)
+    return DashboardData(traffic_minutes=TRAFFIC_MINUTES)
+
+def load_data(time_range: str):
+    return get_data_layer().snapshot(time_range)
+
+def latency_percentiles(traffic_df):
     """
-    performance_df = pd.read_sql(performance_query, conn)
-    
-    # 2. Fetch Recent Predictions (Raw Logs)
-    preds_query = """
-    SELECT timestamp, prediction_prob, prediction_class 
-    FROM predictions 
-    ORDER BY timestamp DESC LIMIT 100
+    p50/p95/p99 latency per minute across all model versions, from the rollup histograms.
+    """
+    rows = []
+    for bucket_start, group in traffic_df.groupby('bucket_start'):
+        counts = np.sum(np.vstack(group['latency_hist'].to_numpy()), axis=0)
+        for q in (0.5, 0.95, 0.99):
+            rows.append({
+                'bucket_start': bucket_start,
+                'percentile': f"p{int(q * 100)}",
+                'latency_ms': histogram_quantile(counts, q, group['latency_max_ms'].max()),
+            })
+    return pd.DataFrame(rows)
+
+def version_summary(traffic_df):
     """
-    preds_df = pd.read_sql(preds_query, conn)
-
-    # 3. Fetch Drift History
-    drift_query = """
-    SELECT window_end, metric_name, metric_value 
-    FROM metrics 
-    WHERE metric_name = 'drift_income_p_value'
-    ORDER BY window_end ASC
+    Request volume, class balance, cache hits and latency per model version over the window.
     """
-    drift_df = pd.read_sql(drift_query, conn)
-    
-    conn.close()
-    return performance_df, drift_df, preds_df
+    rows = []
+    for version, group in traffic_df.groupby('model_version'):
+        requests = group['requests'].sum()
+        counts = np.sum(np.vstack(group['latency_hist'].to_numpy()), axis=0)
+        rows.append({
+            'model_version': version,
+            'requests': int(requests),
+            'positive_rate': group['positives'].sum() / requests,
+            'cache_hit_rate': group['cache_hits'].sum() / requests,
+            'avg_latency_ms': group['latency_sum_ms'].sum() / requests,
+            'p95_latency_ms': histogram_quantile(counts, 0.95, group['latency_max_ms'].max()),
+        })
+    return pd.DataFrame(rows)
+
+def probability_histogram(traffic_df):
+    """
+    prediction_prob distribution per model version, summed over the window.
+    """
+    edges = np.linspace(0, 1, PROB_BINS + 1)
+    rows = []
+    for version, group in traffic_df.groupby('model_version'):
+        counts = np.sum(np.vstack(group['prob_hist'].to_numpy()), axis=0)
+        rows.extend(
+            {'model_version': version, 'prediction_prob': (edges[i] + edges[i + 1]) / 2, 'requests': int(c)}
+            for i, c in enumerate(counts)
+        )
+    return pd.DataFrame(rows)
 
 # --- UI LAYOUT ---
 st.title("ML Model Monitoring Dashboard")
@@ -50,25 +75,31 @@ st.title("ML Model Monitoring Dashboard")
 # Default to True, but allow user to toggle off to save DB resources
 auto_refresh = st.toggle("Auto Refresh", value=True)
 
+# Metric and drift charts cover this range, downsampled to a bounded number of points
+time_range = st.radio("Time Range", list(TIME_RANGES), index=list(TIME_RANGES).index("7d"), horizontal=True)
+range_label = f"Last {time_range}, {int(resolution(TIME_RANGES[time_range]).total_seconds())}s buckets"
+
 # Placeholders for charts
 metrics_placeholder = st.empty()
 drift_placeholder = st.empty()
 
 while True:
     try:
-        performance_df, drift_df, preds_df = load_data()
+        performance_df, drift_df, traffic_df = load_data(time_range)
 
         # Update performance metrics & drift p-values chart 
     
         with metrics_placeholder.container():
-            st.header("Model Performance (Last 7 Days)")        
+            st.header(f"Model Performance ({range_label})")
             if not performance_df.empty:
                 # Create a Line Chart
                 fig = px.line(
                     performance_df, 
                     x='window_end', 
                     y='metric_value', 
-                    color='metric_name', 
+                    # One line per model version (shadow versions included), one panel per metric
+                    color='model_version',
+                    facet_row='metric_name',
                     markers=True,
                     title="Accuracy & F1 Score Over Time"
                 )
@@ -76,7 +107,7 @@ while True:
             else:
                 st.warning("No metrics found. The scheduler is likely still warming up.")
 
-            st.subheader("Data Drift Monitor (KS-Test P-Values) (Last 7 Days)")
+            st.subheader(f"Data Drift Monitor (KS-Test P-Values) ({range_label})")
             st.text("The KS-Test P-Values are the p-values of the KS-Test between the training data and the new data. A p-value < 0.05 indicates a significant drift.")
             
             if not drift_df.empty:
@@ -85,6 +116,8 @@ while True:
                     x='window_end', 
                     y='metric_value', 
                     color='metric_name',
+                    # Drift is scored per model version against its own training profile
+                    facet_row='model_version',
                     markers=True,
                     title="Data Drift P-Values (Target > 0.05)"
                 )
@@ -94,26 +127,48 @@ while True:
             else:
                 st.warning("No drift data found. The drift detection is likely still warming up.")
 
-        # Update drift & logs chart
+        # Update traffic charts
         with drift_placeholder.container():
-            st.subheader("Recent Traffic Analysis")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                if not preds_df.empty:
+            st.subheader(f"Recent Traffic Analysis (Last {TRAFFIC_MINUTES} Minutes)")
+            if traffic_df.empty:
+                st.warning("No traffic rollups found. The scheduler is likely still warming up.")
+            else:
+                col1, col2 = st.columns(2)
+
+                with col1:
+                    fig_requests = px.line(
+                        traffic_df,
+                        x='bucket_start',
+                        y='requests',
+                        color='model_version',
+                        markers=True,
+                        title="Requests per Minute"
+                    )
+                    st.plotly_chart(fig_requests, use_container_width=True)
+
+                    fig_latency = px.line(
+                        latency_percentiles(traffic_df),
+                        x='bucket_start',
+                        y='latency_ms',
+                        color='percentile',
+                        title="Latency Percentiles (ms)"
+                    )
+                    st.plotly_chart(fig_latency, use_container_width=True)
+
+                with col2:
                     # Histogram of Probabilities (Drift Detection)
-                    fig2 = px.histogram(
-                        preds_df, 
-                        x='prediction_prob', 
-                        nbins=20, 
-                        title="Prediction Probability Distribution (Last 100 Requests)",
+                    fig2 = px.bar(
+                        probability_histogram(traffic_df),
+                        x='prediction_prob',
+                        y='requests',
+                        color='model_version',
+                        title="Prediction Probability Distribution",
                         range_x=[0, 1]
                     )
                     st.plotly_chart(fig2, use_container_width=True)
-            
-            with col2:
-                st.caption("Latest Raw Logs")
-                st.dataframe(preds_df, height=300)
+
+                    st.caption("Per-Version Summary")
+                    st.dataframe(version_summary(traffic_df), height=300)
 
         if not auto_refresh:
             break
@@ -0,0 +1,196 @@
+# dashboard/data_layer.py - Process-wide, incrementally refreshed data for the dashboard
+# One DashboardData instance is shared by every browser session (st.cache_resource in
+# app.py). A snapshot older than the TTL triggers one refresh for everybody, and a
+# refresh only pulls rows newer than what is already held in memory.
+# Metric and drift series are downsampled in SQL to a resolution that depends on the
+# selected time range: each time bucket keeps its lowest and highest point, so a chart
+# never gets more than DASHBOARD_MAX_POINTS points per series but still shows every
+# spike and threshold crossing.
+
+import os
+import time
+import logging
+import threading
+import pandas as pd
+from datetime import timedelta
+from common.db import get_conn
+
+logger = logging.getLogger("dashboard.data")
+
+# Sessions share one snapshot for this long before it is refreshed
+DASHBOARD_TTL_SECONDS = float(os.getenv("DASHBOARD_TTL_SECONDS", "3"))
+# Upper bound on points per metric series in a chart (two per time bucket)
+DASHBOARD_MAX_POINTS = int(os.getenv("DASHBOARD_MAX_POINTS", "500"))
+# Incremental reads re-read the buckets covering at least this many seconds before the
+# newest one held, to pick up rows that committed late
+DASHBOARD_OVERLAP_SECONDS = int(os.getenv("DASHBOARD_OVERLAP_SECONDS", "60"))
+# Minute rollups keep growing until the rollup job's watermark passes them, so the
+# newest few minutes are re-read on every refresh
+ROLLUP_REFETCH_MINUTES = int(os.getenv("DASHBOARD_ROLLUP_REFETCH_MINUTES", "3"))
+
+TIME_RANGES = {
+    "1h": timedelta(hours=1),
+    "6h": timedelta(hours=6),
+    "24h": timedelta(days=1),
+    "7d": timedelta(days=7),
+    "30d": timedelta(days=30),
+    "90d": timedelta(days=90),
+}
+# Bucket widths to pick from, in seconds
+RESOLUTIONS = [15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400]
+
+METRIC_COLUMNS = ["bucket", "window_end", "model_version", "metric_name", "metric_value"]
+TRAFFIC_COLUMNS = ["model_version", "bucket_start", "requests", "positives", "cache_hits",
+                   "latency_sum_ms", "latency_max_ms", "latency_hist", "prob_hist"]
+
+# Performance metrics exclude drift and backtest rows; %% because the queries take parameters
+PERFORMANCE_FILTER = r"metric_name NOT LIKE 'drift\_%%' AND metric_name NOT LIKE 'backtest\_%%'"
+DRIFT_FILTER = r"metric_name LIKE 'drift\_%%\_p\_value'"
+
+def resolution(time_range: timedelta, max_points: int = DASHBOARD_MAX_POINTS) -> timedelta:
+    """
+    The narrowest bucket width that keeps a series of `time_range` within `max_points`.
+    """
+    seconds = time_range.total_seconds() / max(max_points // 2, 1)
+    return timedelta(seconds=next((r for r in RESOLUTIONS if r >= seconds), RESOLUTIONS[-1]))
+
+def downsampled_metrics_query(name_filter: str) -> str:
+    """
+    Per model version, metric and time bucket, the rows with the lowest and the highest
+    value (one row if they coincide), keeping their own timestamps. Versions are kept
+    apart so a shadow model's dip never shows up on the production series.
+    """
+    return f"""
+        WITH bucketed AS (
+            SELECT
+                date_bin(%(step)s, window_end, TIMESTAMP '2000-01-01') AS bucket,
+                window_end, model_version, metric_name, metric_value
+            FROM metrics
+            WHERE {name_filter} AND window_end >= %(since)s
+        ), ranked AS (
+            SELECT *,
+                row_number() OVER (
+                    PARTITION BY model_version, metric_name, bucket ORDER BY metric_value ASC, window_end
+                ) AS lowest,
+                row_number() OVER (
+                    PARTITION BY model_version, metric_name, bucket ORDER BY metric_value DESC, window_end
+                ) AS highest
+            FROM bucketed
+        )
+        SELECT bucket, window_end, model_version, metric_name, metric_value
+        FROM ranked
+        WHERE lowest = 1 OR highest = 1
+        ORDER BY window_end ASC
+    """
+
+class DashboardData:
+    """
+    Cached metric, drift and traffic frames with a TTL.
+
+        data = DashboardData(traffic_minutes=60)
+        performance_df, drift_df, traffic_df = data.snapshot("7d")
+
+    Metric and drift series are cached per time range (see TIME_RANGES), downsampled to
+    that range's resolution. Concurrent callers of an expired snapshot wait for the
+    single refresh in flight instead of each querying the database.
+    """
+
+    def __init__(self, traffic_minutes: int, ttl_seconds: float = DASHBOARD_TTL_SECONDS,
+                 max_points: int = DASHBOARD_MAX_POINTS):
+        self.traffic_minutes = traffic_minutes
+        self.ttl_seconds = ttl_seconds
+        self.max_points = max_points
+
+        self.series = {}    # time range -> {"performance": df, "drift": df}
+        self.traffic_df = pd.DataFrame(columns=TRAFFIC_COLUMNS)
+        self._refreshed_at = {}     # time range (or "traffic") -> monotonic time
+        self._lock = threading.Lock()
+
+        # Counters
+        self.refreshes = 0
+        self.hits = 0
+        self.rows_fetched = 0
+        self.last_refresh_ms = 0.0
+
+    def snapshot(self, time_range: str = "7d"):
+        """
+        (performance_df, drift_df, traffic_df) for `time_range`, refreshed first if older
+        than the TTL.
+        """
+        if time_range not in TIME_RANGES:
+            raise ValueError(f"Invalid time range: {time_range} (expected one of {list(TIME_RANGES)})")
+        with self._lock:
+            stale = [key for key in (time_range, "traffic") if self._is_stale(key)]
+            if stale:
+                self._refresh(stale)
+            else:
+                self.hits += 1
+            series = self.series[time_range]
+            return series["performance"], series["drift"], self.traffic_df
+
+    def _is_stale(self, key: str) -> bool:
+        refreshed_at = self._refreshed_at.get(key)
+        return refreshed_at is None or time.monotonic() - refreshed_at >= self.ttl_seconds
+
+    def _refresh(self, keys: list):
+        start = time.perf_counter()
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT LOCALTIMESTAMP")
+            now = cur.fetchone()[0]
+            cur.close()
+            for key in keys:
+                if key == "traffic":
+                    self.traffic_df = self._refresh_traffic(conn, self.traffic_df, now)
+                else:
+                    held = self.series.get(key, {})
+                    self.series[key] = {
+                        kind: self._refresh_series(conn, held.get(kind), name_filter, TIME_RANGES[key], now)
+                        for kind, name_filter in (("performance", PERFORMANCE_FILTER), ("drift", DRIFT_FILTER))
+                    }
+                self._refreshed_at[key] = time.monotonic()
+        self.refreshes += 1
+        self.last_refresh_ms = (time.perf_counter() - start) * 1000
+        logger.debug(f"Dashboard data refreshed in {self.last_refresh_ms:.1f}ms: {self.stats()}")
+
+    def _refresh_series(self, conn, df: pd.DataFrame, name_filter: str, time_range: timedelta, now) -> pd.DataFrame:
+        horizon = now - time_range
+        step = resolution(time_range, self.max_points)
+        if df is None or df.empty:
+            since = horizon
+        else:
+            # Re-read the newest bucket held (it may still be filling) and enough before it
+            # to cover the overlap
+            buckets_back = -(-DASHBOARD_OVERLAP_SECONDS // int(step.total_seconds()))
+            since = max(horizon, df["bucket"].max() - step * buckets_back)
+        new = pd.read_sql(downsampled_metrics_query(name_filter), conn, params={"step": step, "since": since})
+        self.rows_fetched += len(new)
+        if df is not None and not df.empty:
+            # Re-read buckets replace the copies held in memory
+            df = df[df["bucket"] < since]
+            new = pd.concat([df, new], ignore_index=True) if not df.empty else new
+        return new[new["window_end"] > horizon].reset_index(drop=True)
+
+    def _refresh_traffic(self, conn, df: pd.DataFrame, now) -> pd.DataFrame:
+        horizon = now - pd.Timedelta(minutes=self.traffic_minutes)
+        since = horizon if df.empty else max(horizon, df["bucket_start"].max() - pd.Timedelta(minutes=ROLLUP_REFETCH_MINUTES))
+        new = pd.read_sql(f"""
+            SELECT {", ".join(TRAFFIC_COLUMNS)}
+            FROM prediction_rollups_minute
+            WHERE bucket_start >= %(since)s
+            ORDER BY bucket_start ASC
+        """, conn, params={"since": since})
+        self.rows_fetched += len(new)
+        # Re-read buckets replace the copies held in memory
+        df = df[(df["bucket_start"] > horizon) & (df["bucket_start"] < since)]
+        return pd.concat([df, new], ignore_index=True) if not df.empty else new
+
+    def stats(self) -> dict:
+        return {
+            "refreshes": self.refreshes,
+            "hits": self.hits,
+            "rows_fetched": self.rows_fetched,
+            "last_refresh_ms": self.last_refresh_ms,
+            "series_rows": {key: {kind: len(df) for kind, df in series.items()} for key, series in self.series.items()},
+            "traffic_rows": len(self.traffic_df),
+        }
@@ -0,0 +1,31 @@
+-- Pre-aggregated traffic rollups per model version, maintained incrementally by the eval
+-- worker (eval/rollups.py) so the dashboard never scans raw predictions.
+-- latency_hist counts requests per latency bucket (bounds in common/rollups.py) and
+-- prob_hist per 0.05-wide prediction_prob bin; both add up across buckets, so a longer
+-- window is just a sum.
+CREATE TABLE IF NOT EXISTS prediction_rollups_minute (
+    model_version VARCHAR(50) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    requests BIGINT NOT NULL,
+    positives BIGINT NOT NULL,
+    cache_hits BIGINT NOT NULL,
+    latency_sum_ms DOUBLE PRECISION NOT NULL,
+    latency_max_ms DOUBLE PRECISION NOT NULL,
+    latency_hist BIGINT[] NOT NULL,
+    prob_hist BIGINT[] NOT NULL,
+    PRIMARY KEY (model_version, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS prediction_rollups_hour (LIKE prediction_rollups_minute INCLUDING ALL);
+
+CREATE INDEX IF NOT EXISTS idx_prediction_rollups_minute_bucket_start ON prediction_rollups_minute (bucket_start);
+CREATE INDEX IF NOT EXISTS idx_prediction_rollups_hour_bucket_start ON prediction_rollups_hour (bucket_start);
+
+-- Element-wise sum of two histograms, for additive upserts
+CREATE OR REPLACE FUNCTION rollup_array_add(a BIGINT[], b BIGINT[]) RETURNS BIGINT[] AS $$
+    SELECT array_agg(COALESCE(x, 0) + COALESCE(y, 0) ORDER BY i)
+    FROM unnest(a, b) WITH ORDINALITY AS t(x, y, i)
+$$ LANGUAGE sql IMMUTABLE;
+
+-- The dashboard reads recent metrics history by time
+CREATE INDEX IF NOT EXISTS idx_metrics_window_end ON metrics (window_end);
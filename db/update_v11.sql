@@ -0,0 +1,17 @@
+-- One row per eval job run (eval/jobs.py): how long it took, how many rows it
+-- processed, and whether it succeeded, failed or was skipped because the previous run
+-- was still going. `trigger` is "schedule", "coalesced", or the upstream job that
+-- triggered it.
+CREATE TABLE IF NOT EXISTS job_runs (
+    id BIGSERIAL PRIMARY KEY,
+    job_name VARCHAR(50) NOT NULL,
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP,
+    duration_ms DOUBLE PRECISION NOT NULL,
+    rows_processed BIGINT,
+    status VARCHAR(10) NOT NULL,
+    error TEXT,
+    trigger VARCHAR(50)
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_runs_job_started ON job_runs(job_name, started_at);
@@ -0,0 +1,20 @@
+-- Commit-ordered watermarks for the incremental eval jobs (eval/db_utils.py).
+-- Timestamps are assigned when a row is created, not when it becomes visible, so a
+-- writer that committed after a job's timestamp watermark had passed it left its rows
+-- behind for good. Rows now record the ID of the transaction that wrote them, and a job
+-- only advances to the oldest transaction still running: everything below that has
+-- committed (or aborted) already.
+--
+-- Rows written before this migration have no ingest_xid. They are picked up by each
+-- job's last timestamp watermark, once, on its first run after the migration.
+
+ALTER TABLE predictions ADD COLUMN IF NOT EXISTS ingest_xid xid8;
+ALTER TABLE predictions ALTER COLUMN ingest_xid SET DEFAULT pg_current_xact_id();
+CREATE INDEX IF NOT EXISTS idx_predictions_ingest_xid ON predictions (ingest_xid);
+
+ALTER TABLE ground_truth ADD COLUMN IF NOT EXISTS ingest_xid xid8;
+ALTER TABLE ground_truth ALTER COLUMN ingest_xid SET DEFAULT pg_current_xact_id();
+CREATE INDEX IF NOT EXISTS idx_ground_truth_ingest_xid ON ground_truth (ingest_xid);
+
+-- NULL = not run since this migration; `watermark` then holds the timestamp it reached
+ALTER TABLE job_watermarks ADD COLUMN IF NOT EXISTS xid_watermark xid8;
@@ -0,0 +1,15 @@
+-- Push model promotions to the API instead of having it poll model_versions.
+-- The API LISTENs on 'model_promoted' and hot-reloads as soon as a version becomes active.
+CREATE OR REPLACE FUNCTION notify_model_promoted() RETURNS trigger AS $$
+BEGIN
+    IF NEW.is_active AND (TG_OP = 'INSERT' OR NOT COALESCE(OLD.is_active, FALSE)) THEN
+        PERFORM pg_notify('model_promoted', NEW.version);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS model_promoted_trigger ON model_versions;
+CREATE TRIGGER model_promoted_trigger
+    AFTER INSERT OR UPDATE OF is_active ON model_versions
+    FOR EACH ROW EXECUTE FUNCTION notify_model_promoted();
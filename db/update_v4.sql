@@ -0,0 +1,2 @@
+-- Flag predictions answered from the API's prediction cache instead of by the model
+ALTER TABLE predictions ADD COLUMN IF NOT EXISTS cache_hit BOOLEAN NOT NULL DEFAULT FALSE;
@@ -0,0 +1,18 @@
+-- Shadow scoring: candidate versions flagged is_shadow are scored by the API on a
+-- sample of live traffic, and their predictions are kept apart from production ones.
+ALTER TABLE model_versions ADD COLUMN IF NOT EXISTS is_shadow BOOLEAN NOT NULL DEFAULT FALSE;
+
+-- No foreign key to predictions: the production row is written asynchronously and
+-- may not exist yet when the shadow row lands.
+CREATE TABLE IF NOT EXISTS shadow_predictions (
+    request_id UUID NOT NULL,
+    model_version VARCHAR(50) NOT NULL,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    prediction_prob FLOAT NOT NULL,
+    prediction_class INTEGER NOT NULL,
+    latency_ms FLOAT NOT NULL,
+    PRIMARY KEY (request_id, model_version)
+);
+
+CREATE INDEX IF NOT EXISTS idx_shadow_predictions_version_timestamp
+    ON shadow_predictions (model_version, timestamp);
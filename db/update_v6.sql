@@ -0,0 +1,24 @@
+-- Incremental metrics: confusion-matrix counts per model version per minute of
+-- prediction time. Each metrics run folds in only rows labelled since the last run,
+-- and windowed accuracy/F1 are summed from these buckets.
+CREATE TABLE IF NOT EXISTS metric_buckets (
+    model_version VARCHAR(50) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    tp BIGINT NOT NULL DEFAULT 0,
+    fp BIGINT NOT NULL DEFAULT 0,
+    tn BIGINT NOT NULL DEFAULT 0,
+    fn BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (model_version, bucket_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_metric_buckets_bucket_start ON metric_buckets (bucket_start);
+
+-- High-water marks for incremental eval jobs (NULL = never run)
+CREATE TABLE IF NOT EXISTS job_watermarks (
+    job_name VARCHAR(50) PRIMARY KEY,
+    watermark TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Incremental runs scan ground_truth by labelling time
+CREATE INDEX IF NOT EXISTS idx_ground_truth_labeled_at ON ground_truth (labeled_at);
@@ -0,0 +1,3 @@
+-- Drift reference profile computed from the training data when a version is trained
+-- (per-feature quantiles, decile bin edges and bin proportions; see eval/drift.py).
+ALTER TABLE model_versions ADD COLUMN IF NOT EXISTS reference_profile JSONB;
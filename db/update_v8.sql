@@ -0,0 +1,16 @@
+-- Streaming drift: one mergeable KLL quantile sketch per model version, feature and
+-- hour of prediction time (see eval/sketch.py). Filled incrementally from the
+-- predictions table; drift over longer windows merges the hourly sketches.
+CREATE TABLE IF NOT EXISTS feature_sketches (
+    model_version VARCHAR(50) NOT NULL,
+    feature VARCHAR(50) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    n BIGINT NOT NULL,
+    sketch JSONB NOT NULL,
+    PRIMARY KEY (model_version, feature, bucket_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_feature_sketches_bucket_start ON feature_sketches (bucket_start);
+
+-- Incremental runs scan predictions by arrival time
+CREATE INDEX IF NOT EXISTS idx_predictions_timestamp ON predictions (timestamp);
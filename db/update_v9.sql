@@ -0,0 +1,73 @@
+-- Partition predictions by day. Old days are removed by dropping their partition
+-- (eval/partitions.py) instead of DELETE, and every timestamp-bounded eval query only
+-- touches the partitions it needs. The features also get typed columns next to the
+-- JSON, so readers don't have to parse input_data.
+--
+-- Existing rows stay in predictions_legacy until `python -m eval.partitions backfill`
+-- copies them across a day at a time.
+
+-- A foreign key can't reference a partitioned table unless the key includes the
+-- partition column, so ground_truth loses its FK. Unknown ids are screened at ingestion
+-- instead (common/labels.py).
+ALTER TABLE ground_truth DROP CONSTRAINT IF EXISTS ground_truth_request_id_fkey;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'predictions'::regclass) THEN
+        ALTER TABLE predictions RENAME TO predictions_legacy;
+        ALTER INDEX IF EXISTS predictions_pkey RENAME TO predictions_legacy_pkey;
+        ALTER INDEX IF EXISTS idx_predictions_timestamp RENAME TO idx_predictions_legacy_timestamp;
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS predictions (
+    request_id UUID NOT NULL,
+    model_version VARCHAR(20) NOT NULL,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    input_data JSONB NOT NULL,
+    income DOUBLE PRECISION,
+    debt DOUBLE PRECISION,
+    credit_score INTEGER,
+    prediction_prob FLOAT NOT NULL,
+    prediction_class INTEGER NOT NULL,
+    latency_ms FLOAT NOT NULL,
+    cache_hit BOOLEAN NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (request_id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Catches rows outside every daily partition (e.g. if partition maintenance stopped)
+CREATE TABLE IF NOT EXISTS predictions_default PARTITION OF predictions DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_predictions_timestamp ON predictions (timestamp);
+CREATE INDEX IF NOT EXISTS idx_predictions_version_timestamp ON predictions (model_version, timestamp);
+-- Label joins look predictions up by request_id alone
+CREATE INDEX IF NOT EXISTS idx_predictions_request_id ON predictions (request_id);
+
+-- Create the partition for one day (predictions_pYYYYMMDD) if it doesn't exist yet.
+-- Rows for that day that already landed in the default partition are moved into it.
+CREATE OR REPLACE FUNCTION create_prediction_partition(day DATE) RETURNS TEXT AS $$
+DECLARE
+    partition_name TEXT := 'predictions_p' || to_char(day, 'YYYYMMDD');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM predictions_default WHERE timestamp >= day AND timestamp < day + 1) THEN
+        EXECUTE format('CREATE TABLE %I (LIKE predictions INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+        EXECUTE format(
+            'WITH moved AS (DELETE FROM predictions_default WHERE timestamp >= %L AND timestamp < %L RETURNING *) '
+            'INSERT INTO %I SELECT * FROM moved',
+            day, day + 1, partition_name);
+        EXECUTE format('ALTER TABLE predictions ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+            partition_name, day, day + 1);
+    ELSE
+        EXECUTE format('CREATE TABLE %I PARTITION OF predictions FOR VALUES FROM (%L) TO (%L)',
+            partition_name, day, day + 1);
+    END IF;
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Today and the coming week; eval/partitions.py keeps creating them ahead of time
+SELECT create_prediction_partition(CURRENT_DATE + i) FROM generate_series(0, 7) AS i;
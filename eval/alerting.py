@@ -1,31 +1,281 @@
+# eval/alerting.py - Non-blocking, deduplicating alert dispatch
+# Callers only enqueue their alert; a background thread sends it through a sink (Discord
+# webhook, file or in-memory) with timeouts and retries. An alert whose key was already
+# sent within the cooldown is suppressed, and alerts raised close together are sent as
+# one digest message.
+
 import os
-import requests
+import json
+import time
+import queue
+import atexit
 import logging
+import threading
+from collections import deque
+from datetime import datetime
+import requests
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger("alerting")
 
-def send_discord_alert(message: str):
+# "webhook" (Discord, needs DISCORD_WEBHOOK_URL), "file" (ALERT_FILE_PATH) or "memory"
+ALERT_SINK = os.getenv("ALERT_SINK", "webhook")
+ALERT_FILE_PATH = os.getenv("ALERT_FILE_PATH", "alerts.ndjson")
+# An alert key fires at most once per cooldown; repeats in between are counted instead
+ALERT_COOLDOWN_SECONDS = float(os.getenv("ALERT_COOLDOWN_SECONDS", "900"))
+# Alerts raised within this many seconds of each other go out as one digest
+ALERT_DIGEST_SECONDS = float(os.getenv("ALERT_DIGEST_SECONDS", "5"))
+ALERT_QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", "100"))
+ALERT_TIMEOUT_SECONDS = float(os.getenv("ALERT_TIMEOUT_SECONDS", "5"))
+ALERT_MAX_RETRIES = int(os.getenv("ALERT_MAX_RETRIES", "3"))
+ALERT_BACKOFF_SECONDS = float(os.getenv("ALERT_BACKOFF_SECONDS", "1"))
+# Discord rejects messages longer than this
+MAX_MESSAGE_CHARS = 2000
+
+# --- Sinks ---
+
+class WebhookSink:
     """
-    Sends an alert to a Discord channel.
-    Requires the following environment variables:
-    - DISCORD_WEBHOOK_URL: The URL of the Discord webhook
+    Posts messages to a Discord webhook over one reused HTTP session.
     """
 
-    # Get the webhook URL from the environment variable
-    webhook_url = os.getenv("DISCORD_WEBHOOK_URL")
-    # Check if the environment variable is set
-    if not webhook_url:
-        logger.error("DISCORD_WEBHOOK_URL is not set")
-        return
-    
-    payload = {
-        "content": message
-    }
-    
-    try:
-        response = requests.post(webhook_url, json=payload)
+    def __init__(self, url: str, timeout: float = ALERT_TIMEOUT_SECONDS):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def send(self, message: str):
+        response = self.session.post(self.url, json={"content": message}, timeout=self.timeout)
+        if response.status_code == 429:
+            # Rate limited: wait as long as Discord asks before the retry
+            retry_after = float(response.headers.get("Retry-After", ALERT_BACKOFF_SECONDS))
+            time.sleep(min(retry_after, 60))
         response.raise_for_status()
         logger.info(f"Alert sent to Discord: {response.status_code}")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Failed to send alert to Discord: {e}")
\ No newline at end of file
+
+class FileSink:
+    """
+    Appends each message to an NDJSON file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, message: str):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"sent_at": datetime.now().isoformat(), "message": message}) + "\n")
+
+class MemorySink:
+    """
+    Keeps the last `max_messages` messages in `messages`. For tests and offline runs.
+    """
+
+    def __init__(self, max_messages: int = 1000):
+        self.messages = deque(maxlen=max_messages)
+
+    def send(self, message: str):
+        self.messages.append(message)
+
+# --- Dispatcher ---
+
+class AlertDispatcher:
+    """
+    Bounded alert queue drained by a background sender thread.
+
+    `alert()` never blocks: an alert is suppressed if its key fired within
+    `cooldown_seconds`, and dropped if the queue is full. The sender waits
+    `digest_seconds` after the first queued alert and sends everything gathered by then
+    as one message (split at MAX_MESSAGE_CHARS). Failed sends are retried
+    `max_retries` times with exponential backoff.
+    """
+
+    def __init__(self, sink, max_queue: int = ALERT_QUEUE_SIZE, cooldown_seconds: float = ALERT_COOLDOWN_SECONDS,
+                 digest_seconds: float = ALERT_DIGEST_SECONDS, max_retries: int = ALERT_MAX_RETRIES,
+                 backoff_seconds: float = ALERT_BACKOFF_SECONDS):
+        self.sink = sink
+        self.cooldown_seconds = cooldown_seconds
+        self.digest_seconds = digest_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._last_fired = {}   # key -> monotonic time it was last queued
+        self._suppressed = {}   # key -> repeats suppressed since then
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters
+        self.queued = 0
+        self.suppressed = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self.digests = 0
+
+    # --- Producer side ---
+
+    def alert(self, message: str, key: str = None) -> bool:
+        """
+        Queue an alert. Alerts with the same `key` (default: the message itself) are
+        deduplicated within the cooldown. Returns whether the alert was queued.
+        """
+        key = key or message
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_fired.get(key)
+            if last is not None and now - last < self.cooldown_seconds:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                self.suppressed += 1
+                logger.info(f"Suppressed repeat of alert {key!r} (cooldown {self.cooldown_seconds:g}s)")
+                return False
+            repeats = self._suppressed.pop(key, 0)
+            if repeats:
+                message += f"\n_({repeats} repeats suppressed since the last one)_"
+            try:
+                self._queue.put_nowait(message)
+            except queue.Full:
+                self.dropped += 1
+                logger.warning(f"Alert queue full, dropped alert {key!r}")
+                return False
+            self._last_fired[key] = now
+            self.queued += 1
+        return True
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Alert dispatcher started ({type(self.sink).__name__}, cooldown={self.cooldown_seconds:g}s, "
+                    f"digest={self.digest_seconds:g}s)")
+
+    def stop(self, timeout: float = 30.0):
+        """
+        Send everything still queued and stop the sender thread.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Alert dispatcher did not finish within {timeout}s ({self.queue_depth()} alerts still queued)")
+        self._thread = None
+        logger.info(f"Alert dispatcher stopped: {self.stats()}")
+
+    # --- Consumer side (sender thread) ---
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._collect()
+            if batch:
+                for message in self._digest(batch):
+                    self._send(message)
+
+    def _collect(self) -> list:
+        """
+        Wait for the first alert, then gather more for digest_seconds.
+        """
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = 0 if self._stop.is_set() else time.monotonic() + self.digest_seconds
+        while True:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _digest(self, batch: list) -> list:
+        """
+        Combine alerts into as few messages as fit within MAX_MESSAGE_CHARS.
+        """
+        if len(batch) == 1:
+            return [batch[0][:MAX_MESSAGE_CHARS]]
+        self.digests += 1
+        header = f"📣 **{len(batch)} alerts**\n"
+        messages, current = [], header
+        for alert in batch:
+            part = "\n" + alert[:MAX_MESSAGE_CHARS - len(header) - 2] + "\n"
+            if len(current) + len(part) > MAX_MESSAGE_CHARS and current != header:
+                messages.append(current)
+                current = header
+            current += part
+        messages.append(current)
+        return messages
+
+    def _send(self, message: str):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.sink.send(message)
+                self.sent += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    logger.error(f"Failed to send alert after {attempt + 1} attempts: {e}")
+                    return
+                delay = self.backoff_seconds * 2 ** attempt
+                logger.warning(f"Alert send failed ({e}), retrying in {delay:g}s")
+                time.sleep(delay)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth(),
+            "queued": self.queued,
+            "suppressed": self.suppressed,
+            "dropped": self.dropped,
+            "sent": self.sent,
+            "failed": self.failed,
+            "digests": self.digests,
+        }
+
+# --- Process-wide dispatcher ---
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def make_sink(kind: str = ALERT_SINK):
+    if kind == "webhook":
+        webhook_url = os.getenv("DISCORD_WEBHOOK_URL")
+        return WebhookSink(webhook_url) if webhook_url else None
+    if kind == "file":
+        return FileSink(ALERT_FILE_PATH)
+    if kind == "memory":
+        return MemorySink()
+    raise ValueError(f"Invalid ALERT_SINK: {kind} (expected webhook, file or memory)")
+
+def get_dispatcher():
+    """
+    The dispatcher shared by every job in this process, started on first use and
+    drained at exit. None when no sink is configured.
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            sink = make_sink()
+            if sink is None:
+                return None
+            _dispatcher = AlertDispatcher(sink)
+            _dispatcher.start()
+            atexit.register(_dispatcher.stop)
+        return _dispatcher
+
+def send_discord_alert(message: str, key: str = None) -> bool:
+    """
+    Queue an alert for the configured sink (Discord by default) without waiting for it
+    to be delivered. Requires the following environment variables for Discord:
+    - DISCORD_WEBHOOK_URL: The URL of the Discord webhook
+    """
+    dispatcher = get_dispatcher()
+    if dispatcher is None:
+        logger.error("DISCORD_WEBHOOK_URL is not set")
+        return False
+    return dispatcher.alert(message, key)
@@ -0,0 +1,294 @@
+# eval/backtest.py - Replay recent labelled traffic through the active and candidate models
+# Labelled predictions from the last BACKTEST_DAYS days (and only those logged after
+# every compared model's training data ends) are cut into slices of
+# BACKTEST_STEP_HOURS, scored in parallel on a process pool, and summed into rolling
+# windows of BACKTEST_WINDOW_HOURS (overlapping when the step is shorter). Each worker
+# reads its own slice with COPY and scores it with batched predict_proba calls. Per
+# window and model: accuracy, F1, Brier score, expected calibration error and scoring
+# latency. Results go to the metrics table (backtest_*) and to
+# model_versions.metrics_json["backtest"].
+#
+#   python -m eval.backtest [--candidate v1.0.3] [--days 7] [--window-hours 6] [--workers 8]
+
+import io
+import os
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from common.db import connect
+from common.forest import load_model_artifact
+from eval.db_utils import get_db_conn
+from eval.drift import FEATURES
+from eval.compute_metrics import scores_from_confusion
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("backtest")
+
+BACKTEST_DAYS = int(os.getenv("BACKTEST_DAYS", "7"))
+BACKTEST_WINDOW_HOURS = int(os.getenv("BACKTEST_WINDOW_HOURS", "6"))
+BACKTEST_STEP_HOURS = int(os.getenv("BACKTEST_STEP_HOURS", str(BACKTEST_WINDOW_HOURS)))
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", str(os.cpu_count() or 4)))
+# Rows per predict_proba call; bounds a worker's scratch memory on very large slices
+BACKTEST_BATCH_SIZE = int(os.getenv("BACKTEST_BATCH_SIZE", "250000"))
+CALIBRATION_BINS = 10
+
+# --- Worker process state (set by _init_worker) ---
+_models = {}
+_conn = None
+
+def _init_worker(model_paths: dict):
+    global _models, _conn
+    _models = {version: load_model_artifact(path) for version, path in model_paths.items()}
+    # One long-lived connection per worker; slice reads can take a while
+    _conn = connect(statement_timeout_ms=0)
+
+def _read_slice(start: datetime, end: datetime) -> pd.DataFrame:
+    query = _conn.cursor().mogrify(f"""
+        SELECT {", ".join(f"p.{f}" for f in FEATURES)}, g.actual_class
+        FROM predictions p
+        JOIN ground_truth g ON g.request_id = p.request_id
+        WHERE p.timestamp >= %s AND p.timestamp < %s
+          AND {" AND ".join(f"p.{f} IS NOT NULL" for f in FEATURES)}
+    """, (start, end)).decode()
+    buf = io.StringIO()
+    cur = _conn.cursor()
+    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", buf)
+    cur.close()
+    _conn.commit()
+    buf.seek(0)
+    return pd.read_csv(buf, header=None, names=FEATURES + ["actual_class"], dtype=np.float64)
+
+def _score(model, X: np.ndarray):
+    """
+    Probability of class 1 for every row, in BACKTEST_BATCH_SIZE batches, and the
+    seconds spent inside predict_proba.
+    """
+    probs = np.empty(len(X), dtype=np.float64)
+    elapsed = 0.0
+    for lo in range(0, len(X), BACKTEST_BATCH_SIZE):
+        batch = X[lo:lo + BACKTEST_BATCH_SIZE]
+        if hasattr(model, "feature_names_in_"):
+            # sklearn models fitted on a DataFrame warn when given a bare array
+            batch = pd.DataFrame(batch, columns=FEATURES)
+        start = time.perf_counter()
+        probs[lo:lo + len(batch)] = model.predict_proba(batch)[:, 1]
+        elapsed += time.perf_counter() - start
+    return probs, elapsed
+
+def _slice_stats(y: np.ndarray, probs: np.ndarray, seconds: float) -> dict:
+    """
+    Additive statistics for one model on one slice, so slices can be summed into
+    windows and an overall result.
+    """
+    pred = probs > 0.5
+    actual = y == 1
+    bins = np.minimum((probs * CALIBRATION_BINS).astype(np.int64), CALIBRATION_BINS - 1)
+    return {
+        "rows": int(len(y)),
+        "tp": int(np.sum(pred & actual)),
+        "fp": int(np.sum(pred & ~actual)),
+        "tn": int(np.sum(~pred & ~actual)),
+        "fn": int(np.sum(~pred & actual)),
+        "brier_sum": float(np.sum((probs - y) ** 2)),
+        "bin_count": np.bincount(bins, minlength=CALIBRATION_BINS).tolist(),
+        "bin_prob_sum": np.bincount(bins, weights=probs, minlength=CALIBRATION_BINS).tolist(),
+        "bin_actual_sum": np.bincount(bins, weights=y, minlength=CALIBRATION_BINS).tolist(),
+        "seconds": seconds,
+    }
+
+def score_slice(time_slice: tuple) -> tuple:
+    start, end = time_slice
+    df = _read_slice(start, end)
+    if df.empty:
+        return time_slice, {}
+    X = df[FEATURES].to_numpy()
+    y = df["actual_class"].to_numpy()
+    results = {}
+    for version, model in _models.items():
+        probs, seconds = _score(model, X)
+        results[version] = _slice_stats(y, probs, seconds)
+    return time_slice, results
+
+def summarize(stats: dict) -> dict:
+    accuracy, f1 = scores_from_confusion(stats["tp"], stats["fp"], stats["tn"], stats["fn"])
+    counts = np.asarray(stats["bin_count"], dtype=np.float64)
+    gaps = np.abs(np.asarray(stats["bin_prob_sum"]) - np.asarray(stats["bin_actual_sum"]))
+    return {
+        "rows": stats["rows"],
+        "accuracy": accuracy,
+        "f1_score": f1,
+        "brier": stats["brier_sum"] / stats["rows"],
+        # Expected calibration error: per-bin |mean prob - positive rate|, weighted by bin size
+        "ece": float(gaps.sum() / counts.sum()),
+        "latency_us_per_row": stats["seconds"] / stats["rows"] * 1e6,
+    }
+
+def _add(total: dict, stats: dict) -> dict:
+    if not total:
+        return dict(stats)
+    return {
+        key: [a + b for a, b in zip(total[key], value)] if isinstance(value, list) else total[key] + value
+        for key, value in stats.items()
+    }
+
+def make_slices(start: datetime, end: datetime, hours: int) -> list:
+    """
+    Consecutive (start, end) slices of `hours` ending at `end` and fitting after `start`,
+    oldest first.
+    """
+    count = int((end - start) / timedelta(hours=hours))
+    return [(end - timedelta(hours=hours * (i + 1)), end - timedelta(hours=hours * i)) for i in range(count)][::-1]
+
+def load_models_to_compare(candidates: list = None) -> dict:
+    """
+    {version: (filepath, training_cutoff)} for the active model and the candidates (by
+    default the most recently created inactive version). The cutoff is the newest
+    traffic a model may have been trained on: metrics_json.training.data_until, or
+    created_at for versions registered without it. None for synthetic training data.
+    """
+    columns = """
+        version, filepath,
+        CASE WHEN metrics_json->'training'->>'data_source' = 'synthetic' THEN NULL
+             ELSE COALESCE((metrics_json->'training'->>'data_until')::timestamp, created_at)
+        END
+    """
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {columns} FROM model_versions WHERE is_active = TRUE")
+        rows = cur.fetchall()
+        if candidates:
+            cur.execute(f"SELECT {columns} FROM model_versions WHERE version = ANY(%s)", (list(candidates),))
+        else:
+            cur.execute(f"""
+                SELECT {columns} FROM model_versions
+                WHERE is_active = FALSE ORDER BY created_at DESC LIMIT 1
+            """)
+        rows += cur.fetchall()
+        cur.close()
+    return {version: (filepath, cutoff) for version, filepath, cutoff in rows}
+
+def run_backtest(candidates: list = None, days: int = BACKTEST_DAYS, window_hours: int = BACKTEST_WINDOW_HOURS,
+                 step_hours: int = BACKTEST_STEP_HOURS, workers: int = BACKTEST_WORKERS) -> dict:
+    for name, value in (("days", days), ("window_hours", window_hours), ("step_hours", step_hours), ("workers", workers)):
+        if value <= 0:
+            raise ValueError(f"Invalid {name}: {value} (must be positive)")
+    if window_hours % step_hours:
+        raise ValueError(f"window_hours ({window_hours}) must be a multiple of step_hours ({step_hours})")
+
+    compared = load_models_to_compare(candidates)
+    if not compared:
+        logger.warning("No model versions to backtest.")
+        return {}
+    models = {version: filepath for version, (filepath, _) in compared.items()}
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT LOCALTIMESTAMP")
+        end = cur.fetchone()[0]
+        cur.execute("SELECT version FROM model_versions WHERE is_active = TRUE")
+        active = next((row[0] for row in cur.fetchall()), None)
+        cur.close()
+
+    # Only replay traffic that none of the models was trained on, or the comparison
+    # would score a candidate on its own training rows
+    replay_from = end - timedelta(days=days)
+    cutoffs = {version: cutoff for version, (_, cutoff) in compared.items() if cutoff is not None}
+    if cutoffs:
+        newest = max(cutoffs, key=cutoffs.get)
+        if cutoffs[newest] > replay_from:
+            replay_from = cutoffs[newest]
+            logger.info(f"Replaying traffic after {replay_from}, when {newest}'s training data ends")
+    # Each slice is read and scored once; a window is the sum of its consecutive slices
+    slices = make_slices(replay_from, end, step_hours)
+    per_window_slices = window_hours // step_hours
+    if len(slices) < per_window_slices:
+        logger.warning(f"Only {end - replay_from} of out-of-sample traffic since {replay_from}, less than one "
+                       f"{window_hours}h window. Not backtesting; run again once more traffic is labelled.")
+        return {}
+    logger.info(f"Backtesting {', '.join(models)} over {max(len(slices) - per_window_slices + 1, 0)} windows "
+                f"of {window_hours}h on {workers} workers (active: {active})")
+
+    start = time.perf_counter()
+    # spawn: workers must not inherit the parent's pooled connections
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(models,)) as pool:
+        slice_results = list(pool.map(score_slice, slices))
+    elapsed = time.perf_counter() - start
+
+    per_window = []
+    totals = {version: {} for version in models}
+    for i in range(len(slice_results)):
+        for version, stats in slice_results[i][1].items():
+            totals[version] = _add(totals[version], stats)
+        if i + 1 < per_window_slices:
+            continue
+        window = slice_results[i + 1 - per_window_slices:i + 1]
+        for version in models:
+            stats = {}
+            for _, results in window:
+                if version in results:
+                    stats = _add(stats, results[version])
+            if stats:
+                per_window.append((version, window[0][0][0], window[-1][0][1], summarize(stats)))
+
+    summaries = {version: summarize(stats) for version, stats in totals.items() if stats}
+    if not summaries:
+        logger.warning(f"No labelled predictions since {replay_from}, nothing to backtest.")
+        return {}
+    for version, summary in summaries.items():
+        logger.info(f"[{version}] {summary}")
+    logger.info(f"Backtest finished in {elapsed:.1f}s ({summaries[next(iter(summaries))]['rows']} rows)")
+
+    save_backtest(per_window, summaries, active, {
+        "window_days": days, "replay_from": replay_from.isoformat(), "window_hours": window_hours, "step_hours": step_hours,
+        "windows": len({(ws, we) for _, ws, we, _ in per_window}), "evaluated_at": end.isoformat(), "seconds": round(elapsed, 1),
+    })
+    return summaries
+
+def save_backtest(per_window: list, summaries: dict, active: str, run_info: dict):
+    metrics_to_insert = [
+        (f"backtest_{name}", value, version, window_start, window_end)
+        for version, window_start, window_end, summary in per_window
+        for name, value in summary.items() if name != "rows"
+    ]
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        execute_values(cur, """
+            INSERT INTO metrics (metric_name, metric_value, model_version, window_start, window_end)
+            VALUES %s
+        """, metrics_to_insert)
+        for version, summary in summaries.items():
+            backtest = dict(summary, **run_info, baseline=active)
+            if active in summaries and version != active:
+                backtest["vs_baseline"] = {
+                    name: summary[name] - summaries[active][name]
+                    for name in ("accuracy", "f1_score", "brier", "ece")
+                }
+            cur.execute("""
+                UPDATE model_versions
+                SET metrics_json = COALESCE(metrics_json, '{}'::jsonb) || jsonb_build_object('backtest', %s::jsonb)
+                WHERE version = %s
+            """, (json.dumps(backtest), version))
+        conn.commit()
+        cur.close()
+    logger.info(f"Saved {len(metrics_to_insert)} backtest metrics for {len(summaries)} versions")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest candidate models against the active one on recent labelled traffic.")
+    parser.add_argument("--candidate", action="append", help="Version to compare (repeatable; default: latest inactive version)")
+    parser.add_argument("--days", type=int, default=BACKTEST_DAYS)
+    parser.add_argument("--window-hours", type=int, default=BACKTEST_WINDOW_HOURS)
+    parser.add_argument("--step-hours", type=int, default=None, help="Defaults to --window-hours (no overlap)")
+    parser.add_argument("--workers", type=int, default=BACKTEST_WORKERS)
+    args = parser.parse_args()
+
+    run_backtest(
+        candidates=args.candidate, days=args.days, window_hours=args.window_hours,
+        step_hours=args.step_hours or args.window_hours, workers=args.workers,
+    )
@@ -1,60 +1,169 @@
+import os
 import pandas as pd
-from sklearn.metrics import accuracy_score, f1_score
 from psycopg2.extras import execute_values
 import logging
-from eval.db_utils import get_db_conn  # Importing our shared tool
+from eval.db_utils import get_db_conn, lock_watermark, new_rows_filter, set_watermark  # Importing our shared tool
 from eval.alerting import send_discord_alert
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger("metrics_compute")
 
+WATERMARK_JOB = "metric_buckets"
+WINDOW_DAYS = 7
+THRESHOLD_ACCURACY = 0.8
+THRESHOLD_F1 = 0.8
+
+def update_metric_buckets(conn):
+    """
+    Fold labels committed since the last run into metric_buckets (per model version and
+    minute of prediction time), for production and shadow predictions alike. The
+    aggregation runs in Postgres and the watermark advances in the same transaction.
+    Returns the number of labelled predictions folded in.
+    """
+    cur = conn.cursor()
+    bounds = lock_watermark(cur, WATERMARK_JOB)
+
+    cur.execute(f"""
+        INSERT INTO metric_buckets (model_version, bucket_start, tp, fp, tn, fn)
+        SELECT
+            p.model_version,
+            date_trunc('minute', p.timestamp),
+            COUNT(*) FILTER (WHERE p.prediction_class = 1 AND g.actual_class = 1),
+            COUNT(*) FILTER (WHERE p.prediction_class = 1 AND g.actual_class = 0),
+            COUNT(*) FILTER (WHERE p.prediction_class = 0 AND g.actual_class = 0),
+            COUNT(*) FILTER (WHERE p.prediction_class = 0 AND g.actual_class = 1)
+        FROM ground_truth g
+        JOIN (
+            SELECT request_id, model_version, timestamp, prediction_class FROM predictions
+            UNION ALL
+            SELECT request_id, model_version, timestamp, prediction_class FROM shadow_predictions
+        ) p ON p.request_id = g.request_id
+        WHERE {new_rows_filter("g", "labeled_at")}
+        GROUP BY 1, 2
+        ON CONFLICT (model_version, bucket_start) DO UPDATE SET
+            tp = metric_buckets.tp + EXCLUDED.tp,
+            fp = metric_buckets.fp + EXCLUDED.fp,
+            tn = metric_buckets.tn + EXCLUDED.tn,
+            fn = metric_buckets.fn + EXCLUDED.fn
+        RETURNING tp + fp + tn + fn
+    """, bounds)
+    folded = sum(row[0] for row in cur.fetchall())
+
+    set_watermark(cur, WATERMARK_JOB, bounds)
+    conn.commit()
+    cur.close()
+    return folded
+
+def window_confusion(conn, days: int = WINDOW_DAYS):
+    """
+    Sum the confusion-matrix buckets for the last `days` days of predictions, per
+    model version. Only one row of counts per version leaves the database.
+    Returns {model_version: (tp, fp, tn, fn, is_shadow)}.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT b.model_version, SUM(b.tp), SUM(b.fp), SUM(b.tn), SUM(b.fn),
+               COALESCE(BOOL_OR(v.is_shadow AND NOT v.is_active), FALSE)
+        FROM metric_buckets b
+        LEFT JOIN model_versions v ON v.version = b.model_version
+        WHERE b.bucket_start > LOCALTIMESTAMP - make_interval(days => %s)
+        GROUP BY b.model_version
+    """, (days,))
+    confusion = {
+        version: (int(tp), int(fp), int(tn), int(fn), is_shadow)
+        for version, tp, fp, tn, fn, is_shadow in cur.fetchall()
+    }
+    cur.close()
+    return confusion
+
+def scores_from_confusion(tp: int, fp: int, tn: int, fn: int):
+    """
+    Accuracy and F1 (positive class 1) from confusion counts, matching sklearn's
+    accuracy_score and f1_score (0.0 when F1 is undefined).
+    """
+    total = tp + fp + tn + fn
+    acc = (tp + tn) / total if total else 0.0
+    f1 = 2 * tp / (2 * tp + fp + fn) if (2 * tp + fp + fn) else 0.0
+    return acc, f1
+
 # Define the function to compute and save the metrics
-def compute_and_save_metrics():
-    # Get a database connection using the utility function.
-    conn = get_db_conn()
-    
-    # 1. Fetch data (Predictions + Ground Truth) from the last 7 days
-    query = """
-        SELECT 
-            p.prediction_class,
-            g.actual_class
-        FROM predictions p
-        JOIN ground_truth g ON p.request_id = g.request_id
-        WHERE p.timestamp > NOW() - INTERVAL '7 days' 
+def compute_and_save_metrics() -> int:
     """
-    THRESHOLD_ACCURACY = 0.8
-    THRESHOLD_F1 = 0.8
+    Fold new labels in and save accuracy/F1 for every model version. Alerting is a
+    separate step (alert_on_degradation) that reads what this saved.
+    Returns the number of labelled predictions folded in.
+    """
+    # 1. Fold newly labelled rows into the buckets, then sum the last 7 days of buckets
+    with get_db_conn() as conn:
+        folded = update_metric_buckets(conn)
+        logger.info(f"Folded {folded} newly labelled rows into metric buckets")
+        confusion = window_confusion(conn)
 
-    logger.info("Fetching data for evaluation from the last 7 days...")
-    df = pd.read_sql(query, conn)
-    
-    if df.empty:
+    if not confusion:
         logger.warning("No matched data found! (Did you run simulate_ground_truth.py to label the predictions?)")
-        return
-
-    # 2. Compute Metrics
-    acc = accuracy_score(df['actual_class'], df['prediction_class'])
-    f1 = f1_score(df['actual_class'], df['prediction_class'])
-    
-    logger.info(f"Computed Metrics -> Accuracy: {acc:.4f}, F1: {f1:.4f}")
-    
-    # 3. Save to DB
+        return folded
+
+    # 2. Compute Metrics (per model version)
+    window_end = pd.Timestamp.now()
+    window_start = window_end - pd.Timedelta(days=WINDOW_DAYS)
+    metrics_to_insert = []
+
+    for model_version, (tp, fp, tn, fn, is_shadow) in sorted(confusion.items()):
+        acc, f1 = scores_from_confusion(tp, fp, tn, fn)
+        kind = "shadow" if is_shadow else "production"
+        logger.info(f"Computed Metrics [{model_version}, {kind}, n={tp + fp + tn + fn}] -> Accuracy: {acc:.4f}, F1: {f1:.4f}")
+
+        metrics_to_insert.append(('accuracy', float(acc), model_version, window_start, window_end))
+        metrics_to_insert.append(('f1_score', float(f1), model_version, window_start, window_end))
+
+    # 3. Save to DB: every version's metrics in one batch
     insert_query = """
         INSERT INTO metrics (metric_name, metric_value, model_version, window_start, window_end)
         VALUES %s
     """
-    
-    window_end = pd.Timestamp.now()
-    window_start = window_end - pd.Timedelta(days=7)
-    model_version = "v1.0.0" 
-    
-    # 4. Alerting
-    # Check if the accuracy is below the threshold
-    if acc < THRESHOLD_ACCURACY or f1 < THRESHOLD_F1:
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        execute_values(cur, insert_query, metrics_to_insert)
+        conn.commit()
+        cur.close()
+    logger.info(f"Metrics saved successfully for {len(confusion)} model versions.")
+    return folded
+
+def alert_on_degradation() -> int:
+    """
+    Check the most recently saved accuracy/F1 of each model version against the
+    thresholds and alert for production versions below them.
+    Returns the number of alerts sent.
+    """
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT m.model_version, m.window_start, m.window_end,
+                   MAX(m.metric_value) FILTER (WHERE m.metric_name = 'accuracy'),
+                   MAX(m.metric_value) FILTER (WHERE m.metric_name = 'f1_score'),
+                   COALESCE(BOOL_OR(v.is_shadow AND NOT v.is_active), FALSE)
+            FROM metrics m
+            LEFT JOIN model_versions v ON v.version = m.model_version
+            WHERE m.metric_name IN ('accuracy', 'f1_score')
+              AND m.window_end = (SELECT MAX(window_end) FROM metrics WHERE metric_name = 'accuracy')
+            GROUP BY 1, 2, 3
+        """)
+        latest = cur.fetchall()
+        cur.close()
+
+    alerts = 0
+    for model_version, window_start, window_end, acc, f1, is_shadow in latest:
+        # Check if the accuracy is below the threshold
+        if acc >= THRESHOLD_ACCURACY and f1 >= THRESHOLD_F1:
+            continue
         if acc < THRESHOLD_ACCURACY:
-            logger.warning(f"Accuracy is below {THRESHOLD_ACCURACY} threshold: {acc:.4f}")
+            logger.warning(f"[{model_version}] Accuracy is below {THRESHOLD_ACCURACY} threshold: {acc:.4f}")
         if f1 < THRESHOLD_F1:
-            logger.warning(f"F1 score is below {THRESHOLD_F1} threshold: {f1:.4f}")
+            logger.warning(f"[{model_version}] F1 score is below {THRESHOLD_F1} threshold: {f1:.4f}")
+
+        # Shadow candidates don't serve traffic, so they are logged but not paged on
+        if is_shadow:
+            continue
 
         alert_message = (
             f"🚨 **Model Performance Degradation Alert** 🚨\n"
@@ -67,20 +176,10 @@ def compute_and_save_metrics():
             f"Window End: {window_end}\n"
             f"**Action:** Check for data leakage."
         )
-        send_discord_alert(alert_message)
-
-
-    metrics_to_insert = [
-        ('accuracy', float(acc), model_version, window_start, window_end),
-        ('f1_score', float(f1), model_version, window_start, window_end)
-    ]
-    
-    cur = conn.cursor()
-    execute_values(cur, insert_query, metrics_to_insert)
-    conn.commit()
-    cur.close()
-    conn.close()
-    logger.info("Metrics saved successfully.")
+        send_discord_alert(alert_message, key=f"degradation:{model_version}")
+        alerts += 1
+    return alerts
 
 if __name__ == "__main__":
-    compute_and_save_metrics()
\ No newline at end of file
+    compute_and_save_metrics()
+    alert_on_degradation()
@@ -1,31 +1,35 @@
 # eval/db_utils.py - Utility functions for database operations
 # Used to get a database connection to avoid repeating code for evaluation scripts.
-# Also in case we need pooled connections, we can use this utility function to get a connection.
+# Connections come from the pool shared with the api and dashboard (common/db.py).
 
-import os
 import re
-import psycopg2
+from common.db import get_conn
 
 def get_db_conn():
-    return psycopg2.connect(os.getenv("DATABASE_URL"))
+    """
+    Check out a pooled connection. Use as a context manager:
+
+        with get_db_conn() as conn:
+            ...
+    """
+    return get_conn()
 
 def get_latest_version():
     """
     Query database for the latest version string.
     Returns None if no versions exist.
     """
-    conn = get_db_conn()
-    cur = conn.cursor()
-    
-    # Get the latest version (by created_at, not just highest version string)
-    cur.execute("""
-        SELECT version FROM model_versions 
-        ORDER BY created_at DESC 
-        LIMIT 1
-    """)
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+
+        # Get the latest version (by created_at, not just highest version string)
+        cur.execute("""
+            SELECT version FROM model_versions 
+            ORDER BY created_at DESC 
+            LIMIT 1
+        """)
+        row = cur.fetchone()
+        cur.close()
     
     if not row:
         return None
@@ -88,4 +92,45 @@ def get_next_version():
         import logging
         logger = logging.getLogger(__name__)
         logger.warning(f"Error parsing version {latest_version}: {e}, defaulting to v1.0.0")
-        return "v1.0.0"
\ No newline at end of file
+        return "v1.0.0"
+def lock_watermark(cur, job_name):
+    """
+    Lock an incremental job's watermark for the rest of the transaction, so two runs of
+    the same job can't overlap, and return the bounds of the rows written since its
+    last run as query parameters for new_rows_filter():
+    - lower: ingest_xid the last run reached (None if it hasn't run since db/update_v12.sql)
+    - upper: the oldest transaction still running; every row below it has committed
+    - legacy: the timestamp watermark from before db/update_v12.sql (None = never run)
+    """
+    # Before anything in this transaction takes a transaction ID of its own
+    cur.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())")
+    upper = cur.fetchone()[0]
+    cur.execute("""
+        INSERT INTO job_watermarks (job_name) VALUES (%s)
+        ON CONFLICT (job_name) DO NOTHING
+    """, (job_name,))
+    cur.execute("SELECT xid_watermark, watermark FROM job_watermarks WHERE job_name = %s FOR UPDATE", (job_name,))
+    lower, legacy = cur.fetchone()
+    return {"lower": lower, "upper": upper, "legacy": legacy}
+
+def new_rows_filter(alias: str, legacy_column: str) -> str:
+    """
+    SQL condition for rows of `alias` written between the bounds from lock_watermark().
+    Rows written before db/update_v12.sql (no ingest_xid) are selected by
+    `legacy_column` against the old timestamp watermark, on the first run only.
+    """
+    return f"""(
+        ({alias}.ingest_xid < %(upper)s AND (%(lower)s::xid8 IS NULL OR {alias}.ingest_xid >= %(lower)s))
+        OR ({alias}.ingest_xid IS NULL AND %(lower)s::xid8 IS NULL
+            AND (%(legacy)s::timestamp IS NULL OR {alias}.{legacy_column} > %(legacy)s))
+    )"""
+
+def set_watermark(cur, job_name, bounds):
+    """
+    Advance a job's watermark to the upper bound from lock_watermark(). Commit together
+    with the job's writes.
+    """
+    cur.execute("""
+        UPDATE job_watermarks SET xid_watermark = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE job_name = %s
+    """, (bounds["upper"], job_name))
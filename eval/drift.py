@@ -1,76 +1,312 @@
-# Since we don't have real training data yet, we simulate it by generating random data.
-import pandas as pd
-import numpy as np
+# eval/drift.py - Multi-feature drift detection against each model version's training profile
+# The reference profile (quantiles, decile bins, bin proportions and a KLL sketch per
+# feature) is computed once in retrain.py and stored in model_versions.reference_profile.
+# Live traffic is summarised into hourly KLL sketches per feature (feature_sketches),
+# folded in incrementally; drift over an hour, a day or a week merges those sketches.
+import os
 import json
-from scipy.stats import ks_2samp
-from psycopg2.extras import execute_values
 import logging
-from eval.db_utils import get_db_conn
+import numpy as np
+import pandas as pd
+from scipy.stats import kstwo
+from scipy.spatial.distance import jensenshannon
+from psycopg2.extras import execute_values
+from api.schemas import PredictionRequest
+from eval.db_utils import get_db_conn, lock_watermark, new_rows_filter, set_watermark
+from eval.sketch import KLLSketch
 from eval.alerting import send_discord_alert
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger("drift_detection")
 
 # --- CONFIGURATION ---
-# We simulate the "Training Data" statistics for INCOME.
-# Assumption: In training, average income was $55k.
-threshold = 0.05
-REFERENCE_INCOME = np.random.normal(55000, 15000, 1000)
-
-def detect_drift():
-    conn = get_db_conn()
-    
-    # 1. Fetch Recent Data (Inputs and Outputs)
-    query = """
-        SELECT input_data, prediction_prob 
-        FROM predictions 
-        ORDER BY timestamp DESC 
-        LIMIT 100
-    """
-    df = pd.read_sql(query, conn)
-    
-    if len(df) < 50:
-        logger.info("Not enough data to run drift detection (<50 samples).")
-        return
-
-    # 2. Extract 'income' from the JSON column 'input_data'
-    try:
-        # Create a new column 'income' by extracting it from the JSON
-        df['income'] = df['input_data'].apply(lambda x: x['income'] if isinstance(x, dict) else json.loads(x)['income'])
-    except Exception as e:
-        logger.error(f"Failed to parse input_data JSON: {e}")
-        return
-
-    # 3. Run KS Test on INCOME (Input Drift)
-    # "Is the Income distribution of the last 100 applicants different from training?"
-    statistic, p_value = ks_2samp(REFERENCE_INCOME, df['income'])
-    
-    logger.info(f"Drift Check (Income) -> P-Value: {p_value:.5f}")
-    
-    # 4. Save Metric to DB
+# Every model input plus the model's output score
+FEATURES = list(PredictionRequest.model_fields)
+DRIFT_COLUMNS = FEATURES + ["prediction_prob"]
+
+threshold = 0.05  # KS p-value
+PSI_THRESHOLD = float(os.getenv("DRIFT_PSI_THRESHOLD", "0.2"))
+# Windows to score, in hours (hour, day and week by default)
+DRIFT_WINDOW_HOURS = [int(h) for h in os.getenv("DRIFT_WINDOW_HOURS", "1,24,168").split(",")]
+DRIFT_MIN_ROWS = int(os.getenv("DRIFT_MIN_ROWS", "50"))
+# PSI is biased upwards in small samples (about (bins - 1) / n with no drift at all), so
+# it only flags a window with at least this many rows; below it the KS test decides alone
+PSI_MIN_ROWS = int(os.getenv("DRIFT_PSI_MIN_ROWS", "500"))
+
+SKETCH_JOB = "feature_sketches"
+SKETCH_FETCH_SIZE = 50000  # rows per round trip while folding new predictions in
+
+PROFILE_BINS = 10        # shared PSI/JS bins: reference deciles
+PROFILE_QUANTILES = 101  # reference CDF for profiles stored without a sketch
+REFERENCE_SKETCH_K = 1000  # stored once per version, so it can afford to be precise
+PSI_EPSILON = 1e-4       # floor for empty bins
+
+def _bin_counts(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """
+    Histogram every column of `values` (n, f) at once against its own interior bin
+    edges (f, bins - 1). Returns counts of shape (f, bins).
+    """
+    n_features, n_bins = edges.shape[0], edges.shape[1] + 1
+    idx = (values[:, :, None] >= edges[None, :, :]).sum(axis=2)
+    flat = idx + np.arange(n_features) * n_bins
+    return np.bincount(flat.ravel(), minlength=n_features * n_bins).reshape(n_features, n_bins)
+
+def build_reference_profile(df: pd.DataFrame, bins: int = PROFILE_BINS) -> dict:
+    """
+    Summarise training data for later drift checks. `df` holds one column per feature
+    (and optionally prediction_prob). The result is JSON-serialisable.
+    """
+    values = df.to_numpy(dtype=np.float64)
+    quantiles = np.quantile(values, np.linspace(0, 1, PROFILE_QUANTILES), axis=0)
+    edges = np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1], axis=0).T
+    proportions = _bin_counts(values, edges) / len(values)
+
+    profile = {"n": len(values), "bins": bins, "features": {}}
+    for i, name in enumerate(df.columns):
+        sketch = KLLSketch(k=REFERENCE_SKETCH_K)
+        sketch.update(values[:, i])
+        profile["features"][name] = {
+            "quantiles": quantiles[:, i].tolist(),
+            "edges": edges[i].tolist(),
+            "proportions": proportions[i].tolist(),
+            "sketch": sketch.to_dict(),
+        }
+    return profile
+
+def update_feature_sketches(conn) -> int:
+    """
+    Fold predictions committed since the last run into the hourly feature sketches. New
+    rows are streamed through a server-side cursor and read exactly once; touched
+    sketches are merged with their stored versions and upserted, and the watermark
+    advances in the same transaction. Returns the number of predictions folded in.
+    """
+    cur = conn.cursor()
+    bounds = lock_watermark(cur, SKETCH_JOB)
+
+    # Typed feature columns (db/update_v9.sql), no JSON parsing
+    columns = ", ".join(FEATURES)
+    scan = conn.cursor(name="feature_sketch_scan")
+    scan.itersize = SKETCH_FETCH_SIZE
+    scan.execute(f"""
+        SELECT model_version, date_trunc('hour', timestamp), {columns}, prediction_prob
+        FROM predictions
+        WHERE {new_rows_filter("predictions", "timestamp")}
+    """, bounds)
+
+    sketches = {}  # (model_version, feature, bucket_start) -> KLLSketch
+    folded = 0
+    while True:
+        chunk = scan.fetchmany(SKETCH_FETCH_SIZE)
+        if not chunk:
+            break
+        folded += len(chunk)
+        df = pd.DataFrame(chunk, columns=["model_version", "bucket_start"] + DRIFT_COLUMNS)
+        for (model_version, bucket_start), group in df.groupby(["model_version", "bucket_start"]):
+            for feature in DRIFT_COLUMNS:
+                key = (model_version, feature, bucket_start)
+                sketches.setdefault(key, KLLSketch()).update(group[feature].to_numpy(dtype=np.float64))
+    scan.close()
+
+    if sketches:
+        # Late rows for an hour that already has a sketch merge into it
+        cur.execute("""
+            SELECT model_version, feature, bucket_start, sketch FROM feature_sketches
+            WHERE (model_version, feature, bucket_start) IN %s
+        """, (tuple(sketches),))
+        for model_version, feature, bucket_start, stored in cur.fetchall():
+            sketches[(model_version, feature, bucket_start)].merge(KLLSketch.from_dict(stored))
+
+        execute_values(cur, """
+            INSERT INTO feature_sketches (model_version, feature, bucket_start, n, sketch)
+            VALUES %s
+            ON CONFLICT (model_version, feature, bucket_start) DO UPDATE SET
+                n = EXCLUDED.n,
+                sketch = EXCLUDED.sketch
+        """, [(*key, sketch.n, json.dumps(sketch.to_dict())) for key, sketch in sketches.items()])
+
+    set_watermark(cur, SKETCH_JOB, bounds)
+    conn.commit()
+    cur.close()
+    return folded
+
+def load_window_sketches(conn, hours: int) -> pd.DataFrame:
+    """
+    Stored sketches for every hour bucket overlapping the last `hours` hours.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT model_version, feature, bucket_start, sketch FROM feature_sketches
+        WHERE bucket_start > LOCALTIMESTAMP - make_interval(hours => %s + 1)
+    """, (hours,))
+    rows = cur.fetchall()
+    cur.close()
+    return pd.DataFrame(rows, columns=["model_version", "feature", "bucket_start", "sketch"])
+
+def _reference_cdf(ref: dict):
+    """
+    Returns (cdf(x, inclusive), breakpoints, rank error) for one feature of a reference
+    profile.
+    """
+    if "sketch" in ref:
+        sketch = KLLSketch.from_dict(ref["sketch"])
+        return sketch.cdf, sketch.points(), sketch.rank_error()
+    # Profiles stored before sketches existed: interpolate the quantile grid
+    quantiles = np.asarray(ref["quantiles"])
+    grid = np.linspace(0, 1, len(quantiles))
+    return (lambda x, inclusive=True: np.interp(x, quantiles, grid)), quantiles, 0.0
+
+def sketch_drift_scores(profile: dict, sketches: dict) -> pd.DataFrame:
+    """
+    KS statistic and p-value, PSI and Jensen-Shannon distance between the reference
+    profile and a {feature: KLLSketch} summary of live traffic. Returns one row per
+    feature present in both.
+    """
+    names = [c for c in DRIFT_COLUMNS if c in profile["features"] and c in sketches]
+    ks, n, resolution = [], [], []
+    actual = []
+    for name in names:
+        ref, window = profile["features"][name], sketches[name]
+        ref_cdf, ref_points, ref_error = _reference_cdf(ref)
+        # Both CDFs are step functions, so the supremum is at one of their breakpoints.
+        # The sketches' own rank error is taken off so it doesn't read as drift at large n.
+        points = np.union1d(ref_points, window.points())
+        distance = np.abs(window.cdf(points) - ref_cdf(points)).max()
+        error = window.rank_error() + ref_error
+        ks.append(max(0.0, distance - error))
+        n.append(window.n)
+        # The sketches can't resolve CDF differences finer than their rank error, so the
+        # test gets no more power than a sample of about (1 / error)^2 would give
+        resolution.append(1 / error ** 2 if error > 0 else np.inf)
+        # Share of traffic in each reference bin; a value equal to an edge belongs above it
+        below = window.cdf(np.asarray(ref["edges"]), inclusive=False)
+        actual.append(np.diff(np.concatenate([[0.0], below, [1.0]])))
+
+    ks, n = np.array(ks), np.array(n)
+    # Two-sample p-value with the effective sample size of window vs training set,
+    # capped at what the sketches resolve so sketch noise can't become significant at large n
+    m = profile["n"]
+    n_eff = np.maximum(1, np.round(np.minimum(n * m / (n + m), resolution)))
+    p_values = kstwo.sf(ks, n_eff)
+
+    # PSI and JS over the shared reference bins, all features at once
+    expected = np.clip(np.array([profile["features"][c]["proportions"] for c in names]), PSI_EPSILON, None)
+    actual = np.clip(np.array(actual), PSI_EPSILON, None)
+    psi = ((actual - expected) * np.log(actual / expected)).sum(axis=1)
+    js = jensenshannon(expected, actual, base=2, axis=1)
+
+    return pd.DataFrame({"n": n, "ks_stat": ks, "p_value": p_values, "psi": psi, "js": js}, index=names)
+
+def flag_drift(scores: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rows of `sketch_drift_scores` output that count as drift: a significant KS test, or
+    PSI above PSI_THRESHOLD in a window large enough for PSI to mean anything. The KS
+    threshold is split across the features tested (Bonferroni), so an undrifted window
+    raises a flag with probability `threshold`, not once per feature.
+    """
+    ks_drift = scores.p_value < threshold / max(len(scores), 1)
+    psi_drift = (scores.psi > PSI_THRESHOLD) & (scores.n >= PSI_MIN_ROWS)
+    return scores[ks_drift | psi_drift]
+
+def load_reference_profiles(conn) -> tuple:
+    """
+    Returns ({version: profile}, latest_profile). Versions trained before profiles
+    existed fall back to the latest one.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT version, reference_profile FROM model_versions
+        WHERE reference_profile IS NOT NULL
+        ORDER BY created_at DESC
+    """)
+    rows = cur.fetchall()
+    cur.close()
+    profiles = {version: p if isinstance(p, dict) else json.loads(p) for version, p in rows}
+    latest = profiles[rows[0][0]] if rows else None
+    return profiles, latest
+
+def detect_drift() -> int:
+    """
+    Returns the number of new predictions folded into the sketches.
+    """
+    # 1. Fold new predictions into the hourly sketches, then load the longest window
+    with get_db_conn() as conn:
+        folded = update_feature_sketches(conn)
+        logger.info(f"Folded {folded} new predictions into feature sketches")
+        profiles, latest = load_reference_profiles(conn)
+        buckets = load_window_sketches(conn, max(DRIFT_WINDOW_HOURS))
+
+    if latest is None:
+        logger.warning("No reference profile stored for any model version. Run eval.retrain to create one.")
+        return folded
+    if buckets.empty:
+        logger.info("No feature sketches in the drift windows yet.")
+        return folded
+
+    window_end = pd.Timestamp.now()
+    metrics_to_insert = []
+    drifted = {}
+
+    for model_version, version_buckets in buckets.groupby('model_version'):
+        profile = profiles.get(model_version)
+        if profile is None:
+            logger.info(f"[{model_version}] No reference profile stored, comparing against the latest one")
+            profile = latest
+
+        for hours in sorted(DRIFT_WINDOW_HOURS):
+            window_start = window_end - pd.Timedelta(hours=hours)
+            # 2. Merge the hourly sketches overlapping this window, per feature
+            in_window = version_buckets[version_buckets.bucket_start > window_start - pd.Timedelta(hours=1)]
+            sketches = {}
+            for feature, stored in zip(in_window.feature, in_window.sketch):
+                sketches.setdefault(feature, KLLSketch()).merge(KLLSketch.from_dict(stored))
+            if not sketches or min(s.n for s in sketches.values()) < DRIFT_MIN_ROWS:
+                logger.info(f"[{model_version}] Not enough data to run {hours}h drift detection (<{DRIFT_MIN_ROWS} samples).")
+                continue
+
+            # 3. KS, PSI and JS for every feature
+            scores = sketch_drift_scores(profile, sketches)
+            label = f"{hours}h"
+            for feature, row in scores.iterrows():
+                logger.info(
+                    f"Drift Check [{model_version}, {label}] ({feature}, n={int(row.n)}) -> "
+                    f"P-Value: {row.p_value:.5f}, PSI: {row.psi:.4f}, JS: {row.js:.4f}"
+                )
+                metrics_to_insert.extend([
+                    (f'drift_{label}_{feature}_p_value', float(row.p_value), model_version, window_start, window_end),
+                    (f'drift_{label}_{feature}_psi', float(row.psi), model_version, window_start, window_end),
+                    (f'drift_{label}_{feature}_js', float(row.js), model_version, window_start, window_end),
+                ])
+            flagged = flag_drift(scores)
+            if not flagged.empty:
+                drifted.setdefault(model_version, []).append((label, flagged))
+
+    if not metrics_to_insert:
+        return folded
+
+    # 4. Save Metrics to DB, all versions and windows in one batch
     insert_query = """
         INSERT INTO metrics (metric_name, metric_value, model_version, window_start, window_end)
         VALUES %s
     """
-    window_end = pd.Timestamp.now()
-    window_start = window_end - pd.Timedelta(hours=1)
-    
-    execute_values(conn.cursor(), insert_query, [
-        ('drift_income_p_value', float(p_value), 'v1.0.0', window_start, window_end)
-    ])
-    conn.commit()
+    with get_db_conn() as conn:
+        execute_values(conn.cursor(), insert_query, metrics_to_insert)
+        conn.commit()
 
-    # 5. Alerting
-    if p_value < threshold:
-        logger.warning("Significant data drift detected: p-value < 0.05")
+    # 5. Alerting: one message per version listing every drifted feature and window
+    for model_version, windows in drifted.items():
+        lines = "\n".join(
+            f"- **{feature} ({label}):** p-value `{row.p_value:.5f}`, PSI `{row.psi:.3f}`, JS `{row.js:.3f}`"
+            for label, flagged in windows
+            for feature, row in flagged.iterrows()
+        )
+        logger.warning(f"[{model_version}] Significant data drift detected in {sum(len(f) for _, f in windows)} feature windows")
         msg = (
             f"🚨 **Significant Data Drift Detected** 🚨\n"
-            f"**Feature:** INCOME\n"
-            f"**P-Value:** `{p_value:.5f}` (Threshold: {threshold})\n"
-            f"**Status:** Applicants are significantly poorer/richer than training data.\n"
+            f"**Model Version:** {model_version}\n"
+            f"{lines}\n"
+            f"**Thresholds:** p-value < {threshold} (across {len(DRIFT_COLUMNS)} columns) or PSI > {PSI_THRESHOLD} (n >= {PSI_MIN_ROWS})\n"
+            f"**Status:** Recent traffic no longer looks like the training data.\n"
             f"**Action:** Check for model degradation."
         )
-        send_discord_alert(msg)
-    
-    conn.close()
-
+        send_discord_alert(msg, key=f"drift:{model_version}")
+    return folded
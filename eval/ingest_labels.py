@@ -0,0 +1,54 @@
+# eval/ingest_labels.py - Load ground-truth label files into the ground_truth table
+# Labels from the downstream system arrive as daily NDJSON or CSV files (optionally
+# gzipped). Files are streamed line by line, so their size doesn't matter.
+#
+#   python -m eval.ingest_labels labels_2024-06-01.ndjson.gz
+#   python -m eval.ingest_labels --format csv - < labels.csv
+
+import sys
+import gzip
+import json
+import logging
+import argparse
+from common.labels import LabelIngestor, FORMATS
+from eval.db_utils import get_db_conn
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("label_ingest")
+
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    return "csv" if name.endswith(".csv") else "ndjson"
+
+def open_labels(path: str):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+def ingest_file(path: str, fmt: str = None, chunk_size: int = 50000) -> dict:
+    fmt = fmt or detect_format(path)
+    logger.info(f"Ingesting {path} as {fmt}...")
+    with get_db_conn() as conn, open_labels(path) as f:
+        ingestor = LabelIngestor(conn, fmt=fmt, chunk_size=chunk_size)
+        ingestor.feed(f)
+        return ingestor.finish()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load ground-truth labels (request_id, actual_class).")
+    parser.add_argument("paths", nargs="+", help="NDJSON or CSV files, optionally .gz; '-' reads stdin")
+    parser.add_argument("--format", choices=FORMATS, help="Override the format detected from the file extension")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows staged per COPY")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for path in args.paths:
+        report = ingest_file(path, args.format, args.chunk_size)
+        print(json.dumps({"path": path, **report}))
+        failed = failed or report["unknown"] > 0 or report["invalid"] > 0
+    # Non-zero exit so a cron wrapper notices rejected labels
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# eval/jobs.py - Dependency-aware job runner for the eval worker
+# Jobs form a DAG: root jobs run on an interval, and a job with `after` runs once every
+# job it depends on has succeeded since its own last run. Independent jobs run in
+# parallel on a thread pool. Every run (and every skipped run) is recorded in job_runs.
+
+import os
+import time
+import logging
+import threading
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from eval.db_utils import get_db_conn
+
+logger = logging.getLogger("jobs")
+
+JOB_RUNS_RETENTION_DAYS = int(os.getenv("JOB_RUNS_RETENTION_DAYS", "14"))
+
+class Job:
+    def __init__(self, name: str, fn, every: float = None, after: tuple = ()):
+        self.name = name
+        self.fn = fn
+        self.every = every
+        self.after = tuple(after)
+
+        self.running = False
+        self.pending = False        # triggered again while running; runs once more afterwards
+        self.next_due = 0.0         # monotonic time of the next scheduled run (root jobs)
+        self.last_triggered = 0.0
+        self.last_success = 0.0
+
+        # Counters
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_duration_ms = 0.0
+        self.last_rows = None
+
+class JobRunner:
+    """
+    Runs a DAG of jobs on a bounded worker pool.
+
+        runner = JobRunner(max_workers=4)
+        runner.add("label", simulate_ground_truth, every=30)
+        runner.add("metrics", compute_and_save_metrics, after=["label"])
+        runner.run_forever()
+
+    A job function returns the number of rows it processed (or None). Overlapping runs
+    never happen: a root job that is still running when it comes due again is skipped,
+    and a dependent job triggered while running is coalesced into one follow-up run.
+    A failed job doesn't trigger its dependents.
+    """
+
+    def __init__(self, max_workers: int = 4, tick_seconds: float = 1.0, record_runs: bool = True):
+        self.jobs = {}
+        self.children = {}
+        self.tick_seconds = tick_seconds
+        self.record_runs = record_runs
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="eval-job")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def add(self, name: str, fn, every: float = None, after=(), run_at_start: bool = True):
+        if (every is None) == (not after):
+            raise ValueError(f"Job {name} needs either an interval or upstream jobs, not both")
+        for parent in after:
+            if parent not in self.jobs:
+                raise ValueError(f"Job {name} depends on unknown job {parent}")
+        job = Job(name, fn, every, after)
+        if every is not None and not run_at_start:
+            job.next_due = time.monotonic() + every
+        self.jobs[name] = job
+        self.children[name] = []
+        for parent in after:
+            self.children[parent].append(job)
+        return job
+
+    # --- Scheduling ---
+
+    def run_forever(self):
+        logger.info(f"Job runner started with {len(self.jobs)} jobs: {self.describe()}")
+        try:
+            while not self._stop.is_set():
+                self._tick()
+                self._stop.wait(self.tick_seconds)
+        finally:
+            self.executor.shutdown(wait=True)
+            logger.info(f"Job runner stopped: {self.stats()}")
+
+    def stop(self):
+        self._stop.set()
+
+    def _tick(self):
+        now = time.monotonic()
+        for job in self.jobs.values():
+            if job.every is not None and now >= job.next_due:
+                # Missed intervals collapse into this one run instead of queueing up
+                job.next_due = now + job.every
+                self._trigger(job, "schedule")
+
+    def _trigger(self, job: Job, trigger: str):
+        with self._lock:
+            if job.running:
+                if job.every is not None:
+                    job.skipped += 1
+                    skipped = True
+                else:
+                    job.pending = True
+                    return
+            else:
+                skipped = False
+                job.running = True
+                job.last_triggered = time.monotonic()
+        if skipped:
+            logger.warning(f"Skipping {job.name}: previous run still in progress")
+            self._record(job.name, datetime.now(), 0.0, None, "skipped", None, trigger)
+            return
+        self.executor.submit(self._run, job, trigger)
+
+    def _run(self, job: Job, trigger: str):
+        started_at = datetime.now()
+        start = time.perf_counter()
+        rows, error = None, None
+        try:
+            rows = job.fn()
+            status = "success"
+        except Exception as e:
+            status = "failed"
+            error = "".join(traceback.format_exception_only(type(e), e)).strip()
+            logger.error(f"Job {job.name} failed: {e}", exc_info=True)
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            job.runs += 1
+            job.last_duration_ms = duration_ms
+            job.last_rows = rows
+            if status == "success":
+                job.last_success = time.monotonic()
+            else:
+                job.failures += 1
+            job.running = False
+            rerun, job.pending = job.pending, False
+            ready = [
+                child for child in self.children[job.name]
+                if status == "success"
+                and all(self.jobs[p].last_success > child.last_triggered for p in child.after)
+            ]
+
+        logger.info(f"Job {job.name} {status} in {duration_ms:.0f}ms (rows={rows}, trigger={trigger})")
+        self._record(job.name, started_at, duration_ms, rows, status, error, trigger)
+
+        for child in ready:
+            self._trigger(child, job.name)
+        if rerun:
+            self._trigger(job, "coalesced")
+
+    def _record(self, job_name, started_at, duration_ms, rows, status, error, trigger):
+        if not self.record_runs:
+            return
+        try:
+            with get_db_conn() as conn:
+                cur = conn.cursor()
+                cur.execute("""
+                    INSERT INTO job_runs
+                    (job_name, started_at, duration_ms, rows_processed, status, error, trigger)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, (job_name, started_at, duration_ms, rows, status, error, trigger))
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            logger.warning(f"Could not record run of {job_name}: {e}")
+
+    # --- Introspection ---
+
+    def describe(self) -> str:
+        return ", ".join(
+            f"{j.name} (every {j.every:g}s)" if j.every is not None else f"{j.name} (after {'+'.join(j.after)})"
+            for j in self.jobs.values()
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "runs": job.runs,
+                    "failures": job.failures,
+                    "skipped": job.skipped,
+                    "running": job.running,
+                    "last_duration_ms": job.last_duration_ms,
+                    "last_rows": job.last_rows,
+                }
+                for name, job in self.jobs.items()
+            }
+
+def prune_job_runs(retention_days: int = JOB_RUNS_RETENTION_DAYS) -> int:
+    """
+    Delete job_runs rows older than the retention period.
+    """
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            DELETE FROM job_runs WHERE started_at < LOCALTIMESTAMP - make_interval(days => %s)
+        """, (retention_days,))
+        pruned = cur.rowcount
+        conn.commit()
+        cur.close()
+    return pruned
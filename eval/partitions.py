@@ -0,0 +1,143 @@
+# eval/partitions.py - Daily partition maintenance for the predictions table (db/update_v9.sql)
+# Creates partitions ahead of time, drops the ones older than the retention period, and
+# backfills rows from the pre-partitioning table.
+#
+#   python -m eval.partitions maintain
+#   python -m eval.partitions backfill [--drop-legacy]
+
+import os
+import logging
+import argparse
+from datetime import date, datetime, timedelta
+from eval.db_utils import get_db_conn
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("partitions")
+
+PARTITION_DAYS_AHEAD = int(os.getenv("PARTITION_DAYS_AHEAD", "7"))
+PREDICTIONS_RETENTION_DAYS = int(os.getenv("PREDICTIONS_RETENTION_DAYS", "90"))
+# DDL on the parent briefly locks out the API's COPY; give up rather than queue behind it
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+PARTITION_PREFIX = "predictions_p"
+
+def ensure_partitions(days_ahead: int = PARTITION_DAYS_AHEAD):
+    """
+    Create the partitions for today and the next `days_ahead` days.
+    """
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+        cur.execute("""
+            SELECT create_prediction_partition(CURRENT_DATE + i) FROM generate_series(0, %s) AS i
+        """, (days_ahead,))
+        conn.commit()
+        cur.close()
+
+def list_partitions(conn) -> dict:
+    """
+    Returns {day: partition_name} for the daily partitions of predictions.
+    """
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'predictions'::regclass AND c.relname ~ '^predictions_p[0-9]{8}$'
+    """)
+    names = [row[0] for row in cur.fetchall()]
+    cur.close()
+    return {datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date(): name for name in names}
+
+def drop_expired_partitions(retention_days: int = PREDICTIONS_RETENTION_DAYS) -> list:
+    """
+    Drop every daily partition that ends before the retention cutoff. Dropping a
+    partition is a catalog operation: no row-by-row DELETE, no dead tuples, no VACUUM.
+    """
+    cutoff = date.today() - timedelta(days=retention_days)
+    dropped = []
+    with get_db_conn() as conn:
+        for day, name in sorted(list_partitions(conn).items()):
+            if day + timedelta(days=1) > cutoff:
+                break
+            cur = conn.cursor()
+            try:
+                cur.execute("SET LOCAL lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+                # Name comes from the catalog and matched the pattern above
+                cur.execute(f'DROP TABLE IF EXISTS "{name}"')
+                conn.commit()
+                dropped.append(name)
+            except Exception as e:
+                conn.rollback()
+                logger.warning(f"Could not drop partition {name}, will retry next run: {e}")
+            finally:
+                cur.close()
+    if dropped:
+        logger.info(f"Dropped {len(dropped)} partitions older than {cutoff}: {', '.join(dropped)}")
+    return dropped
+
+def maintain_partitions() -> int:
+    ensure_partitions()
+    return len(drop_expired_partitions())
+
+def backfill_legacy(retention_days: int = PREDICTIONS_RETENTION_DAYS, drop_legacy: bool = False) -> int:
+    """
+    Copy rows from predictions_legacy into the partitioned table one day at a time,
+    filling the typed feature columns from input_data. Days already past retention are
+    skipped. Safe to re-run: rows already copied are left alone.
+    """
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('predictions_legacy') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            logger.info("No predictions_legacy table, nothing to backfill.")
+            return 0
+        cur.execute("SELECT MIN(timestamp)::date, MAX(timestamp)::date FROM predictions_legacy")
+        first, last = cur.fetchone()
+        conn.commit()
+
+        copied = 0
+        if first is not None:
+            first = max(first, date.today() - timedelta(days=retention_days))
+            day = first
+            while day <= last:
+                cur.execute("SELECT create_prediction_partition(%s)", (day,))
+                cur.execute("""
+                    INSERT INTO predictions (
+                        request_id, model_version, timestamp, input_data, income, debt, credit_score,
+                        prediction_prob, prediction_class, latency_ms, cache_hit, ingest_xid
+                    )
+                    SELECT
+                        request_id, model_version, timestamp, input_data,
+                        (input_data->>'income')::float, (input_data->>'debt')::float,
+                        (input_data->>'credit_score')::float::integer,
+                        prediction_prob, prediction_class, latency_ms, cache_hit,
+                        -- Old rows, not new writes: the eval jobs' watermarks already passed them
+                        NULL
+                    FROM predictions_legacy
+                    WHERE timestamp >= %(day)s AND timestamp < %(day)s + 1
+                    ON CONFLICT DO NOTHING
+                """, {"day": day})
+                copied += cur.rowcount
+                conn.commit()
+                logger.info(f"Backfilled {cur.rowcount} predictions for {day}")
+                day += timedelta(days=1)
+
+        if drop_legacy:
+            cur.execute("DROP TABLE predictions_legacy")
+            conn.commit()
+            logger.info("Dropped predictions_legacy")
+        cur.close()
+    logger.info(f"Backfill complete: {copied} predictions copied.")
+    return copied
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the daily partitions of the predictions table.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("maintain", help="Create upcoming partitions and drop expired ones")
+    backfill = sub.add_parser("backfill", help="Copy rows from predictions_legacy into the partitioned table")
+    backfill.add_argument("--drop-legacy", action="store_true", help="Drop predictions_legacy afterwards")
+    args = parser.parse_args()
+
+    if args.command == "maintain":
+        maintain_partitions()
+    else:
+        backfill_legacy(drop_legacy=args.drop_legacy)
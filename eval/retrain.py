@@ -6,80 +6,219 @@ import pickle
 import os
 import logging
 import json
+import time
+import resource
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, f1_score
+from common.forest import compile_model, save_forest, CompiledForest, FOREST_EXTENSION
 from eval.db_utils import get_db_conn, get_next_version
 from eval.alerting import send_discord_alert
+from eval.drift import FEATURES, build_reference_profile
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger("retrainer")
 
 MODELS_DIR="/app/models"
+# "forest": also write a memory-mappable .forest artifact and register it (see common/forest.py)
+# "pickle": register the pickle only
+MODEL_ARTIFACT_FORMAT = os.getenv("MODEL_ARTIFACT_FORMAT", "forest")
+
+# Training set: labelled predictions from the last RETRAIN_WINDOW_DAYS days, stratified
+# down to RETRAIN_MAX_ROWS (0 keeps everything)
+RETRAIN_WINDOW_DAYS = int(os.getenv("RETRAIN_WINDOW_DAYS", "7"))
+RETRAIN_MAX_ROWS = int(os.getenv("RETRAIN_MAX_ROWS", "1000000"))
+RETRAIN_MIN_ROWS = int(os.getenv("RETRAIN_MIN_ROWS", "1000"))
+RETRAIN_CHUNK_SIZE = int(os.getenv("RETRAIN_CHUNK_SIZE", "50000"))
+RETRAIN_TEST_SIZE = float(os.getenv("RETRAIN_TEST_SIZE", "0.2"))
+RETRAIN_N_JOBS = int(os.getenv("RETRAIN_N_JOBS", "-1"))
+
+rng = np.random.default_rng()
+
+def synthetic_training_data(n: int = 1000):
+    # Simulate fresh data
+    # Train on a distribution that matches new production data
+    X = pd.DataFrame({
+        "income": np.random.normal(55000, 20000, n),
+        "debt": np.random.normal(10000, 5000, n),
+        "credit_score": np.random.normal(650, 100, n),
+    })
+    y = ((X['credit_score'] > 600) & (X['debt'] < 20000)).astype(int)
+    return X, y.to_numpy()
+
+def _stratified_keep(class_counts: dict, max_rows: int) -> dict:
+    """
+    For each class, a boolean mask over its rows (in scan order) marking the ones to
+    keep, so the sample has the same class balance as the full window.
+    """
+    total = sum(class_counts.values())
+    keep = {}
+    for cls, n in class_counts.items():
+        mask = np.ones(n, dtype=bool)
+        if max_rows and total > max_rows:
+            mask[:] = False
+            mask[rng.choice(n, size=max(1, round(max_rows * n / total)), replace=False)] = True
+        keep[cls] = mask
+    return keep
+
+def load_training_data(conn, window_days: int = RETRAIN_WINDOW_DAYS, max_rows: int = RETRAIN_MAX_ROWS):
+    """
+    Labelled predictions from the last `window_days` days as (X, y, until), read in
+    chunks through a server-side cursor straight into preallocated arrays. Above
+    `max_rows` rows, a stratified sample is kept instead. Features come from the typed
+    columns. `until` is the newest prediction timestamp the training set can contain;
+    later traffic is out-of-sample for the model (see eval/backtest.py).
+    """
+    # One snapshot for the counts and the scan, so the arrays are sized exactly
+    conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT LOCALTIMESTAMP")
+        until = cur.fetchone()[0]
+        params = {"days": window_days, "until": until}
+        where = f"""
+            FROM predictions p
+            JOIN ground_truth g ON g.request_id = p.request_id
+            WHERE p.timestamp > %(until)s - make_interval(days => %(days)s) AND p.timestamp <= %(until)s
+              AND {" AND ".join(f"p.{f} IS NOT NULL" for f in FEATURES)}
+        """
+        cur.execute(f"SELECT g.actual_class, COUNT(*) {where} GROUP BY 1", params)
+        class_counts = dict(cur.fetchall())
+        cur.close()
+
+        keep = _stratified_keep(class_counts, max_rows)
+        n = sum(int(mask.sum()) for mask in keep.values())
+        X = np.empty((n, len(FEATURES)), dtype=np.float64)
+        y = np.empty(n, dtype=np.int8)
+        seen = dict.fromkeys(class_counts, 0)
+        filled = 0
+
+        scan = conn.cursor(name="retrain_scan")
+        scan.itersize = RETRAIN_CHUNK_SIZE
+        scan.execute(f"SELECT {', '.join(f'p.{f}' for f in FEATURES)}, g.actual_class {where}", params)
+        while True:
+            chunk = scan.fetchmany(RETRAIN_CHUNK_SIZE)
+            if not chunk:
+                break
+            rows = np.asarray(chunk, dtype=np.float64)
+            labels = rows[:, -1].astype(np.int8)
+            selected = np.empty(len(rows), dtype=bool)
+            for cls in class_counts:
+                idx = np.flatnonzero(labels == cls)
+                selected[idx] = keep[cls][seen[cls]:seen[cls] + len(idx)]
+                seen[cls] += len(idx)
+            k = int(selected.sum())
+            X[filled:filled + k] = rows[selected, :-1]
+            y[filled:filled + k] = labels[selected]
+            filled += k
+        scan.close()
+        conn.commit()
+    finally:
+        # set_session fails inside a transaction, which is still open if the scan raised
+        conn.rollback()
+        conn.set_session(isolation_level="DEFAULT", readonly="DEFAULT")
+
+    logger.info(f"Loaded {filled} labelled predictions from the last {window_days} days "
+                f"(class counts in window: {class_counts})")
+    return pd.DataFrame(X[:filled], columns=FEATURES, copy=False), y[:filled], until
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
 
 def retrain_model():
     logger.info("Starting candidate model training job...")
 
-    # Fetch recent predictions
-    # query = """
-    # SELECT input_data, prediction_class FROM predictions WHERE timestamp > NOW() - INTERVAL '7 days'"""
-    # df = pd.read_sql(query, conn)
-
-    # if df.empty:
-    #     logger.warning("No recent predictions found. Skipping retraining.")
-    #     return
-
-    # # 2. Train the model
-    # model = RandomForestClassifier()
-    # model.fit(df[['input_data']], df['prediction_class'])
-
-    # Simulate fresh data
-    # Train on a distribution that matches new production data
-    X_train = pd.DataFrame({
-        "income": np.random.normal(55000, 20000, 1000),
-        "debt": np.random.normal(10000, 5000, 1000),
-        "credit_score": np.random.normal(650, 100, 1000),
-    })
-    y_train = ((X_train['credit_score'] > 600) & (X_train['debt'] < 20000)).astype(int)
+    load_start = time.perf_counter()
+    with get_db_conn() as conn:
+        X, y, data_until = load_training_data(conn)
+    load_seconds = time.perf_counter() - load_start
+
+    # The stratified split needs at least two rows of each class
+    class_counts = np.bincount(y, minlength=2)
+    if len(y) < RETRAIN_MIN_ROWS or class_counts.min() < 2:
+        logger.warning(f"Only {len(y)} labelled predictions in the window (per class: {class_counts.tolist()}), "
+                       f"training on synthetic data instead.")
+        X, y = synthetic_training_data()
+        data_source = "synthetic"
+        data_until = None
+    else:
+        data_source = "predictions"
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=RETRAIN_TEST_SIZE, stratify=y, random_state=0
+    )
 
-    clf = RandomForestClassifier(n_estimators=10)
+    fit_start = time.perf_counter()
+    clf = RandomForestClassifier(n_estimators=10, n_jobs=RETRAIN_N_JOBS)
     clf.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - fit_start
+    peak_rss_mb = _peak_rss_mb()
+    logger.info(f"Fitted on {len(y_train)} rows in {fit_seconds:.2f}s (load {load_seconds:.2f}s, peak RSS {peak_rss_mb:.0f} MB)")
 
     # Get next semantic version (e.g., v1.0.0 -> v1.0.1)
     version_id = get_next_version()
     filename = f"model_{version_id}.pkl"
     filepath = os.path.join(MODELS_DIR, filename)
 
+    y_pred = clf.predict(X_test)
     metrics = {
-        "accuracy": accuracy_score(y_train, clf.predict(X_train)),
-        "f1_score": f1_score(y_train, clf.predict(X_train))
+        "accuracy": accuracy_score(y_test, y_pred),
+        "f1_score": f1_score(y_test, y_pred),
+        "training": {
+            "data_source": data_source,
+            "window_days": RETRAIN_WINDOW_DAYS,
+            "data_until": data_until.isoformat() if data_until else None,
+            "train_rows": len(y_train),
+            "test_rows": len(y_test),
+            "load_seconds": round(load_seconds, 3),
+            "fit_seconds": round(fit_seconds, 3),
+            "peak_rss_mb": round(peak_rss_mb, 1),
+        },
     }
     metrics_json = json.dumps(metrics)
 
+    # Drift reference: feature distributions plus the model's own score distribution, from
+    # the held-out rows. Scores on training rows are in-sample (pushed towards 0/1) and
+    # would make live prediction_prob look drifted forever.
+    reference_profile = build_reference_profile(X_test.assign(prediction_prob=clf.predict_proba(X_test)[:, 1]))
+
     # Save candidate model with pickle.dump
+    # (always kept, so tooling that needs the sklearn object can still load it)
     with open(filepath, "wb") as f:
         pickle.dump(clf, f)
 
     logger.info(f"Candidate model saved to {filepath}")
 
-    conn = get_db_conn()
-    cur = conn.cursor()
-    cur.execute("""
-    INSERT INTO model_versions (version, filepath, is_active, metrics_json)
-    VALUES (%s, %s, FALSE, %s)
-    """, (version_id, filepath, metrics_json))
-    conn.commit()
-    cur.close()
-    conn.close()
+    if MODEL_ARTIFACT_FORMAT == "forest":
+        # API workers mmap this file and share one page-cache copy of the trees
+        compiled = compile_model(clf)
+        if isinstance(compiled, CompiledForest):
+            forest_path = os.path.join(MODELS_DIR, f"model_{version_id}{FOREST_EXTENSION}")
+            save_forest(compiled, forest_path)
+            filepath = forest_path
+            logger.info(f"Memory-mappable artifact saved to {forest_path}")
+        else:
+            logger.warning(f"{type(clf).__name__} can't be compiled, registering the pickle instead")
+
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+        INSERT INTO model_versions (version, filepath, is_active, metrics_json, reference_profile)
+        VALUES (%s, %s, FALSE, %s, %s)
+        """, (version_id, filepath, metrics_json, json.dumps(reference_profile)))
+        conn.commit()
+        cur.close()
 
     alert_msg = (
         f"🎯 **New Candidate Model Version Available** 🎯\n"
         f"**Version:** `{version_id}`\n"
         f"**Status:** Waiting for manual review\n"
         f"**Metrics:** {metrics_json}\n"
-        f"**Action:** Manual review, then promote to production by updating the `is_active` flag.\n"
+        f"**Action:** Set `is_shadow` to score it on live traffic, then promote to production by updating the `is_active` flag.\n"
     )
 
-    send_discord_alert(alert_msg)
+    send_discord_alert(alert_msg, key=f"candidate:{version_id}")
     
     logger.info("Candidate model training job completed successfully.")
 
@@ -0,0 +1,91 @@
+# eval/rollups.py - Incremental minute/hour rollups of prediction traffic for the dashboard
+# Each run aggregates only predictions committed since the last one (a watermark on the
+# transaction that wrote them, see eval/db_utils.py) into per-version minute and hour
+# rows: request counts, class balance, cache hits, and latency / prediction_prob
+# histograms (db/update_v10.sql).
+import os
+import logging
+from common.rollups import LATENCY_BOUNDS_MS, LATENCY_BUCKETS, PROB_BINS
+from eval.db_utils import get_db_conn, lock_watermark, new_rows_filter, set_watermark
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+logger = logging.getLogger("rollups")
+
+WATERMARK_JOB = "prediction_rollups"
+# Minute rows are only needed for recent charts; hour rows are kept
+MINUTE_RETENTION_HOURS = int(os.getenv("ROLLUP_MINUTE_RETENTION_HOURS", "48"))
+
+ROLLUP_TABLES = {"minute": "prediction_rollups_minute", "hour": "prediction_rollups_hour"}
+
+def _rollup_query(table: str, unit: str) -> str:
+    latency_hist = ", ".join(f"COUNT(*) FILTER (WHERE latency_bucket = {i})" for i in range(LATENCY_BUCKETS))
+    prob_hist = ", ".join(f"COUNT(*) FILTER (WHERE prob_bin = {i})" for i in range(1, PROB_BINS + 1))
+    return f"""
+        WITH delta AS (
+            SELECT
+                model_version,
+                date_trunc('{unit}', timestamp) AS bucket_start,
+                COUNT(*) AS requests,
+                COUNT(*) FILTER (WHERE prediction_class = 1) AS positives,
+                COUNT(*) FILTER (WHERE cache_hit) AS cache_hits,
+                SUM(latency_ms) AS latency_sum_ms,
+                MAX(latency_ms) AS latency_max_ms,
+                ARRAY[{latency_hist}]::bigint[] AS latency_hist,
+                ARRAY[{prob_hist}]::bigint[] AS prob_hist
+            FROM (
+                SELECT
+                    model_version, timestamp, prediction_class, cache_hit, latency_ms,
+                    width_bucket(latency_ms, %(bounds)s::float8[]) AS latency_bucket,
+                    GREATEST(LEAST(width_bucket(prediction_prob, 0, 1, {PROB_BINS}), {PROB_BINS}), 1) AS prob_bin
+                FROM predictions
+                WHERE {new_rows_filter("predictions", "timestamp")}
+            ) p
+            GROUP BY 1, 2
+        ), upserted AS (
+            INSERT INTO {table} AS t
+            SELECT * FROM delta
+            ON CONFLICT (model_version, bucket_start) DO UPDATE SET
+                requests = t.requests + EXCLUDED.requests,
+                positives = t.positives + EXCLUDED.positives,
+                cache_hits = t.cache_hits + EXCLUDED.cache_hits,
+                latency_sum_ms = t.latency_sum_ms + EXCLUDED.latency_sum_ms,
+                latency_max_ms = GREATEST(t.latency_max_ms, EXCLUDED.latency_max_ms),
+                latency_hist = rollup_array_add(t.latency_hist, EXCLUDED.latency_hist),
+                prob_hist = rollup_array_add(t.prob_hist, EXCLUDED.prob_hist)
+        )
+        SELECT COALESCE(SUM(requests), 0) FROM delta
+    """
+
+def update_rollups(conn) -> int:
+    """
+    Fold predictions committed since the last run into the minute and hour rollups, and
+    advance the watermark in the same transaction. Returns the number of predictions
+    folded in.
+    """
+    cur = conn.cursor()
+    bounds = lock_watermark(cur, WATERMARK_JOB)
+
+    params = {**bounds, "bounds": LATENCY_BOUNDS_MS}
+    folded = 0
+    for unit, table in ROLLUP_TABLES.items():
+        cur.execute(_rollup_query(table, unit), params)
+        folded = int(cur.fetchone()[0])
+
+    cur.execute("""
+        DELETE FROM prediction_rollups_minute
+        WHERE bucket_start < LOCALTIMESTAMP - make_interval(hours => %s)
+    """, (MINUTE_RETENTION_HOURS,))
+
+    set_watermark(cur, WATERMARK_JOB, bounds)
+    conn.commit()
+    cur.close()
+    return folded
+
+def refresh_rollups():
+    with get_db_conn() as conn:
+        folded = update_rollups(conn)
+    logger.info(f"Folded {folded} predictions into traffic rollups")
+    return folded
+
+if __name__ == "__main__":
+    refresh_rollups()
@@ -1,11 +1,14 @@
-import time
+import os
 import logging
-from apscheduler.schedulers.blocking import BlockingScheduler
+from eval.jobs import JobRunner, prune_job_runs
 from eval.simulate_ground_truth import simulate_ground_truth
-from eval.compute_metrics import compute_and_save_metrics
+from eval.compute_metrics import compute_and_save_metrics, alert_on_degradation
 from eval.drift import detect_drift
+from eval.partitions import maintain_partitions
+from eval.rollups import refresh_rollups
 
-# We use APScheduler for observability and reliability
+# Jobs run on a small worker pool: independent jobs in parallel, dependent ones as soon
+# as their inputs are ready. Every run is recorded in job_runs (eval/jobs.py).
 
 # Setup Logging to Console
 logging.basicConfig(
@@ -14,53 +17,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger("scheduler")
 
-# Job to simulate ground truth every 30 seconds (for the demo)
-def job_simulation():
-    logger.info("Triggering Ground Truth Simulation Job...")
-    try:
-        simulate_ground_truth()
-    except Exception as e:
-        logger.error(f"Simulation Job Failed: {e}", exc_info=True)
-
-
-# Job to compute and save metrics every 30 seconds
-def job_metrics():
-    logger.info("Triggering Metric Computation Job...")
-    try:
-        compute_and_save_metrics()
-    except Exception as e:
-        logger.error(f"Metric Computation Failed: {e}", exc_info=True)
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", "4"))
 
-def job_drift():
-    logger.info("Triggering Drift Detection Job...")
-    try:
-        detect_drift()
-    except Exception as e:
-        logger.error(f"Drift Detection Failed: {e}", exc_info=True)
-
-if __name__ == "__main__":
-    # Create the scheduler
-    # Runs in main thread and blocks the main thread from exiting
-    scheduler = BlockingScheduler()
+def build_runner() -> JobRunner:
+    runner = JobRunner(max_workers=EVAL_WORKERS)
 
     # --- SCHEDULE CONFIGURATION ---
     # In a real production environment, we'd run these daily (hours=24)
-    # For the demos, we run them every 30 SECONDS 
+    # For the demos, we run them every 30 SECONDS
     # so we can see the graphs move live.
-    
+
     # 1. Generate fake labels every 30 seconds
-    scheduler.add_job(job_simulation, 'interval', seconds=30)
-    
-    # 2. Re-calculate metrics every 30 seconds (TODO: stagger slightly if needed)
-    scheduler.add_job(job_metrics, 'interval', seconds=30)
-    
-    # 3. Detect drift every 60 seconds (less frequent than metrics)
-    scheduler.add_job(job_drift, 'interval', seconds=60)
-    
-    logger.info("Scheduler started! Jobs will run every 30 seconds.")
-    
+    runner.add("label", simulate_ground_truth, every=30)
+
+    # 2. Re-calculate metrics as soon as a labelling run finishes, then check them
+    runner.add("metrics", compute_and_save_metrics, after=["label"])
+    runner.add("alert", alert_on_degradation, after=["metrics"])
+
+    # 3. Detect drift every 60 seconds (doesn't need labels, runs alongside the above)
+    runner.add("drift", detect_drift, every=60)
+
+    # 4. Fold new predictions into the dashboard's traffic rollups every 15 seconds
+    runner.add("rollups", refresh_rollups, every=15)
+
+    # 5. Create upcoming predictions partitions and drop expired ones (hourly, and once at startup)
+    runner.add("partitions", maintain_partitions, every=3600)
+    runner.add("prune_job_runs", prune_job_runs, every=3600)
+    return runner
+
+if __name__ == "__main__":
+    runner = build_runner()
     try:
         # This keeps the process alive permanently
-        scheduler.start()
+        runner.run_forever()
     except (KeyboardInterrupt, SystemExit):
-        pass
\ No newline at end of file
+        runner.stop()
@@ -1,66 +1,115 @@
-# This script simulates the ground truth labels for the predictions table, 
+# This script simulates the ground truth labels for the predictions table,
 # in production we use real ground truth labels from the dataset, and insert into the ground_truth table.
 # Script is used to evaluate the performance of the model by randomly labelling the predictions.
+# Each run only reads predictions committed since the last one (a high-water mark on the
+# transaction that wrote them, see eval/db_utils.py), streamed in fixed-size chunks, so memory stays flat however many are waiting.
 
 # Imports
+import io
 import os
-import random
 import logging
-from psycopg2.extras import execute_values
-from eval.db_utils import get_db_conn  # this was originally defined for each script, but importing makes it easier to adjust
+import numpy as np
+from eval.db_utils import get_db_conn, lock_watermark, new_rows_filter, set_watermark  # this was originally defined for each script, but importing makes it easier to adjust
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger("ground_truth_sim")
 
-def simulate_ground_truth():
-    conn = get_db_conn()
-    cur = conn.cursor()
+WATERMARK_JOB = "ground_truth_sim"
+CHUNK_SIZE = int(os.getenv("GROUND_TRUTH_CHUNK_SIZE", "50000"))
 
-    # 1. Find predictions that don't have a label yet
-    logger.info("Fetching unlabelled predictions...")
+rng = np.random.default_rng()
+
+def simulate_labels(probs: np.ndarray) -> np.ndarray:
+    """
+    Draw a label for every prediction at once.
+    """
+    # --- SIMULATION LOGIC ---
+    # We want the model to be roughly correct.
+    # If the model was confident (prob > 0.8 or < 0.2), usually match it.
+    # If the model was unsure (0.4 - 0.6), flip a coin.
+    draws = rng.random(len(probs))
+    return np.where(
+        probs > 0.8, draws < 0.9,
+        np.where(probs < 0.2, draws >= 0.9,
+                 # Random chance for uncertain predictions
+                 draws < 0.5)
+    ).astype(np.int8)
+
+def simulate_ground_truth() -> int:
+    with get_db_conn() as conn:
+        cur = conn.cursor()
+        # Chunks commit as they go, so a row lock can't keep two runs apart; a session
+        # advisory lock does
+        cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (WATERMARK_JOB,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            logger.info("Another labelling run is in progress, skipping.")
+            return 0
+        try:
+            labelled = _label_since_watermark(conn, cur)
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (WATERMARK_JOB,))
+            conn.commit()
+            cur.close()
+
+    if labelled:
+        logger.info(f"Successfully added {labelled} ground truth labels.")
+    else:
+        logger.info("No new predictions to label.")
+    return labelled
+
+def _label_since_watermark(conn, cur) -> int:
+    # 1. Find predictions committed since the last run
+    bounds = lock_watermark(cur, WATERMARK_JOB)
+    logger.info(f"Fetching predictions written by transactions {bounds['lower']} to {bounds['upper']} ...")
+
+    # Labels are staged here and merged, so a row that already has a label is skipped
+    # instead of failing the chunk
     cur.execute("""
-        SELECT p.request_id, p.prediction_class, p.prediction_prob 
-        FROM predictions p
-        LEFT JOIN ground_truth g ON p.request_id = g.request_id
-        WHERE g.request_id IS NULL
+        CREATE TEMP TABLE IF NOT EXISTS ground_truth_staging (
+            request_id UUID,
+            actual_class INTEGER
+        ) ON COMMIT DELETE ROWS
     """)
-    rows = cur.fetchall()
 
-    if not rows:
-        logger.info("No new predictions to label.")
-        return
+    # Server-side cursor: rows arrive CHUNK_SIZE at a time. WITH HOLD keeps it open
+    # across the per-chunk commits below.
+    scan = conn.cursor(name="ground_truth_scan", withhold=True)
+    scan.execute(f"""
+        SELECT request_id, prediction_prob FROM predictions
+        WHERE {new_rows_filter("predictions", "timestamp")}
+    """, bounds)
+    conn.commit()
+
+    labelled = 0
+    try:
+        while True:
+            chunk = scan.fetchmany(CHUNK_SIZE)
+            if not chunk:
+                break
+            request_ids, probs = zip(*chunk)
+            labels = simulate_labels(np.asarray(probs, dtype=np.float64))
 
-    logger.info(f"Generating labels for {len(rows)} predictions...")
-    
-    new_labels = []
-    for row in rows:
-        req_id, pred_class, prob = row
-        
-        # --- SIMULATION LOGIC ---
-        # We want the model to be roughly correct.
-        # If the model was confident (prob > 0.8 or < 0.2), usually match it.
-        # If the model was unsure (0.4 - 0.6), flip a coin.
-        
-        if prob > 0.8: 
-            actual_class = 1 if random.random() < 0.9 else 0
-        elif prob < 0.2:
-            actual_class = 0 if random.random() < 0.9 else 1
-        else:
-            # Random chance for uncertain predictions
-            actual_class = 1 if random.random() < 0.5 else 0
-            
-        new_labels.append((req_id, actual_class))
-        # ------------------------
+            # 2. COPY the chunk into staging and merge it. Each chunk commits on its own
+            # so labeled_at stays close to the time its rows become visible.
+            buf = io.StringIO("".join(f"{r},{a}\n" for r, a in zip(request_ids, labels)))
+            cur.copy_expert("COPY ground_truth_staging (request_id, actual_class) FROM STDIN WITH (FORMAT csv)", buf)
+            cur.execute("""
+                INSERT INTO ground_truth (request_id, actual_class)
+                SELECT request_id, actual_class FROM ground_truth_staging
+                ON CONFLICT (request_id) DO NOTHING
+            """)
+            labelled += cur.rowcount
+            conn.commit()
+            logger.info(f"Labelled chunk of {len(chunk)} predictions ({labelled} so far)")
+    finally:
+        scan.close()
 
-    # 2. Bulk Insert labels
-    insert_query = "INSERT INTO ground_truth (request_id, actual_class) VALUES %s"
-    execute_values(cur, insert_query, new_labels)
-    
+    set_watermark(cur, WATERMARK_JOB, bounds)
     conn.commit()
-    cur.close()
-    conn.close()
-    logger.info(f"Successfully added {len(new_labels)} ground truth labels.")
+    return labelled
 
 if __name__ == "__main__":
-    simulate_ground_truth()
\ No newline at end of file
+    simulate_ground_truth()
@@ -0,0 +1,110 @@
+# eval/sketch.py - Mergeable KLL quantile sketch
+# Summarises a stream of values in bounded memory (a few hundred floats regardless of
+# stream length) with rank error within 2% at the default size. Two sketches merge into
+# one that summarises both streams, so per-hour sketches can be combined into a day or
+# a week without touching the raw rows again.
+
+import math
+import random
+import numpy as np
+
+DEFAULT_K = 200
+# Normalised rank error stays below ERROR_FACTOR / k with high probability. Calibrated on
+# a week of hourly sketches merged together (the drift job's largest window), where the
+# observed error reached about 3.8 / k; a single unmerged sketch stays nearer 1.7 / k.
+ERROR_FACTOR = 4.0
+
+class KLLSketch:
+    """
+    KLL sketch (Karnin, Lang & Liberty). Items at level h stand for 2**h original values.
+    When a level outgrows its capacity it is sorted and every other item (from a random
+    offset) is promoted to the level above, halving its size.
+    """
+
+    def __init__(self, k: int = DEFAULT_K, c: float = 2 / 3):
+        self.k = k
+        self.c = c
+        self.n = 0
+        self.levels = [np.empty(0)]
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, math.ceil(self.k * self.c ** depth))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+
+    def merge(self, other: "KLLSketch"):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self._compress()
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd item out stays behind at this level
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                paired = items[:len(items) - len(keep)]
+                promoted = paired[random.getrandbits(1)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def _weighted(self):
+        """
+        Retained items in sorted order with their cumulative weights.
+        """
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(v), 2 ** h, dtype=np.float64) for h, v in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], np.cumsum(weights[order])
+
+    def rank_error(self) -> float:
+        """
+        Bound on |estimated cdf - true cdf|. Zero while nothing has been compacted.
+        """
+        return 0.0 if len(self.levels) == 1 else min(1.0, ERROR_FACTOR / self.k)
+
+    def points(self) -> np.ndarray:
+        return np.unique(np.concatenate(self.levels))
+
+    def cdf(self, x, inclusive: bool = True) -> np.ndarray:
+        """
+        Estimated fraction of values <= x (or < x), vectorized over x.
+        """
+        items, cumulative = self._weighted()
+        if not len(items):
+            return np.zeros(np.shape(x))
+        idx = np.searchsorted(items, x, side="right" if inclusive else "left")
+        return np.where(idx > 0, cumulative[np.maximum(idx - 1, 0)], 0.0) / cumulative[-1]
+
+    def quantile(self, q) -> np.ndarray:
+        items, cumulative = self._weighted()
+        if not len(items):
+            return np.full(np.shape(q), np.nan)
+        idx = np.searchsorted(cumulative, np.asarray(q) * cumulative[-1], side="left")
+        return items[np.minimum(idx, len(items) - 1)]
+
+    def to_dict(self) -> dict:
+        return {"k": self.k, "n": self.n, "levels": [v.tolist() for v in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "KLLSketch":
+        sketch = cls(k=data["k"])
+        sketch.n = data["n"]
+        sketch.levels = [np.asarray(v, dtype=np.float64) for v in data["levels"]] or [np.empty(0)]
+        return sketch
@@ -0,0 +1,85 @@
+# tests/test_alerting.py - AlertDispatcher must deduplicate repeats and never block the caller
+
+import time
+from eval.alerting import AlertDispatcher, MemorySink, MAX_MESSAGE_CHARS
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+def test_repeats_within_cooldown_are_suppressed():
+    sink = MemorySink()
+    dispatcher = AlertDispatcher(sink, cooldown_seconds=0.2, digest_seconds=0)
+    dispatcher.start()
+    try:
+        assert dispatcher.alert("drift on income", key="drift:v1")
+        assert not dispatcher.alert("drift on income again", key="drift:v1")
+        assert not dispatcher.alert("drift on debt", key="drift:v1")
+        assert dispatcher.alert("accuracy dropped", key="metrics:v1")
+        wait_until(lambda: dispatcher.queued == 2 and dispatcher.queue_depth() == 0 and sink.messages)
+        sent_before = "\n".join(sink.messages)
+
+        time.sleep(0.25)
+        assert dispatcher.alert("drift on income", key="drift:v1")
+        wait_until(lambda: "repeats suppressed" in sink.messages[-1])
+    finally:
+        dispatcher.stop()
+
+    assert "drift on income" in sent_before and "accuracy dropped" in sent_before
+    assert "again" not in sent_before and "debt" not in sent_before
+    assert "2 repeats suppressed" in sink.messages[-1]
+    assert dispatcher.suppressed == 2
+
+def test_alerts_close_together_go_out_as_one_digest():
+    sink = MemorySink()
+    dispatcher = AlertDispatcher(sink, digest_seconds=0.2)
+    dispatcher.start()
+    try:
+        for i in range(3):
+            dispatcher.alert(f"alert {i}")
+        wait_until(lambda: len(sink.messages) == 1)
+    finally:
+        dispatcher.stop()
+    assert sink.messages[0].startswith("📣 **3 alerts**")
+    assert all(f"alert {i}" in sink.messages[0] for i in range(3))
+
+def test_digest_splits_at_message_limit():
+    dispatcher = AlertDispatcher(MemorySink())
+    messages = dispatcher._digest(["x" * 900 for _ in range(5)])
+    assert len(messages) > 1
+    assert all(len(m) <= MAX_MESSAGE_CHARS for m in messages)
+    assert sum(m.count("x" * 900) for m in messages) == 5
+
+def test_full_queue_drops_instead_of_blocking():
+    dispatcher = AlertDispatcher(MemorySink(), max_queue=1)  # not started: nothing drains the queue
+    assert dispatcher.alert("first")
+    start = time.monotonic()
+    assert not dispatcher.alert("second")
+    assert time.monotonic() - start < 0.1
+    assert dispatcher.dropped == 1
+
+def test_failed_sends_are_retried():
+    class FlakySink:
+        def __init__(self):
+            self.attempts = 0
+            self.messages = []
+
+        def send(self, message):
+            self.attempts += 1
+            if self.attempts < 3:
+                raise ConnectionError("webhook down")
+            self.messages.append(message)
+
+    sink = FlakySink()
+    dispatcher = AlertDispatcher(sink, digest_seconds=0, max_retries=3, backoff_seconds=0.01)
+    dispatcher.start()
+    try:
+        dispatcher.alert("disk full")
+        wait_until(lambda: sink.messages)
+    finally:
+        dispatcher.stop()
+    assert sink.attempts == 3
+    assert (dispatcher.sent, dispatcher.failed) == (1, 0)
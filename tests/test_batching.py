@@ -0,0 +1,67 @@
+# tests/test_batching.py - MicroBatcher must hand every caller its own result, and every error
+
+import asyncio
+import pytest
+from api.batching import MicroBatcher
+
+async def with_batcher(batcher, scenario):
+    task = asyncio.create_task(batcher.run())
+    try:
+        return await scenario()
+    finally:
+        task.cancel()
+
+def submit_all(batcher, items, **kwargs):
+    return lambda: asyncio.gather(*(batcher.submit(i) for i in items), **kwargs)
+
+def test_each_caller_gets_its_own_result_in_order():
+    calls = []
+
+    def score(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher(score, window_ms=20, max_batch_size=8)
+    results = asyncio.run(with_batcher(batcher, submit_all(batcher, range(20))))
+
+    assert results == [i * 10 for i in range(20)]
+    # Concurrent callers share model calls, none bigger than max_batch_size
+    assert [len(batch) for batch in calls] == [8, 8, 4]
+    assert sum(calls, []) == list(range(20))
+    stats = batcher.stats()
+    assert stats["batches"] == 3 and stats["rows"] == 20 and stats["max_seen_batch_size"] == 8
+
+def test_failure_reaches_every_caller_in_the_batch():
+    def score(items):
+        raise RuntimeError("model exploded")
+
+    batcher = MicroBatcher(score, window_ms=20, max_batch_size=8)
+    results = asyncio.run(with_batcher(batcher, submit_all(batcher, range(5), return_exceptions=True)))
+    assert len(results) == 5
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert batcher.stats()["batches"] == 0
+
+def test_batcher_keeps_serving_after_a_failed_batch():
+    def score(items):
+        if 0 in items:
+            raise ValueError("bad row")
+        return items
+
+    async def scenario(batcher):
+        with pytest.raises(ValueError):
+            await batcher.submit(0)
+        return await batcher.submit(7)
+
+    batcher = MicroBatcher(score, window_ms=1, max_batch_size=8)
+    assert asyncio.run(with_batcher(batcher, lambda: scenario(batcher))) == 7
+
+def test_runner_receives_row_count():
+    seen = []
+
+    async def runner(fn, items, rows):
+        seen.append(rows)
+        return fn(items)
+
+    batcher = MicroBatcher(lambda items: items, window_ms=20, max_batch_size=16, runner=runner)
+    asyncio.run(with_batcher(batcher, submit_all(batcher, range(5))))
+    assert seen == [5]
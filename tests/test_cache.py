@@ -0,0 +1,51 @@
+# tests/test_cache.py - PredictionCache must never serve an expired entry or another model's answer
+
+import time
+from api.cache import PredictionCache
+from api.schemas import PredictionRequest
+
+def request(income=52000.0, debt=8000.0, credit_score=700):
+    return PredictionRequest(income=income, debt=debt, credit_score=credit_score)
+
+def test_hit_is_keyed_by_model_version():
+    cache = PredictionCache()
+    cache.put("v1.0.0", request(), (0.8, 1, "v1.0.0"))
+    assert cache.get("v1.0.0", request()) == (0.8, 1, "v1.0.0")
+    assert cache.get("v1.0.1", request()) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_entries_expire_after_ttl():
+    cache = PredictionCache(ttl_seconds=0.05)
+    cache.put("v1.0.0", request(), "cached")
+    assert cache.get("v1.0.0", request()) == "cached"
+    time.sleep(0.06)
+    assert cache.get("v1.0.0", request()) is None
+    assert cache.expirations == 1
+    assert cache.stats()["size"] == 0
+
+def test_clear_invalidates_everything():
+    cache = PredictionCache()
+    cache.put("v1.0.0", request(), "cached")
+    cache.clear()
+    assert cache.get("v1.0.0", request()) is None
+    assert cache.invalidations == 1
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(max_size=2)
+    cache.put("v1.0.0", request(credit_score=600), "a")
+    cache.put("v1.0.0", request(credit_score=700), "b")
+    cache.get("v1.0.0", request(credit_score=600))  # "a" is now the most recent
+    cache.put("v1.0.0", request(credit_score=800), "c")
+    assert cache.get("v1.0.0", request(credit_score=700)) is None
+    assert cache.get("v1.0.0", request(credit_score=600)) == "a"
+    assert cache.evictions == 1
+
+def test_quantized_features_share_an_entry():
+    cache = PredictionCache(income_quantum=100)
+    cache.put("v1.0.0", request(income=52010), "cached")
+    assert cache.get("v1.0.0", request(income=52040)) == "cached"
+    assert cache.get("v1.0.0", request(income=52090)) is None
+    # Without a quantum, keys are exact
+    exact = PredictionCache()
+    exact.put("v1.0.0", request(income=52010), "cached")
+    assert exact.get("v1.0.0", request(income=52040)) is None
@@ -0,0 +1,46 @@
+# tests/test_drift.py - Drift flags must fire on shifted traffic and stay quiet on undrifted traffic
+
+import random
+import numpy as np
+import pandas as pd
+import pytest
+from eval.drift import build_reference_profile, sketch_drift_scores, flag_drift, PSI_MIN_ROWS, PSI_THRESHOLD
+from eval.sketch import KLLSketch
+
+def sample(rng, n, shift=0.0):
+    return pd.DataFrame({
+        "income": rng.normal(55000, 20000, n),
+        "debt": rng.normal(10000, 5000, n),
+        "credit_score": rng.normal(650 + shift, 100, n),
+        "prediction_prob": rng.beta(2, 2, n),
+    })
+
+def sketches(df):
+    result = {}
+    for column in df:
+        result[column] = KLLSketch()
+        result[column].update(df[column].to_numpy())
+    return result
+
+@pytest.fixture(scope="module")
+def profile():
+    return build_reference_profile(sample(np.random.default_rng(0), 20000))
+
+@pytest.mark.parametrize("n", [50, 100, 300, 2000])
+def test_undrifted_sample_does_not_flag(profile, n):
+    random.seed(n)
+    rng = np.random.default_rng(n)
+    flagged = [not flag_drift(sketch_drift_scores(profile, sketches(sample(rng, n)))).empty for _ in range(20)]
+    # Each window flags with probability ~`threshold` at most; 20 windows rarely see more than 3
+    assert sum(flagged) <= 3
+
+def test_small_window_psi_alone_does_not_flag():
+    scores = pd.DataFrame({"n": [50, PSI_MIN_ROWS], "ks_stat": [0.1, 0.1], "p_value": [0.5, 0.5],
+                           "psi": [PSI_THRESHOLD * 2] * 2, "js": [0.1, 0.1]}, index=["debt", "income"])
+    assert list(flag_drift(scores).index) == ["income"]
+
+@pytest.mark.parametrize("n", [300, 2000])
+def test_shifted_feature_flags(profile, n):
+    random.seed(n)
+    scores = sketch_drift_scores(profile, sketches(sample(np.random.default_rng(n), n, shift=60)))
+    assert "credit_score" in flag_drift(scores).index
@@ -0,0 +1,81 @@
+# tests/test_forest.py - CompiledForest must score exactly like the sklearn forest it came from
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from common.forest import (
+    CompiledForest, compile_forest, compile_model, save_forest, load_forest, load_model_artifact,
+    FOREST_EXTENSION,
+)
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    X = np.column_stack([
+        rng.normal(55000, 20000, 2000),
+        rng.normal(10000, 5000, 2000),
+        rng.normal(650, 100, 2000),
+    ])
+    # Noisy labels so the trees grow deep and leaves hold mixed probabilities
+    y = ((X[:, 2] > 600) & (X[:, 1] < 20000)).astype(int)
+    flip = rng.random(len(y)) < 0.2
+    y[flip] = 1 - y[flip]
+    X_new = np.column_stack([
+        rng.normal(55000, 30000, 500),
+        rng.normal(10000, 8000, 500),
+        rng.normal(650, 150, 500),
+    ])
+    return X, y, X_new
+
+@pytest.fixture(scope="module")
+def model(data):
+    X, y, _ = data
+    # n_jobs=1 so sklearn sums the trees in order and results can match bit for bit
+    return RandomForestClassifier(n_estimators=10, max_depth=12, random_state=0, n_jobs=1).fit(X, y)
+
+def test_predict_proba_matches_sklearn_exactly(data, model):
+    X, _, X_new = data
+    compiled = compile_forest(model)
+    for rows in (X, X_new, X_new[:1]):
+        np.testing.assert_array_equal(compiled.predict_proba(rows), model.predict_proba(rows))
+        np.testing.assert_array_equal(compiled.predict(rows), model.predict(rows))
+    np.testing.assert_array_equal(compiled.classes_, model.classes_)
+
+def test_compile_model_falls_back_for_unsupported_models(data):
+    X, y, _ = data
+    model = LogisticRegression().fit(X, y)
+    assert compile_model(model) is model
+
+def test_compile_model_compiles_forest(model):
+    assert isinstance(compile_model(model), CompiledForest)
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_round_trip(tmp_path, data, model, mmap):
+    _, _, X_new = data
+    compiled = compile_forest(model)
+    path = str(tmp_path / f"model_v1.0.0{FOREST_EXTENSION}")
+    save_forest(compiled, path)
+
+    loaded = load_forest(path, mmap=mmap)
+    for name in ("feature", "threshold", "left", "right", "value", "roots", "classes_"):
+        original, restored = getattr(compiled, name), getattr(loaded, name)
+        assert restored.dtype == original.dtype
+        np.testing.assert_array_equal(restored, original)
+    assert loaded.max_depth == compiled.max_depth
+    assert loaded.n_features_in_ == compiled.n_features_in_
+    np.testing.assert_array_equal(loaded.predict_proba(X_new), model.predict_proba(X_new))
+
+def test_load_model_artifact_maps_forest_files(tmp_path, data, model):
+    _, _, X_new = data
+    path = str(tmp_path / f"model_v1.0.0{FOREST_EXTENSION}")
+    save_forest(compile_forest(model), path)
+    loaded = load_model_artifact(path)
+    assert isinstance(loaded, CompiledForest)
+    np.testing.assert_array_equal(loaded.predict_proba(X_new), model.predict_proba(X_new))
+
+def test_load_forest_rejects_other_files(tmp_path):
+    path = tmp_path / "model_v1.0.0.pkl"
+    path.write_bytes(b"not a forest")
+    with pytest.raises(ValueError):
+        load_forest(str(path))
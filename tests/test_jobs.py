@@ -0,0 +1,96 @@
+# tests/test_jobs.py - JobRunner must run the DAG in dependency order and stop at failures
+
+import time
+import threading
+import pytest
+from eval.jobs import JobRunner
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+@pytest.fixture
+def runner():
+    runner = JobRunner(max_workers=4, record_runs=False)
+    yield runner
+    runner.executor.shutdown(wait=True)
+
+def recording(log, name, fail=False, delay=0.0):
+    def fn():
+        time.sleep(delay)
+        log.append(name)
+        if fail:
+            raise RuntimeError(f"{name} failed")
+        return 1
+    return fn
+
+def idle(runner):
+    return all(not s["running"] for s in runner.stats().values())
+
+def test_dependents_run_after_all_their_upstreams(runner):
+    log = []
+    runner.add("label", recording(log, "label"), every=60)
+    runner.add("metrics", recording(log, "metrics", delay=0.05), after=["label"])
+    runner.add("drift", recording(log, "drift"), after=["label"])
+    runner.add("alert", recording(log, "alert"), after=["metrics", "drift"])
+
+    runner._tick()
+    wait_until(lambda: "alert" in log and idle(runner))
+    assert log[0] == "label"
+    assert set(log[1:3]) == {"metrics", "drift"}
+    assert log[3:] == ["alert"]
+    assert all(s["runs"] == 1 for s in runner.stats().values())
+
+def test_failed_job_does_not_trigger_dependents(runner):
+    log = []
+    runner.add("label", recording(log, "label"), every=60)
+    runner.add("metrics", recording(log, "metrics", fail=True), after=["label"])
+    runner.add("drift", recording(log, "drift"), after=["label"])
+    runner.add("alert", recording(log, "alert"), after=["metrics", "drift"])
+    runner.add("report", recording(log, "report"), after=["metrics"])
+
+    runner._tick()
+    wait_until(lambda: {"metrics", "drift"} <= set(log) and idle(runner))
+    time.sleep(0.1)
+    assert "alert" not in log and "report" not in log
+    stats = runner.stats()
+    assert stats["metrics"]["failures"] == 1
+    assert stats["alert"]["runs"] == stats["report"]["runs"] == 0
+
+def test_root_job_still_running_is_skipped(runner):
+    release = threading.Event()
+    runner.add("slow", lambda: release.wait(5), every=0)
+    runner._tick()
+    wait_until(lambda: runner.stats()["slow"]["running"])
+    runner._tick()
+    release.set()
+    wait_until(lambda: idle(runner))
+    assert runner.stats()["slow"]["runs"] == 1
+    assert runner.stats()["slow"]["skipped"] == 1
+
+def test_dependent_triggered_while_running_runs_once_more(runner):
+    release = threading.Event()
+    calls = []
+    runner.add("root", lambda: 1, every=60)
+    runner.add("child", lambda: (calls.append(1), release.wait(5)), after=["root"])
+    runner._tick()
+    wait_until(lambda: runner.stats()["child"]["running"])
+    # Two more upstream successes while the child is busy coalesce into one rerun
+    for _ in range(2):
+        runner.jobs["root"].next_due = 0
+        runner._tick()
+        wait_until(lambda: not runner.stats()["root"]["running"])
+    release.set()
+    wait_until(lambda: len(calls) == 2 and idle(runner))
+    time.sleep(0.1)
+    assert len(calls) == 2
+
+def test_invalid_jobs_rejected(runner):
+    runner.add("root", lambda: 1, every=60)
+    with pytest.raises(ValueError):
+        runner.add("both", lambda: 1, every=60, after=["root"])
+    with pytest.raises(ValueError):
+        runner.add("orphan", lambda: 1, after=["missing"])
@@ -0,0 +1,89 @@
+# tests/test_labels.py - LabelIngestor parsing, and unknown-id screening against Postgres
+
+import os
+import uuid
+import json
+import pytest
+from common.labels import LabelIngestor
+
+class OfflineConn:
+    """
+    Just enough of a connection for LabelIngestor to parse without flushing.
+    """
+    class Cursor:
+        def execute(self, *args):
+            pass
+
+        def close(self):
+            pass
+
+    def cursor(self):
+        return self.Cursor()
+
+    def commit(self):
+        pass
+
+def parsed(ingestor):
+    return [tuple(line.split(",")) for line in ingestor._buf.getvalue().splitlines()]
+
+def test_ndjson_lines_are_parsed_and_bad_ones_counted():
+    good = str(uuid.uuid4())
+    ingestor = LabelIngestor(OfflineConn(), fmt="ndjson", chunk_size=1000)
+    ingestor.feed([
+        json.dumps({"request_id": good, "actual_class": 1}) + "\n",
+        "\n",
+        json.dumps({"request_id": good.upper(), "actual_class": "0"}),
+        json.dumps({"request_id": "not-a-uuid", "actual_class": 1}),
+        json.dumps({"request_id": good, "actual_class": 2}),
+        json.dumps({"request_id": good}),
+        "{broken",
+    ])
+    assert parsed(ingestor) == [(good, "1"), (good, "0")]
+    assert ingestor.lines == 2
+    assert ingestor.invalid == 4
+    assert [s.split(":")[0] for s in ingestor.invalid_sample] == ["line 4", "line 5", "line 6", "line 7"]
+
+def test_csv_columns_are_found_by_header():
+    a, b = str(uuid.uuid4()), str(uuid.uuid4())
+    ingestor = LabelIngestor(OfflineConn(), fmt="csv", chunk_size=1000)
+    ingestor.feed(["source,actual_class,request_id\r\n", f"crm,1,{a}\r\n", f"crm,0,{b}\n", "crm,1\n"])
+    assert parsed(ingestor) == [(a, "1"), (b, "0")]
+    assert ingestor.invalid == 1
+
+def test_csv_without_required_header_fails_fast():
+    ingestor = LabelIngestor(OfflineConn(), fmt="csv")
+    with pytest.raises(ValueError, match="request_id and actual_class"):
+        ingestor.feed(["id,label\n", f"{uuid.uuid4()},1\n"])
+
+def test_unknown_format_rejected():
+    with pytest.raises(ValueError):
+        LabelIngestor(OfflineConn(), fmt="xml")
+
+@pytest.mark.skipif(not os.getenv("DATABASE_URL"), reason="needs DATABASE_URL")
+def test_unknown_ids_screened_and_existing_labels_kept():
+    from common.db import get_conn
+    known, labelled, unknown = (str(uuid.uuid4()) for _ in range(3))
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO predictions (request_id, model_version, input_data, prediction_prob, prediction_class, latency_ms)
+            SELECT id::uuid, 'labels-test', '{}', 0.5, 1, 1.0 FROM unnest(%s::text[]) AS id
+        """, ([known, labelled],))
+        cur.execute("INSERT INTO ground_truth (request_id, actual_class) VALUES (%s, 0)", (labelled,))
+        conn.commit()
+        try:
+            ingestor = LabelIngestor(conn, chunk_size=2)
+            ingestor.feed(json.dumps({"request_id": r, "actual_class": 1}) for r in (known, labelled, unknown, known))
+            report = ingestor.finish()
+            cur.execute("SELECT request_id::text, actual_class FROM ground_truth WHERE request_id = ANY(%s::uuid[])",
+                        ([known, labelled, unknown],))
+            stored = dict(cur.fetchall())
+        finally:
+            conn.rollback()
+            cur.execute("DELETE FROM ground_truth WHERE request_id = ANY(%s::uuid[])", ([known, labelled],))
+            cur.execute("DELETE FROM predictions WHERE model_version = 'labels-test'")
+            conn.commit()
+
+    assert stored == {known: 1, labelled: 0}
+    assert (report["inserted"], report["skipped"], report["unknown"]) == (1, 2, 1)
+    assert report["unknown_sample"] == [unknown]
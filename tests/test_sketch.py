@@ -0,0 +1,75 @@
+# tests/test_sketch.py - KLLSketch must stay within its rank error bound, alone and merged
+
+import random
+import numpy as np
+import pytest
+from eval.sketch import KLLSketch
+
+def max_rank_error(sketch, values):
+    """
+    Largest |estimated cdf - true cdf| over the sketch's own breakpoints and a grid.
+    """
+    values = np.sort(values)
+    points = np.union1d(sketch.points(), np.quantile(values, np.linspace(0, 1, 201)))
+    true_cdf = np.searchsorted(values, points, side="right") / len(values)
+    return np.abs(sketch.cdf(points) - true_cdf).max()
+
+@pytest.fixture(autouse=True)
+def seeded():
+    random.seed(0)
+
+def test_exact_until_first_compaction():
+    values = np.random.default_rng(0).normal(size=150)
+    sketch = KLLSketch(k=200)
+    sketch.update(values)
+    assert sketch.rank_error() == 0.0
+    assert max_rank_error(sketch, values) == 0.0
+    np.testing.assert_array_equal(sketch.points(), np.unique(values))
+
+@pytest.mark.parametrize("n", [1000, 100000])
+def test_single_sketch_within_bound(n):
+    values = np.random.default_rng(n).lognormal(size=n)
+    sketch = KLLSketch()
+    # Fed in uneven chunks, as the drift job does
+    for chunk in np.array_split(values, 7):
+        sketch.update(chunk)
+    assert sketch.n == n
+    assert 0 < sketch.rank_error() < 1
+    assert max_rank_error(sketch, values) <= sketch.rank_error()
+    # Memory stays bounded however long the stream
+    assert sum(len(level) for level in sketch.levels) < 10 * sketch.k
+
+def test_merged_week_within_bound():
+    # A week of hourly sketches merged, the drift job's largest window
+    rng = np.random.default_rng(1)
+    hours = [rng.normal(size=3000) for _ in range(168)]
+    merged = KLLSketch()
+    for values in hours:
+        hourly = KLLSketch()
+        hourly.update(values)
+        merged.merge(hourly)
+    everything = np.concatenate(hours)
+    assert merged.n == len(everything)
+    assert max_rank_error(merged, everything) <= merged.rank_error()
+
+def test_quantile_matches_cdf():
+    values = np.random.default_rng(2).uniform(size=50000)
+    sketch = KLLSketch()
+    sketch.update(values)
+    q = sketch.quantile(np.array([0.1, 0.5, 0.9]))
+    np.testing.assert_allclose(q, [0.1, 0.5, 0.9], atol=sketch.rank_error())
+
+def test_nan_ignored_and_empty_sketch():
+    sketch = KLLSketch()
+    sketch.update([np.nan, np.nan])
+    assert sketch.n == 0
+    assert sketch.cdf([0.0]).tolist() == [0.0]
+    assert np.isnan(sketch.quantile(0.5))
+
+def test_dict_round_trip():
+    sketch = KLLSketch(k=50)
+    sketch.update(np.random.default_rng(3).normal(size=5000))
+    restored = KLLSketch.from_dict(sketch.to_dict())
+    assert (restored.k, restored.n) == (sketch.k, sketch.n)
+    points = sketch.points()
+    np.testing.assert_array_equal(restored.cdf(points), sketch.cdf(points))